@@ -0,0 +1,389 @@
+# vim:ff=unix ts=4 sw=4 expandtab
+
+"""Benchmarks for GpgUtils operations against a throwaway keyring.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_gpg_utils --quick -o before.json
+    python -m benchmarks.bench_gpg_utils -o after.json --compare before.json
+
+Everything runs in a temporary GNUPGHOME so your own keyring and agent are
+never touched. Results are written as JSON so runs from different commits
+can be compared with --compare.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from ez_gpg.gpg_utils import GpgUtils
+
+PASSPHRASE = 'benchmark'
+
+DEFAULT_SIZES = '1K,1M,64M'
+QUICK_SIZES = '1K,1M'
+DEFAULT_KEY_COUNTS = '100,1000,10000'
+QUICK_KEY_COUNTS = '100'
+
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+WRITE_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Key listing keys are generated in batches by one gpg run each
+KEY_BATCH_SIZE = 500
+
+
+def parse_size(text):
+    text = text.strip().upper().rstrip('B')
+    multiplier = SIZE_UNITS.get(text[-1:], 1)
+    if text[-1:] in SIZE_UNITS:
+        text = text[:-1]
+
+    return int(float(text) * multiplier)
+
+
+def format_size(size):
+    for unit in ('G', 'M', 'K'):
+        if size >= SIZE_UNITS[unit] and size % SIZE_UNITS[unit] == 0:
+            return f"{size // SIZE_UNITS[unit]}{unit}"
+
+    return str(size)
+
+
+def measure(func, repeat, setup=None):
+    """Returns the latencies (in seconds) of `repeat` calls to func."""
+    latencies = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+
+        start_time = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start_time)
+
+    return latencies
+
+
+class BenchmarkRun:
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def run(self, name, func, params=None, size=None, repeat=None, setup=None):
+        latencies = measure(func, repeat or self.repeat, setup)
+
+        result = {
+            'name': name,
+            'params': params or {},
+            'repeat': len(latencies),
+            'latency': {
+                'min': min(latencies),
+                'median': statistics.median(latencies),
+                'mean': statistics.mean(latencies),
+                'max': max(latencies),
+            },
+        }
+        if size is not None:
+            result['size'] = size
+            result['throughput'] = size / result['latency']['median']
+
+        self.results.append(result)
+
+        text = f"{name:<28} {json.dumps(params or {}, sort_keys=True):<40} " \
+               f"median {result['latency']['median'] * 1000:10.2f} ms"
+        if size is not None:
+            text += f"  {result['throughput'] / SIZE_UNITS['M']:9.1f} MiB/s"
+        print(text, file=sys.stderr)
+
+        return result
+
+
+def get_key_id(name):
+    return f"{name}@benchmark.invalid"
+
+
+def create_keys(rsa_bits):
+    keys = {}
+
+    fingerprint = GpgUtils.create_key('Bench RSA', get_key_id('rsa'), PASSPHRASE,
+                                      key_type='RSA', key_length=rsa_bits)
+    keys[f"rsa{rsa_bits}"] = fingerprint
+
+    fingerprint = GpgUtils.create_key('Bench ECC', get_key_id('ecc'), PASSPHRASE,
+                                      key_type='EDDSA', key_curve='ed25519')
+    keys['ed25519'] = fingerprint
+
+    if not all(keys.values()):
+        raise SystemExit(f"Key generation failed: {keys}")
+
+    return keys
+
+
+def add_listing_keys(gnupg_home, first, count):
+    # create_key() would spawn a gpg per key, which takes hours for 10k keys
+    for batch_start in range(first, first + count, KEY_BATCH_SIZE):
+        batch_end = min(first + count, batch_start + KEY_BATCH_SIZE)
+        params = ''.join(f"Key-Type: EDDSA\n"
+                         f"Key-Curve: ed25519\n"
+                         f"Name-Real: Listing {index}\n"
+                         f"Name-Email: listing{index}@benchmark.invalid\n"
+                         f"%no-protection\n"
+                         f"%commit\n"
+                         for index in range(batch_start, batch_end))
+
+        subprocess.run([GpgUtils.get_gpg_binary(), '--homedir', gnupg_home, '--batch',
+                        '--gen-key'],
+                       input=params.encode('utf-8'),
+                       stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL,
+                       check=True)
+
+    GpgUtils.invalidate_key_cache()
+
+
+def write_data_file(filename, size):
+    # Random data is the worst case for gpg's compression
+    with open(filename, 'wb') as data_file:
+        remaining = size
+        while remaining > 0:
+            chunk_size = min(remaining, WRITE_CHUNK_SIZE)
+            data_file.write(os.urandom(chunk_size))
+            remaining -= chunk_size
+
+
+def bench_key_listing(benchmark, gnupg_home, keys, key_counts):
+    key_count = len(GpgUtils.get_gpg_keys())
+    for target_count in key_counts:
+        if target_count > key_count:
+            print(f"Generating {target_count - key_count} keys...", file=sys.stderr)
+            add_listing_keys(gnupg_home, key_count, target_count - key_count)
+            key_count = target_count
+
+        params = {'keys': key_count}
+        benchmark.run('get_gpg_keys.cold', lambda: GpgUtils.get_gpg_keys(), params,
+                      setup=GpgUtils.invalidate_key_cache)
+        benchmark.run('get_gpg_keys.cached', lambda: GpgUtils.get_gpg_keys(), params)
+        benchmark.run('get_key_index.lookup',
+                      lambda: GpgUtils.get_key_index().find_recipients([keys['ed25519']]),
+                      params)
+
+
+def bench_key_password(benchmark, gnupg_home, keys):
+    def forget_passphrases():
+        # gpg-agent drops every cached passphrase on reload, so each round
+        # pays for the full unlock
+        GpgUtils.invalidate_keyring()
+        subprocess.run([GpgUtils.get_gpgconf_binary(), '--homedir', gnupg_home,
+                        '--reload', 'gpg-agent'],
+                       check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    for key_name, fingerprint in keys.items():
+        params = {'key': key_name}
+        benchmark.run('check_key_password.cold',
+                      lambda: GpgUtils.check_key_password(fingerprint, PASSPHRASE),
+                      params,
+                      setup=forget_passphrases)
+        benchmark.run('check_key_password.cached',
+                      lambda: GpgUtils.check_key_password(fingerprint, PASSPHRASE),
+                      params)
+
+
+def bench_files(benchmark, work_dir, keys, sizes):
+    for size in sizes:
+        filename = os.path.join(work_dir, f"data-{format_size(size)}.bin")
+        print(f"Writing {format_size(size)} test file...", file=sys.stderr)
+        write_data_file(filename, size)
+
+        # Big files get fewer rounds so that a 4G run still finishes
+        repeat = benchmark.repeat if size < SIZE_UNITS['G'] else 1
+
+        for key_name, fingerprint in keys.items():
+            params = {'size': format_size(size), 'key': key_name}
+
+            benchmark.run('encrypt.pki',
+                          lambda: GpgUtils.encrypt_files_pki([filename], [fingerprint],
+                                                             use_armor=False, jobs=1),
+                          params, size, repeat)
+            benchmark.run('get_encryped_file_info',
+                          lambda: GpgUtils.get_encryped_file_info(f"{filename}.gpg"),
+                          params)
+            benchmark.run('decrypt.pki',
+                          lambda: GpgUtils.decrypt_file(f"{filename}.gpg", PASSPHRASE),
+                          params, size, repeat)
+
+            benchmark.run('sign',
+                          lambda: GpgUtils.sign_file(filename, fingerprint, PASSPHRASE),
+                          params, size, repeat)
+            benchmark.run('verify',
+                          lambda: GpgUtils.verify_file(filename, f"{filename}.sig"),
+                          params, size, repeat)
+
+        params = {'size': format_size(size)}
+        benchmark.run('encrypt.symmetric',
+                      lambda: GpgUtils.encrypt_files_symmetric([filename], PASSPHRASE,
+                                                               use_armor=False, jobs=1),
+                      params, size, repeat)
+        benchmark.run('decrypt.symmetric',
+                      lambda: GpgUtils.decrypt_file(f"{filename}.gpg", PASSPHRASE),
+                      params, size, repeat)
+
+        for suffix in ('', '.gpg', '.sig'):
+            os.remove(f"{filename}{suffix}")
+
+
+def get_metadata():
+    metadata = {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'gpg': None,
+        'commit': None,
+    }
+
+    try:
+        version = subprocess.run([GpgUtils.get_gpg_binary(), '--version'],
+                                 stdout=subprocess.PIPE, check=True)
+        metadata['gpg'] = version.stdout.decode('utf-8', 'replace').splitlines()[0]
+    except (OSError, subprocess.CalledProcessError):
+        pass
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'],
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                check=True)
+        metadata['commit'] = commit.stdout.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+
+    return metadata
+
+
+def get_result_key(result):
+    return result['name'], json.dumps(result['params'], sort_keys=True)
+
+
+def compare(baseline, current, threshold):
+    """Print median latency changes and return the regressions."""
+    baseline_results = {get_result_key(result): result for result in baseline['results']}
+
+    regressions = []
+    for result in current['results']:
+        base_result = baseline_results.get(get_result_key(result))
+        if not base_result:
+            continue
+
+        base_median = base_result['latency']['median']
+        median = result['latency']['median']
+        change = (median - base_median) / base_median if base_median else 0.0
+
+        marker = ''
+        if change > threshold:
+            marker = '  REGRESSION'
+            regressions.append(result)
+
+        print(f"{result['name']:<28} {get_result_key(result)[1]:<40} "
+              f"{base_median * 1000:10.2f} -> {median * 1000:10.2f} ms "
+              f"({change:+.1%}){marker}")
+
+    return regressions
+
+
+def run_benchmarks(args):
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+    key_counts = sorted(int(count) for count in args.key_counts.split(','))
+
+    work_dir = tempfile.mkdtemp(prefix='ezgpg-bench-')
+    gnupg_home = os.path.join(work_dir, 'gnupg')
+    os.mkdir(gnupg_home, 0o700)
+
+    previous_home = os.environ.get('GNUPGHOME')
+    os.environ['GNUPGHOME'] = gnupg_home
+    GpgUtils.invalidate_keyring()
+
+    benchmark = BenchmarkRun(args.repeat)
+    try:
+        print("Creating keys...", file=sys.stderr)
+        keys = create_keys(args.rsa_bits)
+
+        bench_key_password(benchmark, gnupg_home, keys)
+        bench_files(benchmark, work_dir, keys, sizes)
+        bench_key_listing(benchmark, gnupg_home, keys, key_counts)
+    finally:
+        subprocess.run([GpgUtils.get_gpgconf_binary(), '--homedir', gnupg_home,
+                        '--kill', 'gpg-agent'],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        if previous_home is None:
+            del os.environ['GNUPGHOME']
+        else:
+            os.environ['GNUPGHOME'] = previous_home
+        GpgUtils.invalidate_keyring()
+
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {'meta': get_metadata(), 'results': benchmark.results}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark GpgUtils against a throwaway "
+                                                 "keyring and print the results as JSON")
+    parser.add_argument('-o', '--output', help="Write the JSON results here instead of stdout")
+    parser.add_argument('--sizes',
+                        help=f"Comma separated file sizes (default: {DEFAULT_SIZES}, "
+                             f"e.g. 1K,1M,1G,4G)")
+    parser.add_argument('--key-counts',
+                        help=f"Keyring sizes for key listing (default: {DEFAULT_KEY_COUNTS})")
+    parser.add_argument('--repeat', type=int, default=5, help="Rounds per benchmark")
+    parser.add_argument('--rsa-bits', type=int, default=3072, help="RSA key length")
+    parser.add_argument('--quick', action='store_true',
+                        help=f"Small run: sizes {QUICK_SIZES}, key counts {QUICK_KEY_COUNTS}")
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help="Compare against an earlier JSON result file")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Median slowdown counted as a regression (default: 0.1 = 10%%)")
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    args.sizes = args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES)
+    args.key_counts = args.key_counts or (QUICK_KEY_COUNTS if args.quick else DEFAULT_KEY_COUNTS)
+
+    # GpgUtils prints progress; keep stdout for the JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_benchmarks(args)
+
+    report_json = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(report_json + '\n')
+    else:
+        print(report_json)
+
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+
+        with contextlib.redirect_stdout(sys.stderr):
+            regressions = compare(baseline, report, args.threshold)
+
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
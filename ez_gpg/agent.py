@@ -0,0 +1,244 @@
+# vim:ff=unix ts=4 sw=4 expandtab
+
+"""Minimal gpg-agent client speaking the Assuan protocol over its socket.
+
+Presetting a passphrase lets every gpg process in a batch use the unlocked
+key without being handed the passphrase again. The agent only accepts it
+when `allow-preset-passphrase` is set in gpg-agent.conf; callers fall back
+to loopback passphrases otherwise.
+"""
+
+import collections
+import os
+import socket
+import subprocess
+import threading
+
+MAX_LINE_LENGTH = 1000
+
+GPG_ERR_NOT_IMPLEMENTED = 69
+
+# Seconds a preset passphrase outlives a session that never gets cleared: a
+# few minutes, plus the batch's bytes at a pessimistic gpg throughput
+PRESET_TTL = 300
+PRESET_MIN_THROUGHPUT = 1024 * 1024
+
+# Keygrips some AgentSession currently holds unlocked, with a count per session
+_SESSION_KEYGRIPS = collections.Counter()
+_SESSION_LOCK = threading.Lock()
+
+
+class AssuanError(RuntimeError):
+    def __init__(self, code, message):
+        super().__init__(f"gpg-agent error {code}: {message}")
+        self.code = code
+        self.message = message
+
+
+def percent_unescape(data):
+    result = bytearray()
+    index = 0
+    while index < len(data):
+        if data[index:index + 1] == b'%' and index + 2 < len(data):
+            result += bytes.fromhex(data[index + 1:index + 3].decode('ascii'))
+            index += 3
+        else:
+            result += data[index:index + 1]
+            index += 1
+
+    return bytes(result)
+
+
+def get_preset_ttl(batch_size=0):
+    return PRESET_TTL + int(batch_size) // PRESET_MIN_THROUGHPUT
+
+
+def get_agent_socket(gpgconf_binary='gpgconf', homedir=None):
+    """Path of the agent socket, starting the agent if needed."""
+    env = dict(os.environ)
+    if homedir:
+        env['GNUPGHOME'] = homedir
+
+    subprocess.run([gpgconf_binary, '--launch', 'gpg-agent'],
+                   env=env, check=False,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    socket_path = subprocess.check_output([gpgconf_binary, '--list-dirs', 'agent-socket'],
+                                          env=env, universal_newlines=True)
+    return socket_path.strip()
+
+
+class AgentConnection:
+    """One Assuan connection to gpg-agent. Commands are serialized."""
+
+    def __init__(self, socket_path, timeout=10):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._lock = threading.Lock()
+        try:
+            self._socket.connect(socket_path)
+            self._file = self._socket.makefile('rb')
+            self._read_response()
+        except Exception:
+            self._socket.close()
+            raise
+
+    def _read_response(self):
+        data = b''
+        status = []
+        while True:
+            line = self._file.readline()
+            if not line:
+                raise AssuanError(None, "Connection closed by gpg-agent")
+
+            line = line.rstrip(b'\r\n')
+            if line == b'OK' or line.startswith(b'OK '):
+                return data, status
+
+            if line.startswith(b'ERR '):
+                code, _, message = line[4:].decode('utf-8', 'replace').partition(' ')
+                raise AssuanError(int(code), message)
+
+            if line.startswith(b'D '):
+                data += percent_unescape(line[2:])
+            elif line.startswith(b'S '):
+                status.append(line[2:].decode('utf-8', 'replace'))
+            elif line.startswith(b'INQUIRE '):
+                # Nothing we send asks for more data
+                self._send_line('CAN')
+            # Anything else is a comment
+
+    def _send_line(self, line):
+        encoded = line.encode('utf-8')
+        if len(encoded) > MAX_LINE_LENGTH:
+            raise ValueError("Assuan command is too long")
+
+        self._socket.sendall(encoded + b'\n')
+
+    def transact(self, command):
+        """Send a command and return (data, status lines). Raises AssuanError."""
+        with self._lock:
+            self._send_line(command)
+            return self._read_response()
+
+    def close(self):
+        try:
+            with self._lock:
+                self._send_line('BYE')
+        except OSError:
+            pass
+        finally:
+            self._file.close()
+            self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class AgentSession:
+    """Keeps a key unlocked in gpg-agent for the duration of a batch.
+
+    Usable as a context manager: the passphrase is preset for every keygrip
+    of the key on entry and cleared on exit. If the agent refuses (or can't
+    be reached), `passphrase` stays set so callers keep passing it to gpg
+    with loopback pinentry; otherwise it is None and gpg gets the key from
+    the agent.
+
+    The agent drops the passphrase by itself after `ttl` seconds in case
+    the session is never cleared. gpg-agent 2.2 can only keep it forever;
+    then clearing on exit is all there is.
+    """
+
+    def __init__(self, keygrips, passphrase, socket_resolver=get_agent_socket, ttl=PRESET_TTL):
+        self.keygrips = [keygrip for keygrip in keygrips if keygrip]
+        self.passphrase = passphrase
+        self.ttl = ttl
+        self.is_preset = False
+
+        self._socket_resolver = socket_resolver
+        self._preset_keygrips = []
+
+    def preset(self):
+        if self.passphrase is None or not self.keygrips:
+            return False
+
+        hex_passphrase = self.passphrase.encode('utf-8').hex().upper()
+        try:
+            with AgentConnection(self._socket_resolver()) as agent:
+                for keygrip in self.keygrips:
+                    self._preset(agent, keygrip, hex_passphrase)
+                    self._preset_keygrips.append(keygrip)
+        except (AssuanError, OSError, subprocess.SubprocessError) as error:
+            print(f"Could not preset passphrase in gpg-agent: {error}")
+            self.clear()
+            return False
+
+        with _SESSION_LOCK:
+            _SESSION_KEYGRIPS.update(self._preset_keygrips)
+
+        self.is_preset = True
+        self.passphrase = None
+        return True
+
+    def _preset(self, agent, keygrip, hex_passphrase):
+        try:
+            agent.transact(f"PRESET_PASSPHRASE {keygrip} {self.ttl} {hex_passphrase}")
+        except AssuanError as error:
+            if self.ttl == -1 or (error.code or 0) & 0xFFFF != GPG_ERR_NOT_IMPLEMENTED:
+                raise
+
+            print("gpg-agent can't expire preset passphrases, clearing it after the batch")
+            self.ttl = -1
+            agent.transact(f"PRESET_PASSPHRASE {keygrip} -1 {hex_passphrase}")
+
+    def clear(self):
+        if not self._preset_keygrips:
+            return
+
+        if self.is_preset:
+            with _SESSION_LOCK:
+                _SESSION_KEYGRIPS.subtract(self._preset_keygrips)
+                for keygrip in self._preset_keygrips:
+                    if _SESSION_KEYGRIPS[keygrip] <= 0:
+                        del _SESSION_KEYGRIPS[keygrip]
+
+        try:
+            clear_passphrases(self._preset_keygrips, self._socket_resolver)
+        finally:
+            self._preset_keygrips = []
+            self.is_preset = False
+
+    def __enter__(self):
+        self.preset()
+        return self
+
+    def __exit__(self, *args):
+        self.clear()
+
+
+def clear_passphrases(keygrips, socket_resolver=get_agent_socket):
+    """Make gpg-agent forget the passphrases it has cached for keygrips.
+
+    Keygrips another AgentSession still holds unlocked are left alone.
+    Returns True only if none of the keygrips can still be cached.
+    """
+    keygrips = [keygrip for keygrip in keygrips if keygrip]
+    with _SESSION_LOCK:
+        held = [keygrip for keygrip in keygrips if _SESSION_KEYGRIPS[keygrip] > 0]
+
+    keygrips = [keygrip for keygrip in keygrips if keygrip not in held]
+    if not keygrips:
+        return not held
+
+    try:
+        with AgentConnection(socket_resolver()) as agent:
+            for keygrip in keygrips:
+                agent.transact(f"CLEAR_PASSPHRASE --mode=normal {keygrip}")
+    except (AssuanError, OSError, subprocess.SubprocessError) as error:
+        print(f"Could not clear passphrase from gpg-agent: {error}")
+        return False
+
+    return not held
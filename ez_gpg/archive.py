@@ -0,0 +1,205 @@
+# vim:ff=unix ts=4 sw=4 expandtab
+
+"""Folder archives streamed as tar straight into (and out of) gpg.
+
+Nothing here touches the disk besides the files being archived or
+extracted: the tar stream is written into a pipe that gpg reads from and
+extraction reads from a pipe that gpg writes to.
+"""
+
+import gzip
+import os
+import tarfile
+
+from .packets import PrefixedReader
+
+try:
+    import zstandard    # Optional, pip install zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_NONE = 'none'
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+
+ARCHIVE_SUFFIXES = {
+    COMPRESSION_NONE: '.tar',
+    COMPRESSION_GZIP: '.tar.gz',
+    COMPRESSION_ZSTD: '.tar.zst',
+}
+ENCRYPTED_SUFFIX = '.gpg'
+
+# Cheap levels: the archive usually ends up bottlenecked on gpg anyway
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+TAR_BUFFER_SIZE = 1024 * 1024
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def get_compressions():
+    compressions = [COMPRESSION_NONE, COMPRESSION_GZIP]
+    if zstandard is not None:
+        compressions.append(COMPRESSION_ZSTD)
+
+    return compressions
+
+
+def _check_compression(compression):
+    if compression not in ARCHIVE_SUFFIXES:
+        raise ArchiveError(f"Unknown archive compression: {compression}")
+
+    if compression == COMPRESSION_ZSTD and zstandard is None:
+        raise ArchiveError("zstd compression needs the 'zstandard' module")
+
+
+def get_archive_filename(folder, compression=COMPRESSION_GZIP):
+    folder = os.path.normpath(folder)
+    return folder + ARCHIVE_SUFFIXES[compression] + ENCRYPTED_SUFFIX
+
+
+def is_encrypted_archive(filename):
+    return any(filename.endswith(suffix + ENCRYPTED_SUFFIX)
+               for suffix in ARCHIVE_SUFFIXES.values())
+
+
+class _NonClosingWriter:
+    # Compressors close their target when they are closed, but the pipe
+    # belongs to the caller
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, data):
+        return self._stream.write(data)
+
+    def flush(self):
+        pass
+
+
+def _read_prefix(stream, size):
+    prefix = b''
+    while len(prefix) < size:
+        data = stream.read(size - len(prefix))
+        if not data:
+            break
+        prefix += data
+
+    return prefix
+
+
+def write_archive(folder, stream, compression=COMPRESSION_GZIP, is_cancelled=None):
+    """Write folder as a tar stream into a writable file object.
+
+    Members are stored under the folder's own name so that extracting
+    recreates it. Returns the number of files written.
+    """
+    _check_compression(compression)
+
+    folder = os.path.normpath(folder)
+    if not os.path.isdir(folder):
+        raise ArchiveError(f"Not a folder: {folder}")
+
+    target = _NonClosingWriter(stream)
+    if compression == COMPRESSION_GZIP:
+        target = gzip.GzipFile(fileobj=target, mode='wb', compresslevel=GZIP_LEVEL, mtime=0)
+    elif compression == COMPRESSION_ZSTD:
+        target = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(target)
+
+    base_dir = os.path.dirname(os.path.abspath(folder))
+    file_count = 0
+    try:
+        with tarfile.open(fileobj=target, mode='w|', bufsize=TAR_BUFFER_SIZE,
+                          format=tarfile.PAX_FORMAT) as archive:
+            for root, dirs, files in os.walk(folder):
+                dirs.sort()
+                archive.add(root, arcname=os.path.relpath(root, base_dir), recursive=False)
+
+                # os.walk() doesn't descend into symlinked folders, store the links
+                links = [name for name in dirs if os.path.islink(os.path.join(root, name))]
+                for filename in sorted(files + links):
+                    if is_cancelled is not None and is_cancelled():
+                        return file_count
+
+                    path = os.path.join(root, filename)
+                    archive.add(path, arcname=os.path.relpath(path, base_dir), recursive=False)
+                    file_count += 1
+    finally:
+        if target is not stream and hasattr(target, 'close'):
+            target.close()
+
+    return file_count
+
+
+def _is_safe_member(member, dest_dir):
+    # Backstop for Pythons without tarfile extraction filters
+    dest_dir = os.path.realpath(dest_dir)
+    target = os.path.realpath(os.path.join(dest_dir, member.name))
+    if os.path.commonpath([dest_dir, target]) != dest_dir:
+        return False
+
+    if member.issym() or member.islnk():
+        link_target = os.path.join(os.path.dirname(target), member.linkname)
+        if member.islnk():
+            link_target = os.path.join(dest_dir, member.linkname)
+        if os.path.commonpath([dest_dir, os.path.realpath(link_target)]) != dest_dir:
+            return False
+
+    return member.isreg() or member.isdir() or member.issym() or member.islnk()
+
+
+def extract_archive(stream, dest_dir):
+    """Extract a (possibly compressed) tar stream into dest_dir.
+
+    Members that would land outside dest_dir are refused. Returns the
+    number of files extracted.
+    """
+    prefix = _read_prefix(stream, len(ZSTD_MAGIC))
+    stream = PrefixedReader(prefix, stream)
+
+    if prefix.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise ArchiveError("zstd archives need the 'zstandard' module")
+        stream = zstandard.ZstdDecompressor().stream_reader(stream)
+
+    counts = {'files': 0}
+
+    def get_members(archive):
+        for member in archive:
+            if not hasattr(tarfile, 'data_filter') and not _is_safe_member(member, dest_dir):
+                raise ArchiveError(f"Refusing to extract {member.name}")
+
+            if member.isreg():
+                counts['files'] += 1
+            yield member
+
+    # 'r|*' takes care of gzip (and bzip2/xz archives made elsewhere)
+    try:
+        with tarfile.open(fileobj=stream, mode='r|*', bufsize=TAR_BUFFER_SIZE) as archive:
+            if hasattr(tarfile, 'data_filter'):
+                archive.extractall(dest_dir, members=get_members(archive), filter='data')
+            else:
+                archive.extractall(dest_dir, members=get_members(archive))
+    except tarfile.TarError as error:
+        raise ArchiveError(f"Invalid archive: {error}")
+
+    return counts['files']
+
+
+def move_extracted(staging_dir, dest_dir):
+    """Move everything extracted into staging_dir over to dest_dir.
+
+    Nothing is moved (and ArchiveError is raised) if any of it would
+    replace something already in dest_dir.
+    """
+    names = sorted(os.listdir(staging_dir))
+    existing = [name for name in names if os.path.lexists(os.path.join(dest_dir, name))]
+    if existing:
+        raise ArchiveError(f"Already exists in {dest_dir}: {', '.join(existing)}")
+
+    for name in names:
+        os.replace(os.path.join(staging_dir, name), os.path.join(dest_dir, name))
@@ -0,0 +1,556 @@
+# vim:ff=unix ts=4 sw=4 expandtab
+
+"""Headless command line interface.
+
+Nothing in here (or in what it imports) may pull in Gtk since this is what
+runs on servers and in cron jobs without a display.
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+
+from .archive import COMPRESSION_GZIP, get_compressions
+from .compression import ALGORITHMS, CompressionPolicy
+from .config import Config
+from .gpg_utils import GpgUtils
+from .keyserver import DEFAULT_JOBS as KEYSERVER_JOBS, DEFAULT_RATE as KEYSERVER_RATE, \
+    DEFAULT_TIMEOUT as KEYSERVER_TIMEOUT, KeyserverError
+from .paths import expand_paths
+from .results import FileResult
+
+COMMANDS = ('encrypt', 'decrypt', 'sign', 'verify', 'import', 'export', 'search', 'fetch',
+            'refresh', 'keys')
+
+PASSPHRASE_ENV = 'EZGPG_PASSPHRASE'
+
+# Path that means stdin/stdout
+STDIO_PATH = '-'
+
+
+def is_cli_invocation(argv):
+    return len(argv) > 0 and argv[0] in COMMANDS + ('-h', '--help')
+
+
+def read_passphrase(args):
+    if args.passphrase_file == '-':
+        return sys.stdin.readline().rstrip('\n')
+
+    if args.passphrase_file:
+        with open(args.passphrase_file, 'r') as passphrase_file:
+            return passphrase_file.readline().rstrip('\n')
+
+    return os.environ.get(PASSPHRASE_ENV)
+
+
+def _print_json(record, output):
+    output.write(json.dumps(record, sort_keys=True) + '\n')
+    output.flush()
+
+
+def _report(operation, results, output):
+    for result in results:
+        record = result.to_dict()
+        record['operation'] = operation
+        _print_json(record, output)
+
+    return 0 if all(results) else 1
+
+
+class ProgressLine:
+    """Keeps a single line on stderr up to date with Progress snapshots."""
+
+    def __init__(self, stream=None):
+        self._stream = stream or sys.stderr
+        self._width = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, progress):
+        line = str(progress)
+        with self._lock:
+            self._stream.write('\r' + line.ljust(self._width))
+            self._width = len(line)
+            if progress.done:
+                self._stream.write('\n')
+                self._width = 0
+            self._stream.flush()
+
+
+def _get_progress(args):
+    return ProgressLine() if args.progress else None
+
+
+def _run_pipe(operation, status, args, run):
+    """Pipe mode: gpg between stdin and stdout, the JSON record goes to stderr."""
+    if args.passphrase_file == STDIO_PATH:
+        raise SystemExit("The passphrase can't come from stdin when the data does")
+
+    result = run(args.stdin, args.stdout, _get_progress(args))
+    args.stdout.flush()
+
+    file_result = FileResult(STDIO_PATH, STDIO_PATH, bool(result),
+                             status if result else None,
+                             GpgUtils._get_stream_error(result))
+
+    return _report(operation, [file_result], sys.stderr)
+
+
+def _is_pipe(args):
+    if STDIO_PATH not in args.paths:
+        return False
+
+    if len(args.paths) > 1:
+        raise SystemExit(f"'{STDIO_PATH}' (stdin/stdout) can't be mixed with other paths")
+
+    return True
+
+
+def _check_regular_files(filenames):
+    """Split filenames into processable files and FileResult failures."""
+    files = []
+    failures = []
+    for filename in filenames:
+        if os.path.isdir(filename):
+            failures.append(FileResult(filename, error="Is a directory (use --recursive)"))
+        else:
+            files.append(filename)
+
+    return files, failures
+
+
+def do_encrypt(args, output):
+    passphrase = None
+    if args.symmetric:
+        passphrase = read_passphrase(args)
+        if not passphrase:
+            raise SystemExit(f"A passphrase is required (--passphrase-file or ${PASSPHRASE_ENV})")
+    elif not args.recipient:
+        raise SystemExit("At least one --recipient is required (or use --symmetric)")
+
+    compression = CompressionPolicy(args.compress_algo, args.compress_level,
+                                    auto=not args.no_compress_detect)
+
+    if _is_pipe(args):
+        if args.archive:
+            raise SystemExit("--archive needs folders, not stdin")
+
+        key_ids = None if args.symmetric else args.recipient
+        return _run_pipe('encrypt', 'encryption ok', args,
+                         lambda src, dst, on_progress: GpgUtils.encrypt_stream(
+                             src, dst, key_ids, passphrase, args.armor,
+                             on_progress=on_progress,
+                             compression=compression))
+
+    if args.archive:
+        # Every folder becomes one archive streamed through a single gpg run
+        key_ids = None if args.symmetric else args.recipient
+        results = GpgUtils.encrypt_folders(expand_paths(args.paths), key_ids, passphrase,
+                                           args.armor, args.archive_compression, args.jobs,
+                                           gpg_compression=compression,
+                                           on_progress=_get_progress(args))
+        return _report('encrypt', results, output)
+
+    filenames, failures = _check_regular_files(expand_paths(args.paths, args.recursive))
+
+    if args.symmetric:
+        results = GpgUtils.encrypt_files_symmetric(filenames, passphrase, args.armor, args.jobs,
+                                                   compression=compression,
+                                                   on_progress=_get_progress(args))
+    else:
+        results = GpgUtils.encrypt_files_pki(filenames, args.recipient, args.armor, args.jobs,
+                                             compression=compression,
+                                             on_progress=_get_progress(args))
+
+    return _report('encrypt', failures + results, output)
+
+
+def do_decrypt(args, output):
+    if _is_pipe(args):
+        if args.extract:
+            raise SystemExit("--extract needs archive files, not stdin")
+
+        passphrase = read_passphrase(args)
+        return _run_pipe('decrypt', 'decryption ok', args,
+                         lambda src, dst, on_progress: GpgUtils.decrypt_stream(
+                             src, dst, passphrase, on_progress=on_progress))
+
+    filenames, failures = _check_regular_files(expand_paths(args.paths, args.recursive))
+
+    if args.extract:
+        passphrase = read_passphrase(args)
+
+        def decrypt_archive(filename):
+            return GpgUtils.decrypt_archive(filename, passphrase, args.directory)
+
+        results = GpgUtils.process_files(filenames, decrypt_archive, args.jobs,
+                                         on_progress=_get_progress(args))
+    else:
+        results = GpgUtils.decrypt_files(filenames, read_passphrase(args), args.jobs,
+                                         on_progress=_get_progress(args))
+
+    return _report('decrypt', failures + results, output)
+
+
+def do_sign(args, output):
+    filenames, failures = _check_regular_files(expand_paths(args.paths, args.recursive))
+
+    manifest_filename = args.manifest_file
+    if args.manifest and not manifest_filename and filenames:
+        manifest_filename = GpgUtils.get_default_manifest_filename(filenames)
+
+    if args.manifest_only:
+        results = GpgUtils.sign_manifest(filenames,
+                                         args.key,
+                                         read_passphrase(args),
+                                         args.manifest_file,
+                                         args.armor,
+                                         args.jobs)
+        return _report('sign', failures + results, output)
+
+    results = GpgUtils.sign_files(filenames,
+                                  args.key,
+                                  read_passphrase(args),
+                                  args.armor,
+                                  manifest_filename,
+                                  args.jobs)
+
+    return _report('sign', failures + results, output)
+
+
+def do_verify(args, output):
+    # Directories go to find_signature_pairs whole so that only files with a
+    # .sig/.asc next to them get checked, not every unsigned file in them
+    pairs = []
+    failures = []
+    seen = set()
+    for path in expand_paths(args.paths):
+        found = GpgUtils.find_signature_pairs([path], args.recursive)
+        if not found:
+            failures.append(FileResult(path, error="No signatures found"))
+
+        for pair in found:
+            if pair[0] not in seen:
+                seen.add(pair[0])
+                pairs.append(pair)
+
+    results = []
+    for manifest_filename, signature_filename in pairs:
+        if not GpgUtils.is_manifest(manifest_filename):
+            continue
+
+        try:
+            manifest_result = GpgUtils.verify_manifest(manifest_filename,
+                                                       signature_filename,
+                                                       args.jobs,
+                                                       args.cache)
+            results += manifest_result.get_results()
+        except (OSError, ValueError) as error:
+            results.append(FileResult(manifest_filename, error=str(error)))
+
+    report = GpgUtils.verify_files([pair for pair in pairs if not GpgUtils.is_manifest(pair[0])],
+                                   args.jobs,
+                                   use_cache=args.cache)
+    results += report.results
+
+    return _report('verify', failures + results, output)
+
+
+def do_import(args, output):
+    filenames, failures = _check_regular_files(expand_paths(args.paths, args.recursive))
+
+    report = GpgUtils.import_keys_bulk(filenames)
+    for key in report:
+        record = key.to_dict()
+        record['operation'] = 'import'
+        _print_json(record, output)
+
+    for error in report.errors:
+        print(f"gpg: {error}")
+
+    _report('import', failures + report.file_errors, output)
+
+    return 0 if report and not failures else 1
+
+
+def do_export(args, output):
+    if args.directory:
+        results = GpgUtils.export_keys_to_dir(args.keys, args.directory, args.armor, args.jobs)
+    else:
+        results = [GpgUtils.export_keys(args.keys, args.output, args.armor)]
+
+    return _report('export', results, output)
+
+
+def do_search(args, output):
+    exit_code = 0
+    for query in args.queries:
+        try:
+            results = GpgUtils.search_keys(query, args.keyserver, args.timeout,
+                                           use_cache=not args.no_cache)
+        except KeyserverError as error:
+            _print_json({'operation': 'search', 'query': query, 'success': False,
+                         'error': str(error)}, output)
+            exit_code = 1
+            continue
+
+        for result in results:
+            record = result.to_dict()
+            record.update({'operation': 'search', 'query': query, 'success': True})
+            _print_json(record, output)
+
+    return exit_code
+
+
+def do_fetch(args, output):
+    exit_code = 0
+    for query in args.keys:
+        record = {'operation': 'fetch', 'query': query, 'fingerprint': None, 'error': None}
+        try:
+            record['fingerprint'] = GpgUtils.fetch_key(args.keyserver, query, args.timeout)
+        except RuntimeError as error:
+            record['error'] = str(error)
+
+        record['success'] = bool(record['fingerprint'])
+        if not record['success']:
+            record['error'] = record['error'] or "Key not found"
+            exit_code = 1
+
+        _print_json(record, output)
+
+    return exit_code
+
+
+def do_refresh(args, output):
+    try:
+        report = GpgUtils.refresh_keys(args.keys or None, args.keyserver, args.jobs, args.rate,
+                                       args.timeout)
+    except KeyserverError as error:
+        _print_json({'operation': 'refresh', 'success': False, 'error': str(error)}, output)
+        return 1
+
+    for result in report:
+        if args.changed_only and result.status == result.UNCHANGED:
+            continue
+
+        record = result.to_dict()
+        record.update({'operation': 'refresh', 'success': bool(result)})
+        _print_json(record, output)
+
+    return 0 if report else 1
+
+
+def do_keys(args, output):
+    for key in GpgUtils.get_gpg_keys(args.secret):
+        record = key.to_dict()
+        record['operation'] = 'keys'
+        _print_json(record, output)
+
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='ezgpg',
+                                     description="EZ GPG headless mode. Prints one JSON "
+                                                 "object per processed file.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_file_arguments(subparser):
+        subparser.add_argument('paths', nargs='+',
+                               help="Files, directories or glob patterns ('**' allowed)")
+        subparser.add_argument('-R', '--recursive', action='store_true',
+                               help="Descend into directories")
+        subparser.add_argument('-j', '--jobs', type=int, default=None,
+                               help="Number of parallel gpg processes "
+                                    f"(default: CPU count, max $EZGPG_MAX_IO_JOBS "
+                                    f"or {Config.MAX_IO_JOBS})")
+
+    def add_progress_argument(subparser):
+        subparser.add_argument('--progress', action='store_true',
+                               help="Show bytes done, throughput and ETA on stderr")
+
+    def add_passphrase_argument(subparser):
+        subparser.add_argument('--passphrase-file',
+                               help=f"Read the passphrase from this file ('-' for stdin) "
+                                    f"instead of ${PASSPHRASE_ENV}")
+
+    encrypt = subparsers.add_parser('encrypt', help="Encrypt files to <file>.gpg ('-' "
+                                                    "encrypts stdin to stdout)")
+    add_file_arguments(encrypt)
+    add_passphrase_argument(encrypt)
+    encrypt.add_argument('-r', '--recipient', action='append',
+                         help="Recipient key ID or fingerprint (repeatable)")
+    encrypt.add_argument('-c', '--symmetric', action='store_true',
+                         help="Encrypt with a passphrase only")
+    encrypt.add_argument('-a', '--armor', action='store_true', help="ASCII-armored output")
+    encrypt.add_argument('--compress-algo', choices=ALGORITHMS,
+                         help="Compression gpg applies before encrypting (default: gpg's)")
+    encrypt.add_argument('--compress-level', type=int, choices=range(10), metavar='0-9',
+                         help="Compression level, 0 turns compression off")
+    encrypt.add_argument('--no-compress-detect', action='store_true',
+                         help="Compress files even if they look compressed already "
+                              "(media, archives, ...)")
+    encrypt.add_argument('--archive', action='store_true',
+                         help="Encrypt each folder as one <folder>.tar[.gz|.zst].gpg archive "
+                              "instead of file by file")
+    encrypt.add_argument('--archive-compression', choices=get_compressions(),
+                         default=COMPRESSION_GZIP,
+                         help=f"Archive compression (default: {COMPRESSION_GZIP})")
+    add_progress_argument(encrypt)
+    encrypt.set_defaults(handler=do_encrypt)
+
+    decrypt = subparsers.add_parser('decrypt', help="Decrypt <file>.gpg files ('-' "
+                                                    "decrypts stdin to stdout)")
+    add_file_arguments(decrypt)
+    add_passphrase_argument(decrypt)
+    decrypt.add_argument('-x', '--extract', action='store_true',
+                         help="Extract archives made with 'encrypt --archive' as they decrypt")
+    decrypt.add_argument('-C', '--directory',
+                         help="Extract into this folder (default: next to the archive)")
+    add_progress_argument(decrypt)
+    decrypt.set_defaults(handler=do_decrypt)
+
+    sign = subparsers.add_parser('sign', help="Create detached <file>.sig/.asc signatures")
+    add_file_arguments(sign)
+    add_passphrase_argument(sign)
+    sign.add_argument('-k', '--key', required=True, help="Signing key ID or fingerprint")
+    sign.add_argument('-a', '--armor', action='store_true',
+                      help="Write ASCII-armored <file>.asc signatures")
+    sign.add_argument('-m', '--manifest', action='store_true',
+                      help="Also write and sign a SHA256SUMS manifest in the common "
+                           "directory of the files")
+    sign.add_argument('--manifest-file',
+                      help="Write the signed manifest here instead (implies --manifest)")
+    sign.add_argument('--manifest-only', action='store_true',
+                      help="Only sign a manifest of the files instead of every file "
+                           "(much faster for big trees)")
+    sign.set_defaults(handler=do_sign)
+
+    verify = subparsers.add_parser('verify',
+                                   help="Verify files against their .sig/.asc signatures. "
+                                        "Directories are searched for signed files (with -R "
+                                        "their subdirectories too) and SHA256SUMS manifests "
+                                        "also get their files re-hashed")
+    add_file_arguments(verify)
+    verify.add_argument('--cache', action='store_true',
+                        help="Remember good signatures of unchanged files (keyed by content "
+                             "and keyring state) so repeated runs skip gpg")
+    verify.set_defaults(handler=do_verify)
+
+    import_keys = subparsers.add_parser('import',
+                                        help="Import keys from key files or keyring dumps "
+                                             "(prints one JSON object per key)")
+    import_keys.add_argument('paths', nargs='+',
+                             help="Files, directories or glob patterns ('**' allowed)")
+    import_keys.add_argument('-R', '--recursive', action='store_true',
+                             help="Descend into directories")
+    import_keys.set_defaults(handler=do_import)
+
+    export = subparsers.add_parser('export', help="Export public keys (all of them if no key "
+                                                  "is given)")
+    export.add_argument('keys', nargs='*', help="Key IDs or fingerprints")
+    export_target = export.add_mutually_exclusive_group(required=True)
+    export_target.add_argument('-o', '--output', help="Write all keys into this file")
+    export_target.add_argument('-d', '--directory',
+                               help="Write every key to <fingerprint>.gpg/.asc in this folder")
+    export.add_argument('-a', '--armor', action='store_true', help="ASCII-armored output")
+    export.add_argument('-j', '--jobs', type=int, default=None,
+                        help="Number of parallel gpg processes with --directory "
+                             f"(default: CPU count, max $EZGPG_MAX_IO_JOBS "
+                             f"or {Config.MAX_IO_JOBS})")
+    export.set_defaults(handler=do_export)
+
+    search = subparsers.add_parser('search', help="List the keys keyservers have for an ID or "
+                                                  "email without importing anything")
+    search.add_argument('queries', nargs='+', help="Key IDs, fingerprints or email addresses")
+    search.add_argument('-k', '--keyserver',
+                        help="Only ask this keyserver (default: all configured keyservers)")
+    search.add_argument('--timeout', type=float, default=KEYSERVER_TIMEOUT,
+                        help=f"Seconds to wait for each keyserver (default: {KEYSERVER_TIMEOUT})")
+    search.add_argument('--no-cache', action='store_true',
+                        help="Ask the keyservers even if a recent answer is cached")
+    search.set_defaults(handler=do_search)
+
+    fetch = subparsers.add_parser('fetch', help="Fetch and import keys from keyservers")
+    fetch.add_argument('keys', nargs='+', help="Key IDs, fingerprints or email addresses")
+    fetch.add_argument('-k', '--keyserver',
+                       help="Only ask this keyserver (default: all configured keyservers "
+                            "and WKD at once, fastest answer wins)")
+    fetch.add_argument('--timeout', type=float, default=KEYSERVER_TIMEOUT,
+                       help=f"Seconds to wait for each keyserver (default: {KEYSERVER_TIMEOUT})")
+    fetch.set_defaults(handler=do_fetch)
+
+    refresh = subparsers.add_parser('refresh', help="Update keys from keyservers and report "
+                                                    "revocations, new subkeys and user IDs and "
+                                                    "expiry changes")
+    refresh.add_argument('keys', nargs='*', help="Key IDs or fingerprints (default: all "
+                                                 "public keys)")
+    refresh.add_argument('-k', '--keyserver',
+                         help="Only ask this keyserver (default: all configured keyservers, "
+                              "taking turns)")
+    refresh.add_argument('-j', '--jobs', type=int, default=KEYSERVER_JOBS,
+                         help=f"Keys fetched at once (default: {KEYSERVER_JOBS})")
+    refresh.add_argument('--rate', type=float, default=KEYSERVER_RATE,
+                         help="Requests per second per keyserver, 0 for no limit "
+                              f"(default: {KEYSERVER_RATE})")
+    refresh.add_argument('--timeout', type=float, default=KEYSERVER_TIMEOUT,
+                         help=f"Seconds to wait for each keyserver (default: {KEYSERVER_TIMEOUT})")
+    refresh.add_argument('--changed-only', action='store_true',
+                         help="Leave unchanged keys out of the output")
+    refresh.set_defaults(handler=do_refresh)
+
+    keys = subparsers.add_parser('keys', help="List keys")
+    keys.add_argument('-s', '--secret', action='store_true', help="List secret keys")
+    keys.set_defaults(handler=do_keys)
+
+    for subparser in subparsers.choices.values():
+        subparser.add_argument('--trace', metavar='FILE',
+                               help="Append a JSON line per gpg run (timings, bytes, exit "
+                                    "status, status lines) to FILE")
+        subparser.add_argument('--metrics', action='store_true',
+                               help="Print gpg timing metrics as JSON to stderr when done")
+        subparser.add_argument('-v', '--verbose', action='store_true',
+                               help="Log every gpg run to stderr")
+
+    return parser
+
+
+def main(argv=None, output=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    output = output or sys.stdout
+
+    args = build_parser().parse_args(argv)
+
+    # Pipe mode ('-') needs the real stdout, which gets redirected below
+    args.stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    args.stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+
+    if args.verbose:
+        logging.basicConfig(format='%(name)s: %(message)s')
+        logging.getLogger('ez_gpg').setLevel(logging.DEBUG)
+
+    instrumentation = GpgUtils.get_instrumentation()
+    trace = None
+    if args.trace:
+        trace = instrumentation.enable_trace(args.trace)
+
+    # Keep stdout clean for the JSON lines; diagnostics go to stderr
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            return args.handler(args, output)
+    finally:
+        if trace:
+            instrumentation.remove_sink(trace)
+
+        if args.metrics:
+            sys.stderr.write(json.dumps(instrumentation.metrics.snapshot(), indent=2,
+                                        sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# vim:ff=unix ts=4 sw=4 expandtab
+
+"""Control over the compression gpg applies before encrypting.
+
+gpg compresses everything with zlib by default, which only burns CPU on
+media, archives and anything else that is compressed already. Such data is
+spotted from its first block: known magic bytes first, then a byte entropy
+estimate for the formats without one.
+"""
+
+import collections
+import math
+
+ALGO_ZIP = 'zip'
+ALGO_ZLIB = 'zlib'
+ALGO_BZIP2 = 'bzip2'
+ALGO_NONE = 'none'
+
+ALGORITHMS = (ALGO_ZIP, ALGO_ZLIB, ALGO_BZIP2, ALGO_NONE)
+
+SAMPLE_SIZE = 64 * 1024
+
+# Below this the estimate is noise and compressing costs next to nothing
+MIN_SAMPLE_SIZE = 4096
+
+# Bits per byte; compressed and encrypted data sits right below 8
+ENTROPY_THRESHOLD = 7.5
+
+# (offset, magic) of formats that are compressed already
+COMPRESSED_SIGNATURES = (
+    (0, b'\x1f\x8b'),                   # gzip
+    (0, b'\x28\xb5\x2f\xfd'),           # zstd
+    (0, b'\xfd7zXZ\x00'),               # xz
+    (0, b'\x04\x22\x4d\x18'),           # lz4
+    (0, b'BZh'),                        # bzip2
+    (0, b'PK\x03\x04'),                 # zip, jar, docx, odt, ...
+    (0, b'7z\xbc\xaf\x27\x1c'),         # 7-zip
+    (0, b'Rar!\x1a\x07'),               # rar
+    (0, b'\x89PNG\r\n\x1a\n'),          # png
+    (0, b'\xff\xd8\xff'),               # jpeg
+    (0, b'GIF8'),                       # gif
+    (8, b'WEBP'),                       # webp
+    (4, b'ftyp'),                       # mp4, mov, heic, ...
+    (0, b'\x1a\x45\xdf\xa3'),           # mkv, webm
+    (0, b'OggS'),                       # ogg, opus
+    (0, b'fLaC'),                       # flac
+    (0, b'ID3'),                        # mp3
+)
+
+
+def has_compressed_signature(data):
+    return any(data[offset:offset + len(magic)] == magic
+               for offset, magic in COMPRESSED_SIGNATURES)
+
+
+def get_entropy(data):
+    """Shannon entropy of data in bits per byte."""
+    if not data:
+        return 0.0
+
+    size = len(data)
+    return -sum(count / size * math.log2(count / size)
+                for count in collections.Counter(data).values())
+
+
+def is_incompressible(filename, sample_size=SAMPLE_SIZE):
+    """Guess from the first block of a file whether compressing it is wasted work."""
+    with open(filename, 'rb') as sample_file:
+        sample = sample_file.read(sample_size)
+
+    if has_compressed_signature(sample):
+        return True
+
+    if len(sample) < MIN_SAMPLE_SIZE:
+        return False
+
+    return get_entropy(sample) >= ENTROPY_THRESHOLD
+
+
+class CompressionPolicy:
+    """How gpg should compress data before encrypting it.
+
+    `algo` is one of ALGORITHMS and `level` goes from 0 (off) to 9; None
+    keeps gpg's default for either. With `auto` set, files that look
+    incompressible are stored uncompressed whatever the other settings say.
+    """
+
+    def __init__(self, algo=None, level=None, auto=False):
+        if algo is not None and algo not in ALGORITHMS:
+            raise ValueError(f"Unknown compression algorithm: {algo}")
+
+        if level is not None and not 0 <= level <= 9:
+            raise ValueError(f"Compression level must be between 0 and 9, not {level}")
+
+        self.algo = algo
+        self.level = level
+        self.auto = auto
+
+    @property
+    def is_disabled(self):
+        return self.algo == ALGO_NONE or self.level == 0
+
+    def should_compress(self, filename=None):
+        if self.is_disabled:
+            return False
+
+        if self.auto and filename is not None:
+            try:
+                return not is_incompressible(filename)
+            except OSError:
+                # Let gpg report the unreadable file
+                return True
+
+        return True
+
+    def get_args(self, filename=None):
+        """gpg arguments for this policy, for filename if given."""
+        if not self.should_compress(filename):
+            return ['--compress-algo', ALGO_NONE]
+
+        args = []
+        if self.algo is not None:
+            args += ['--compress-algo', self.algo]
+
+        if self.level is not None:
+            # -z sets the bzip2 level as well as the zip/zlib one
+            args += ['-z', str(self.level)]
+
+        return args
+
+    def __repr__(self):
+        return f"CompressionPolicy(algo={self.algo!r}, level={self.level!r}, auto={self.auto})"
@@ -1,6 +1,48 @@
+import os
+
+
 class Config:
     KEY_ID_SIZE = 16
 
+    # Upper bound on concurrent gpg processes so batch jobs don't thrash the disk
+    MAX_IO_JOBS = 16
+
+    SIGNATURE_SUFFIXES = ('.sig', '.asc')
+
+    @staticmethod
+    def get_io_limit():
+        """Concurrent gpg process cap, from EZGPG_MAX_IO_JOBS or MAX_IO_JOBS."""
+        try:
+            return max(1, int(os.environ.get('EZGPG_MAX_IO_JOBS') or Config.MAX_IO_JOBS))
+        except ValueError:
+            print(f"Ignoring invalid EZGPG_MAX_IO_JOBS: {os.environ['EZGPG_MAX_IO_JOBS']}")
+            return Config.MAX_IO_JOBS
+
+    @staticmethod
+    def get_max_jobs(requested=None, io_limit=None):
+        """Number of gpg processes to run: `requested` or the CPU count.
+
+        gpg is mostly I/O bound, so an explicit request isn't capped at the
+        CPU count, only at io_limit (default: get_io_limit()).
+        """
+        io_limit = io_limit or Config.get_io_limit()
+
+        jobs = requested or os.cpu_count() or 1
+        return max(1, min(jobs, io_limit))
+
+    @staticmethod
+    def get_gnupg_home():
+        return os.environ.get('GNUPGHOME') or os.path.expanduser('~/.gnupg')
+
+    @staticmethod
+    def get_trace_file():
+        return os.environ.get('EZGPG_TRACE') or None
+
+    @staticmethod
+    def get_cache_dir():
+        cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        return os.path.join(cache_home, 'ez_gpg')
+
     @staticmethod
     def get_keyservers():
         return [ 'pgp.mit.edu',
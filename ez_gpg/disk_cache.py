@@ -0,0 +1,121 @@
+# vim:ff=unix ts=4 sw=4 expandtab
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class DiskCache:
+    """Small persistent key/value store for JSON-serializable values.
+
+    Backed by SQLite so several processes (say, parallel CI jobs) can share
+    it. Entries older than `ttl` seconds are ignored and the least recently
+    used ones are evicted once there are more than `max_entries`. The cache
+    is best-effort: storage errors are logged and treated as misses.
+    """
+
+    DEFAULT_MAX_ENTRIES = 10000
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, ttl=None, clock=time.time):
+        self.path = path
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._clock = clock
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _get_connection(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, mode=0o700, exist_ok=True)
+
+            connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            connection.execute('CREATE TABLE IF NOT EXISTS entries ('
+                               'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                               'created REAL NOT NULL, accessed REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS entries_accessed '
+                               'ON entries (accessed)')
+            connection.commit()
+            self._connection = connection
+
+        return self._connection
+
+    def get(self, key, default=None):
+        now = self._clock()
+        try:
+            with self._lock:
+                connection = self._get_connection()
+                row = connection.execute('SELECT value, created FROM entries WHERE key = ?',
+                                         (key,)).fetchone()
+                if row is None:
+                    return default
+
+                if self._ttl is not None and row[1] + self._ttl <= now:
+                    connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+                    connection.commit()
+                    return default
+
+                connection.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+                connection.commit()
+
+                return json.loads(row[0])
+        except (sqlite3.Error, OSError, ValueError) as error:
+            print(f"Cache lookup in {self.path} failed: {error}")
+            return default
+
+    def put(self, key, value):
+        now = self._clock()
+        try:
+            with self._lock:
+                connection = self._get_connection()
+                connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                                   (key, json.dumps(value, sort_keys=True), now, now))
+                self._evict(connection)
+                connection.commit()
+        except (sqlite3.Error, OSError) as error:
+            print(f"Cache update of {self.path} failed: {error}")
+
+    def _evict(self, connection):
+        if self._ttl is not None:
+            connection.execute('DELETE FROM entries WHERE created <= ?',
+                               (self._clock() - self._ttl,))
+
+        count = connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        if count > self._max_entries:
+            connection.execute('DELETE FROM entries WHERE key IN ('
+                               'SELECT key FROM entries ORDER BY accessed LIMIT ?)',
+                               (count - self._max_entries,))
+
+    def delete(self, key):
+        try:
+            with self._lock:
+                connection = self._get_connection()
+                connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+                connection.commit()
+        except (sqlite3.Error, OSError) as error:
+            print(f"Cache update of {self.path} failed: {error}")
+
+    def clear(self):
+        try:
+            with self._lock:
+                connection = self._get_connection()
+                connection.execute('DELETE FROM entries')
+                connection.commit()
+        except (sqlite3.Error, OSError) as error:
+            print(f"Cache update of {self.path} failed: {error}")
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def __len__(self):
+        try:
+            with self._lock:
+                return self._get_connection().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        except (sqlite3.Error, OSError):
+            return 0
@@ -0,0 +1,140 @@
+# vim:ff=unix ts=4 sw=4 expandtab
+
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+_SKIPPED = object()
+
+
+def _call_now(func, *args):
+    return func(*args)
+
+
+def parallel_map(func, items, max_workers=1, is_cancelled=None):
+    """Apply func to every item on up to max_workers threads.
+
+    Results come back in input order. Items that haven't started when
+    is_cancelled() turns true are skipped and left out of the results.
+    """
+    items = list(items)
+
+    def run(item):
+        if is_cancelled and is_cancelled():
+            return _SKIPPED
+
+        return func(item)
+
+    if max_workers <= 1 or len(items) <= 1:
+        results = [run(item) for item in items]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(items)),
+                                thread_name_prefix='ezgpg-batch') as executor:
+            results = list(executor.map(run, items))
+
+    return [result for result in results if result is not _SKIPPED]
+
+
+class Job:
+    """Handle for work submitted to a JobExecutor."""
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self.future = None
+
+    def cancel(self):
+        """Cancel the job.
+
+        Jobs that haven't started are dropped. Running jobs only stop early if
+        they were submitted as cancellable, but their results are never
+        delivered.
+        """
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def is_done(self):
+        return self.future is not None and self.future.done()
+
+
+class JobExecutor:
+    """Runs GpgUtils operations on worker threads.
+
+    Callbacks are handed to `dispatch` so the UI can pass GLib.idle_add and
+    get them on the GTK main loop. Without it they run on the worker thread.
+    """
+
+    def __init__(self, max_workers=None, dispatch=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='ezgpg-worker')
+        self._dispatch = dispatch or _call_now
+        self._jobs = set()
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, on_done=None, on_error=None, cancellable=False, **kwargs):
+        """Run func(*args, **kwargs) in the background.
+
+        With `cancellable` set, func also gets an `is_cancelled` keyword it can
+        poll to stop early.
+        """
+        job = Job()
+        if cancellable:
+            kwargs['is_cancelled'] = job.is_cancelled
+
+        with self._lock:
+            self._jobs.add(job)
+
+        job.future = self._executor.submit(self._run, job, func, args, kwargs,
+                                           on_done, on_error)
+        # Also fires for jobs cancelled before they started, which never get to _run
+        job.future.add_done_callback(lambda future: self._forget(job))
+        return job
+
+    def _forget(self, job):
+        with self._lock:
+            self._jobs.discard(job)
+
+    def _run(self, job, func, args, kwargs, on_done, on_error):
+        if job.is_cancelled():
+            return None
+
+        try:
+            result = func(*args, **kwargs)
+        except Exception as error:
+            if on_error and not job.is_cancelled():
+                self._dispatch(self._deliver, job, on_error, error)
+            else:
+                print(f"Background job failed: {error}")
+            return None
+
+        if on_done and not job.is_cancelled():
+            self._dispatch(self._deliver, job, on_done, result)
+
+        return result
+
+    @staticmethod
+    def _deliver(job, callback, value):
+        # Re-checked here since cancel() may have been called while the
+        # callback was queued on the main loop
+        if not job.is_cancelled():
+            callback(value)
+
+        # Returning False keeps GLib.idle_add from re-scheduling us
+        return False
+
+    def cancel_all(self):
+        with self._lock:
+            jobs = list(self._jobs)
+
+        for job in jobs:
+            job.cancel()
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        if cancel_pending:
+            self.cancel_all()
+
+        self._executor.shutdown(wait=wait)
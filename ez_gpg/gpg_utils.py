@@ -1,18 +1,34 @@
 # vim:ff=unix ts=4 sw=4 expandtab
 
-import gi
 import gnupg  # Requires python3-gnupg
+import hashlib
 import os
-import re
 import shutil
-import subprocess
 import sys
+import tempfile
+import threading
 
-gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk
-
+from .agent import AgentSession, clear_passphrases, get_agent_socket, get_preset_ttl
+from .archive import COMPRESSION_GZIP, COMPRESSION_NONE, extract_archive, \
+    get_archive_filename, move_extracted, write_archive
+from .compression import ALGO_NONE, CompressionPolicy
 from .config import Config
-from .ui_utils import UiUtils
+from .disk_cache import DiskCache
+from .executor import parallel_map
+from .instrumentation import Instrumentation
+from .key_cache import KeyListCache
+from .keyring import KeyringPool
+from .keys import Key
+from .keyserver import DEFAULT_JOBS as KEYSERVER_JOBS, DEFAULT_RATE as KEYSERVER_RATE, \
+    DEFAULT_RETRIES as KEYSERVER_RETRIES, DEFAULT_TIMEOUT as KEYSERVER_TIMEOUT, KeyFetcher, \
+    KeyNotFoundError, KeyserverError, is_email, is_fingerprint, normalize_query
+from .manifest import MANIFEST_NAME, STATUS_OK, check_manifest, hash_file, is_manifest, \
+    write_manifest
+from .packets import PacketError, is_armored, read_session_key_info
+from .passphrase import PassphraseCache
+from .results import EncryptedFileInfo, ExportResult, FileResult, ImportReport, \
+    KeyRefreshResult, ManifestVerifyResult, RefreshReport, VerifyReport, VerifyResult
+from .streaming import BatchProgress, ConcatReader, GpgStream
 
 class GpgUtils:
     @staticmethod
@@ -38,74 +54,246 @@ class GpgUtils:
         return 'gpg'
 
     @staticmethod
-    def get_gpg_keyring():
-        return gnupg.GPG(gpgbinary=GpgUtils._find_gpg_binary(),
-                         options=['--pinentry-mode', 'loopback'])
+    def get_gpg_binary():
+        return _KEYRING_POOL.get_binary()
 
-    # TODO: Make the keys be an object instead of tuple
     @staticmethod
-    def get_gpg_keys(secret=False):
-        gpg = GpgUtils.get_gpg_keyring()
+    def get_gpg_keyring(homedir=None):
+        return _KEYRING_POOL.get(homedir)
 
-        keys = []
+    @staticmethod
+    def get_gpgconf_binary():
+        gpgconf_binary = os.path.join(os.path.dirname(GpgUtils.get_gpg_binary()), 'gpgconf')
+        if os.path.exists(gpgconf_binary):
+            return gpgconf_binary
 
-        for key in gpg.list_keys(secret):
-            # print(key)
-            key_id = key['keyid']
-            fingerprint = key['fingerprint']
+        return 'gpgconf'
 
-            key_name = key['uids'][0]
-            if len(key_name) > 60:
-                key_name = key_name[:60] + '...'
+    @staticmethod
+    def get_agent_socket():
+        return get_agent_socket(GpgUtils.get_gpgconf_binary())
 
-            key_friendly_name = f"{key_name} |{key_id[-Config.KEY_ID_SIZE:]}|"
+    @staticmethod
+    def unlock_keys(key_ids, password, filenames=()):
+        """Session keeping the given secret keys unlocked in gpg-agent.
+
+        Use it as a context manager around a batch and pass
+        `session.passphrase` to each operation: it is None while the agent
+        holds the passphrase and the original password if presetting wasn't
+        possible. The agent's own expiry of the passphrase is sized to the
+        batch's filenames.
+        """
+        keygrips = []
+        for key in GpgUtils.get_key_index(secret=True).find_recipients(key_ids):
+            keygrips += key.keygrips
+
+        batch_size = 0
+        for filename in filenames:
+            try:
+                batch_size += os.path.getsize(filename)
+            except OSError:
+                pass
 
-            subkeys = []
-            for subkey in key['subkeys']:
-                subkeys.append(subkey[0])
+        return AgentSession(keygrips, password, GpgUtils.get_agent_socket,
+                            get_preset_ttl(batch_size))
 
-            keys.append((key_id,
-                         key_name,
-                         key_friendly_name,
-                         subkeys,
-                         fingerprint))
+    @staticmethod
+    def get_instrumentation():
+        """Timing records of every gpg run; see instrumentation.Instrumentation."""
+        return _INSTRUMENTATION
 
-        keys.sort(key=lambda key_tuple: key_tuple[1].lower())
+    @staticmethod
+    def invalidate_keyring(homedir=None):
+        _KEYRING_POOL.invalidate(homedir)
+        _KEY_LIST_CACHE.invalidate()
+        _PASSPHRASE_CACHE.invalidate()
+
+    @staticmethod
+    def invalidate_key_cache():
+        _KEY_LIST_CACHE.invalidate()
+
+    @staticmethod
+    def get_gpg_keys(secret=False):
+        return _KEY_LIST_CACHE.get(secret, lambda: GpgUtils._list_gpg_keys(secret))
+
+    @staticmethod
+    def get_key_index(secret=False):
+        return _KEY_LIST_CACHE.get_index(secret, lambda: GpgUtils._list_gpg_keys(secret))
+
+    @staticmethod
+    def _list_gpg_keys(secret):
+        gpg = GpgUtils.get_gpg_keyring()
+
+        keys = [Key.from_listing(key) for key in gpg.list_keys(secret)]
+        keys.sort(key=lambda key: key.key_name.lower())
 
         return keys
 
     @staticmethod
     def get_key_by_id(key_id, secret = False):
-        keys = GpgUtils.get_gpg_keys(secret)
+        return GpgUtils.get_key_index(secret).get(key_id)
+
+    @staticmethod
+    def export_key(key_id, filename, armor):
+        return bool(GpgUtils.export_keys([key_id], filename, armor))
+
+    @staticmethod
+    def export_keys(key_ids, filename, armor=False, on_progress=None, is_cancelled=None):
+        """Export the public keys in key_ids (the whole keyring if empty) to filename.
+
+        gpg's output goes straight into the file in chunks so binary exports
+        come out intact and a big keyring doesn't have to fit in memory. A
+        failed or empty export leaves no file behind.
+        """
+        key_ids = list(key_ids or [])
+        args = ['--export']
+        if armor:
+            args.insert(0, '--armor')
+
+        stream = GpgStream(GpgUtils.get_gpg_binary(), args + key_ids,
+                           on_progress=on_progress,
+                           is_cancelled=is_cancelled,
+                           instrumentation=_INSTRUMENTATION)
+        try:
+            with open(filename, 'wb') as key_file:
+                result = stream.run(None, key_file)
+        except OSError as error:
+            return ExportResult(filename, key_ids, error=str(error))
 
-        for key_tuple in keys:
-            if key_id == key_tuple[0]:
-                return key_tuple
+        fingerprints = result.get_status('EXPORTED')
+        error = GpgUtils._get_stream_error(result)
+        if error is None and not fingerprints:
+            error = "Nothing exported"
 
-        return None
+        if error is not None:
+            print(f"Failed to export keys to {filename}: {error}")
+            if os.path.exists(filename):
+                os.remove(filename)
+            return ExportResult(filename, key_ids, error=error)
+
+        print(f"Exported {len(fingerprints)} key(s) to {filename}")
+        return ExportResult(filename, key_ids, fingerprints, True, 'export ok')
 
     @staticmethod
-    def export_key(key_id, filename, armor):
+    def export_keys_to_dir(key_ids, directory, armor=False, jobs=None, is_cancelled=None):
+        """Export every key (the whole keyring if key_ids is empty) to its own file.
+
+        Files are named <fingerprint>.asc or <fingerprint>.gpg and written by
+        up to `jobs` gpg processes at once.
+        """
+        if not key_ids:
+            key_ids = [key.fingerprint for key in GpgUtils.get_gpg_keys()]
+
+        os.makedirs(directory, exist_ok=True)
+        suffix = '.asc' if armor else '.gpg'
+
+        def export(key_id):
+            key = GpgUtils.get_key_by_id(key_id)
+            if key is None:
+                return ExportResult(os.path.join(directory, f"{key_id}{suffix}"), [key_id],
+                                    error="Unknown key")
+
+            return GpgUtils.export_keys([key.fingerprint],
+                                        os.path.join(directory, f"{key.fingerprint}{suffix}"),
+                                        armor)
+
+        return GpgUtils.process_files(key_ids, export, jobs, is_cancelled)
+
+    @staticmethod
+    def _has_matching_key(key_data, query):
+        """Whether key_data (from a keyserver) holds a key for query."""
         gpg = GpgUtils.get_gpg_keyring()
+        query = normalize_query(query)
+
+        for key in gpg.scan_keys_mem(key_data):
+            if is_email(query):
+                email = query.lower()
+                if any(uid.lower() == email or f"<{email}>" in uid.lower()
+                       for uid in key['uids']):
+                    return True
+                continue
 
-        key_data = gpg.export_keys(key_id, armor=armor)
-        with open(filename, 'wb') as exported_key:
-            exported_key.write(key_data.encode('utf-8'))
+            # Subkeys are [key ID, capabilities, fingerprint, ...]
+            ids = [key['fingerprint']] + [subkey[index] for subkey in key['subkeys']
+                                          for index in (0, 2) if len(subkey) > index]
+            if any(key_id and key_id.upper().endswith(query) for key_id in ids):
+                return True
 
-        return True
+        return False
+
+    @staticmethod
+    def get_keyserver_cache():
+        global _KEYSERVER_CACHE
+
+        if _KEYSERVER_CACHE is None:
+            _KEYSERVER_CACHE = DiskCache(os.path.join(Config.get_cache_dir(), 'keyserver.sqlite'),
+                                         max_entries=KEYSERVER_CACHE_MAX_ENTRIES,
+                                         ttl=KEYSERVER_CACHE_TTL)
+
+        return _KEYSERVER_CACHE
+
+    @staticmethod
+    def search_keys(query, keyserver=None, timeout=KEYSERVER_TIMEOUT, use_cache=True):
+        """List the keys keyservers know for query (key ID, fingerprint or email).
+
+        Nothing gets imported. Asks every configured keyserver at once when
+        keyserver is None; answers are cached on disk per server and query.
+        """
+        keyservers = Config.get_keyservers() if keyserver is None else [keyserver]
+        fetcher = KeyFetcher(keyservers, timeout,
+                             cache=GpgUtils.get_keyserver_cache() if use_cache else None)
+
+        return fetcher.search(query)
 
     @staticmethod
-    def fetch_key(keyserver, key_id):
+    def fetch_key(keyserver, key_id, timeout=KEYSERVER_TIMEOUT, retries=KEYSERVER_RETRIES):
+        """Fetch key_id (or an email's key) and import it.
+
+        With keyserver None all configured keyservers (and WKD for emails)
+        are asked at once and the first matching answer is imported. IDs
+        shorter than a fingerprint are searched for first and refused if
+        several keys match, so colliding keys never reach the keyring.
+        Returns the fingerprint or None if no server had the key.
+        """
         gpg = GpgUtils.get_gpg_keyring()
-        print(f"Fetching '0x{key_id}' from {keyserver}")
-        fetch_result = gpg.recv_keys(keyserver, key_id)
+        keyservers = Config.get_keyservers() if keyserver is None else [keyserver]
+
+        if not is_fingerprint(key_id):
+            try:
+                candidates = GpgUtils.search_keys(key_id, keyserver, timeout)
+            except KeyserverError as error:
+                # Not every keyserver supports searching; the import check still applies
+                print(f"Search failed: {error}")
+                candidates = []
+
+            if len(candidates) > 1:
+                raise RuntimeError(f"WARNING! {len(candidates)} keys match '{key_id}', fetch "
+                                   "the one you want by fingerprint: " +
+                                   ', '.join(candidate.key_id for candidate in candidates))
+
+            if candidates and candidates[0].fingerprint:
+                key_id = candidates[0].fingerprint
+
+        print(f"Fetching '0x{key_id}' from {', '.join(keyservers)}")
+
+        fetcher = KeyFetcher(keyservers, timeout, retries,
+                             use_wkd=keyserver is None,
+                             validate=GpgUtils._has_matching_key)
+        try:
+            fetched = fetcher.fetch(key_id)
+        except KeyserverError as error:
+            print(f"Fetch failed: {error}")
+            return None
+
+        print(f"Got '0x{key_id}' from {fetched.source}")
+        fetch_result = gpg.import_keys(fetched.data)
+        GpgUtils.invalidate_key_cache()
 
         if fetch_result.count == 0:
             return None
 
         # We won't be like the other GPG clients!
         if fetch_result.count > 1:
-            # TODO: Search for keys first just in case before importing
             # XXX: The more I think about this, the more the deletion of duplicate
             #      keys makes sense because if there are any, they're bad and we
             #      wipe them out but more importantly if the user tried to do this
@@ -118,6 +306,7 @@ class GpgUtils:
             print("Deleting rogue certs:", fetch_result.fingerprints)
 
             result = gpg.delete_keys(fetch_result.fingerprints)
+            GpgUtils.invalidate_key_cache()
             # XXX: This is the lamest API ever
             if not str(result) == 'ok':
                 print(f"Failed to delete keys ({result})", fetch_result.fingerprints)
@@ -132,6 +321,84 @@ class GpgUtils:
 
         return fetch_result.fingerprints[0]
 
+    @staticmethod
+    def refresh_keys(key_ids=None, keyserver=None, jobs=KEYSERVER_JOBS, rate=KEYSERVER_RATE,
+                     timeout=KEYSERVER_TIMEOUT, is_cancelled=None):
+        """Fetch the keyservers' copies of key_ids (every public key if None) and merge them.
+
+        Up to `jobs` keys are fetched at once, each server getting at most
+        `rate` requests per second, and every answer is spooled to disk so a
+        large keyring is merged by one `gpg --import` run. Only keys already
+        in the keyring are updated. Returns a RefreshReport of what changed.
+        """
+        keys = {}
+        results = {}
+        for key_id in GpgUtils.get_gpg_keys() if key_ids is None else key_ids:
+            key = key_id if isinstance(key_id, Key) else GpgUtils.get_key_by_id(key_id)
+            if key is None:
+                results[key_id] = KeyRefreshResult(key_id, error="Unknown key")
+            else:
+                keys[key.fingerprint] = key
+        keys = list(keys.values())
+
+        keyservers = Config.get_keyservers() if keyserver is None else [keyserver]
+        print(f"Refreshing {len(keys)} keys from {', '.join(keyservers)}")
+
+        # Rogue answers are harmless here since merge-only never adds keys
+        fetcher = KeyFetcher(keyservers, timeout, use_wkd=False)
+        with tempfile.TemporaryDirectory(prefix='ezgpg-refresh-') as tmp_dir:
+            filenames = {}
+            fetch_errors = {}
+
+            def on_fetched(fingerprint, fetched, error):
+                if error is not None:
+                    fetch_errors[fingerprint] = error
+                    return
+
+                extension = '.asc' if is_armored(fetched.data) else '.gpg'
+                filename = os.path.join(tmp_dir, fingerprint + extension)
+                with open(filename, 'wb') as key_file:
+                    key_file.write(fetched.data)
+                filenames[fingerprint] = filename
+
+            if keys:
+                fetcher.fetch_all([key.fingerprint for key in keys], on_fetched, jobs, rate,
+                                  is_cancelled)
+
+            import_report = GpgUtils.import_keys_bulk(sorted(filenames.values()),
+                                                      merge_only=True)
+
+        for error in import_report.errors:
+            print(f"Import problem: {error}")
+
+        rejected = {key.fingerprint: key.reason for key in import_report.rejected}
+        refreshed = {key.fingerprint: key for key in GpgUtils.get_gpg_keys()}
+        for key in keys:
+            fingerprint = key.fingerprint
+            error = fetch_errors.get(fingerprint)
+            if isinstance(error, KeyNotFoundError):
+                result = KeyRefreshResult(fingerprint, key.name, found=False)
+            elif error is not None:
+                result = KeyRefreshResult(fingerprint, key.name, error=str(error))
+            elif fingerprint not in filenames:
+                result = KeyRefreshResult(fingerprint, key.name, error="Cancelled")
+            elif fingerprint in rejected:
+                result = KeyRefreshResult(fingerprint, key.name,
+                                          error=f"Rejected by gpg ({rejected[fingerprint]})")
+            elif fingerprint not in refreshed:
+                result = KeyRefreshResult(fingerprint, key.name, error="Key disappeared")
+            else:
+                result = KeyRefreshResult(fingerprint, key.name,
+                                          key.get_changes(refreshed[fingerprint]))
+
+            results[fingerprint] = result
+
+        report = RefreshReport(results.values())
+        print(f"Refreshed {len(report)} keys: {len(report.changed)} changed, "
+              f"{len(report.not_found)} not found, {len(report.failed)} failed")
+
+        return report
+
     @staticmethod
     def delete_key(key_id):
         gpg = GpgUtils.get_gpg_keyring()
@@ -142,13 +409,16 @@ class GpgUtils:
         if secret_key:
             # TODO: Confirm the deletion if we have a secret key
             print("Secret key found. Deleting it")
-            result = gpg.delete_keys(secret_key[4], True)
+            result = gpg.delete_keys(secret_key.fingerprint, True)
+            GpgUtils.invalidate_key_cache()
+            _PASSPHRASE_CACHE.invalidate(secret_key.fingerprint)
             if not str(result) == 'ok':
                 print(f"Failed to delete secret key ({result})", secret_key)
                 return False
 
         print("Deleting public key")
-        result = gpg.delete_keys(public_key[4])
+        result = gpg.delete_keys(public_key.fingerprint)
+        GpgUtils.invalidate_key_cache()
 
         if not str(result) == 'ok':
             print(f"Failed to delete public key ({result})", public_key)
@@ -158,45 +428,130 @@ class GpgUtils:
 
     @staticmethod
     def import_key(filename):
-        gpg = GpgUtils.get_gpg_keyring()
-        key_data = None
-
-        if len(gpg.scan_keys(filename)) < 1:
+        report = GpgUtils.import_keys_bulk([filename])
+        if not report.fingerprints:
             print("Invalid file!")
-            return False
 
-        with open(filename, "rb") as keyfile:
-            key_data = keyfile.read()
+        return report
+
+    @staticmethod
+    def import_keys_bulk(filenames, on_progress=None, is_cancelled=None, merge_only=False):
+        """Import every key in filenames and return an ImportReport.
+
+        The files are streamed one after another into a single `gpg --import`
+        instead of being read into memory and imported one by one. Armored
+        and binary files can't share a stream so a mixed batch takes two runs.
+        With merge_only, keys not already in the keyring are skipped.
+        """
+        args = ['--import']
+        if merge_only:
+            args = ['--import-options', 'merge-only'] + args
+
+        groups = {True: [], False: []}
+        sizes = {True: 0, False: 0}
+        file_errors = []
+        for filename in filenames:
+            try:
+                with open(filename, 'rb') as key_file:
+                    prefix = key_file.read(1)
+                    size = os.fstat(key_file.fileno()).st_size
+            except OSError as error:
+                file_errors.append(FileResult(filename, error=str(error)))
+                continue
+
+            if not prefix:
+                file_errors.append(FileResult(filename, error="Empty file"))
+                continue
+
+            groups[is_armored(prefix)].append(filename)
+            sizes[is_armored(prefix)] += size
+
+        report = ImportReport(file_errors=file_errors)
+        for armored, group in groups.items():
+            if not group:
+                continue
 
-        return gpg.import_keys(key_data)
+            # Every armor header has to start on a line of its own
+            with ConcatReader(group, b'\n' if armored else b'') as reader:
+                stream = GpgStream(GpgUtils.get_gpg_binary(), args,
+                                   on_progress=on_progress,
+                                   total_size=sizes[armored],
+                                   is_cancelled=is_cancelled,
+                                   instrumentation=_INSTRUMENTATION)
+                result = stream.run(reader)
+
+            report.add_status(result.status)
+            report.file_errors += [FileResult(filename, error=str(error))
+                                   for filename, error in reader.errors]
+
+            error = GpgUtils._get_stream_error(result)
+            if error:
+                report.errors.append(error)
+
+        GpgUtils.invalidate_key_cache()
+
+        return report
 
     @staticmethod
-    def add_gpg_keys_to_combo_box(combo_box, secret=False):
-        gpg_keys_list = Gtk.ListStore(str, str)
-        for key in GpgUtils.get_gpg_keys(secret):
-            key_id = key[0]
-            key_name = key[1]
-            gpg_keys_list.append([key_id, key_name])
+    def process_files(filenames, process_file, jobs=None, is_cancelled=None, on_progress=None,
+                      io_limit=None):
+        """Run process_file over filenames on up to `jobs` gpg processes.
+
+        `jobs` is capped at io_limit (default: Config.get_io_limit()).
+
+        Every file gets a FileResult, failures included, in input order.
+        on_progress gets Progress snapshots over the files' total size as
+        they finish.
+        """
+        batch = None
+        if on_progress is not None:
+            sizes = {}
+            for filename in filenames:
+                try:
+                    sizes[filename] = os.path.getsize(filename)
+                except OSError:
+                    sizes[filename] = 0
+            batch = BatchProgress(on_progress, sum(sizes.values()))
+
+        def process(filename):
+            try:
+                return process_file(filename)
+            except Exception as error:
+                print(f"Failed to process {filename}: {error}")
+                return FileResult(filename, error=str(error))
+            finally:
+                if batch is not None:
+                    batch.item_done(filename, sizes[filename])
+
+        max_jobs = Config.get_max_jobs(jobs, io_limit)
+        print(f" - Jobs: {max_jobs}")
+
+        results = parallel_map(process, filenames, max_jobs, is_cancelled)
+        if batch is not None:
+            batch.done()
+
+        return results
 
-        cell = Gtk.CellRendererText()
-        combo_box.pack_start(cell, True)
-        combo_box.add_attribute(cell, 'text', 1)
+    @staticmethod
+    def _get_compression_args(compression, filename=None):
+        if compression is None:
+            return None
 
-        combo_box.set_model(gpg_keys_list)
-        combo_box.set_entry_text_column(1)
+        return compression.get_args(filename)
 
     @staticmethod
-    def encrypt_files_pki(window, filenames, key_ids, use_armor=True, callback=None):
-        conversion_list = []
-        for filename in filenames:
-            dest_filename = f"{filename}.gpg"
-            conversion_list.append((filename, dest_filename))
+    def encrypt_files_pki(filenames, key_ids, use_armor=True, jobs=None, is_cancelled=None,
+                          compression=None, on_progress=None, io_limit=None):
+        """Encrypt every file to <file>.gpg for key_ids.
 
+        `compression` is a CompressionPolicy; None leaves it to gpg.
+        """
         print(" - Armor:", use_armor)
 
         gpg = GpgUtils.get_gpg_keyring()
 
-        for filename, dest_filename in conversion_list:
+        def encrypt(filename):
+            dest_filename = f"{filename}.gpg"
             print(f"Encrypting {filename} to {dest_filename}")
 
             with open(filename, 'rb') as src_file:
@@ -204,31 +559,26 @@ class GpgUtils:
                                           recipients=key_ids,
                                           always_trust=True,   # XXX: No key mgmt = no point
                                           armor=use_armor,     # XXX: This doesn't seem to work :(
-                                          output=dest_filename)
+                                          output=dest_filename,
+                                          extra_args=GpgUtils._get_compression_args(compression,
+                                                                                    filename))
             print(f"Status: {status}")
 
             print(f"Encrypted {filename} to {dest_filename}")
+            return FileResult(filename, dest_filename, bool(status), status.status)
 
-        # Stop spinner when we return
-        if callback:
-            callback(window)
-
-        UiUtils.show_dialog(window,
-                            "Encrypted!",
-                            message_type=Gtk.MessageType.INFO)
+        return GpgUtils.process_files(filenames, encrypt, jobs, is_cancelled, on_progress,
+                                      io_limit)
 
     @staticmethod
-    def encrypt_files_symmetric(window, filenames, password, use_armor=True, callback=None):
-        conversion_list = []
-        for filename in filenames:
-            dest_filename = f"{filename}.gpg"
-            conversion_list.append((filename, dest_filename))
-
+    def encrypt_files_symmetric(filenames, password, use_armor=True, jobs=None, is_cancelled=None,
+                                compression=None, on_progress=None):
         print(" - Armor:", use_armor)
 
         gpg = GpgUtils.get_gpg_keyring()
 
-        for filename, dest_filename in conversion_list:
+        def encrypt(filename):
+            dest_filename = f"{filename}.gpg"
             print(f"Encrypting {filename} to {dest_filename}")
 
             with open(filename, 'rb') as src_file:
@@ -239,25 +589,26 @@ class GpgUtils:
                                           # This just means that PKI recipients aren't provided
                                           # See https://github.com/isislovecruft/python-gnupg/issues/110
                                           armor=use_armor,     # XXX: This doesn't seem to work :(
-                                          output=dest_filename)
+                                          output=dest_filename,
+                                          extra_args=GpgUtils._get_compression_args(compression,
+                                                                                    filename))
             print(f"Status: {status}")
 
             print(f"Encrypted {filename} to {dest_filename}")
+            return FileResult(filename, dest_filename, bool(status), status.status)
 
-        # Stop spinner when we return
-        if callback:
-            callback(window)
+        return GpgUtils.process_files(filenames, encrypt, jobs, is_cancelled, on_progress)
 
-        UiUtils.show_dialog(window,
-                            "Encrypted!",
-                            message_type=Gtk.MessageType.INFO)
+    @staticmethod
+    def get_signature_filename(filename, use_armor=False):
+        return f"{filename}.asc" if use_armor else f"{filename}.sig"
 
     @staticmethod
-    def sign_file(window, filename, key_id, password, use_armor=True, callback=None):
+    def sign_file(filename, key_id, password, use_armor=False):
         print(" - Armor:", use_armor)
         # print(" - Password:", password)
 
-        signature_file = f"{filename}.sig"
+        signature_file = GpgUtils.get_signature_filename(filename, use_armor)
 
         print(f"Signing {filename} to {signature_file} with {key_id}")
 
@@ -268,38 +619,92 @@ class GpgUtils:
                                    keyid=key_id,
                                    passphrase=password,
                                    detach=True,
+                                   binary=not use_armor,
                                    output=signature_file)
         print(f"Status: {status}")
 
         print(f"Signed {filename} to {signature_file}")
 
-        # Stop spinner when we return
-        if callback:
-            callback(window)
+        return FileResult(filename, signature_file, bool(status), status.status)
 
-        success = True
-        dialog_title = "Completed!"
-        message_text = f"Signature can be found at:\n{signature_file}"
-        message_type = Gtk.MessageType.INFO
+    @staticmethod
+    def get_default_manifest_filename(filenames):
+        directories = [os.path.dirname(os.path.abspath(filename)) for filename in filenames]
+        return os.path.join(os.path.commonpath(directories), MANIFEST_NAME)
+
+    @staticmethod
+    def sign_files(filenames, key_id, password, use_armor=False, manifest_filename=None,
+                   jobs=None, is_cancelled=None, io_limit=None):
+        """Detach-sign every file next to itself, up to `jobs` at a time.
+
+        With manifest_filename set, a SHA256SUMS manifest of the successfully
+        signed files is written there and signed as well; its FileResult is
+        appended to the per-file results. The key is unlocked once for the
+        whole batch.
+        """
+        with GpgUtils.unlock_keys([key_id], password, filenames) as session:
+            results = GpgUtils.process_files(filenames,
+                                             lambda filename: GpgUtils.sign_file(filename,
+                                                                                 key_id,
+                                                                                 session.passphrase,
+                                                                                 use_armor),
+                                             jobs,
+                                             is_cancelled,
+                                             io_limit=io_limit)
+
+            # Re-signing a tree shouldn't list an old manifest in the new one
+            manifest_path = manifest_filename and os.path.abspath(manifest_filename)
+            signed_files = [result.filename for result in results
+                            if result and os.path.abspath(result.filename) != manifest_path]
+            if manifest_filename and signed_files and not (is_cancelled and is_cancelled()):
+                results += GpgUtils._sign_manifest(signed_files, key_id, session.passphrase,
+                                                   manifest_filename, use_armor, jobs, io_limit)
+
+        return results
 
-        if not status:
-            success = False
-            dialog_title = "FAILED!"
-            message_text = f"Unable to sign {filename}!"
-            message_type = Gtk.MessageType.ERROR
+    @staticmethod
+    def _sign_manifest(filenames, key_id, password, manifest_filename, use_armor, jobs,
+                       io_limit=None):
+        try:
+            _, failures = write_manifest(filenames, manifest_filename,
+                                         Config.get_max_jobs(jobs, io_limit))
+            results = [FileResult(filename, error=str(error)) for filename, error in failures]
+            results.append(GpgUtils.sign_file(manifest_filename, key_id, password, use_armor))
+        except Exception as error:
+            print(f"Failed to sign manifest {manifest_filename}: {error}")
+            results = [FileResult(manifest_filename, error=str(error))]
 
-        UiUtils.show_dialog(window,
-                            message_text,
-                            title=dialog_title,
-                            message_type=message_type)
+        return results
 
-        return success
+    @staticmethod
+    def sign_manifest(filenames, key_id, password, manifest_filename=None, use_armor=False,
+                      jobs=None, io_limit=None):
+        """Hash-then-sign: one signature over a SHA256SUMS manifest of filenames.
+
+        Much cheaper than a signature per file for big trees. Files are
+        hashed in parallel and the returned FileResults cover unreadable
+        files followed by the manifest signature.
+        """
+        if not manifest_filename:
+            manifest_filename = GpgUtils.get_default_manifest_filename(filenames)
+
+        # Don't list the manifest (or its old signatures) in itself
+        excluded = {os.path.abspath(manifest_filename + suffix) for suffix in ('', '.sig', '.asc')}
+        filenames = [filename for filename in filenames
+                     if os.path.abspath(filename) not in excluded]
+
+        with GpgUtils.unlock_keys([key_id], password) as session:
+            return GpgUtils._sign_manifest(filenames, key_id, session.passphrase,
+                                           manifest_filename, use_armor, jobs, io_limit)
 
     @staticmethod
-    def decrypt_file(window, filename, password, callback=None):
+    def decrypt_file(filename, password):
         # print(" - Password:", password)
 
-        decrypted_file = filename.rstrip('.gpg')
+        # XXX: rstrip('.gpg') used to eat any trailing '.', 'g' or 'p'
+        decrypted_file = f"{filename}.decrypted"
+        if filename.endswith('.gpg'):
+            decrypted_file = filename[:-len('.gpg')]
 
         print(f"Decrypting {filename} to {decrypted_file}")
 
@@ -313,101 +718,313 @@ class GpgUtils:
 
         print(f"Decrypted {filename} to {decrypted_file}")
 
-        # Stop spinner when we return
-        if callback:
-            callback(window)
+        return FileResult(filename, decrypted_file, bool(status), status.status)
 
-        success = True
-        dialog_title = "Completed!"
-        message_text = f"Decrypted file can be found at:\n{decrypted_file}"
-        message_type = Gtk.MessageType.INFO
+    @staticmethod
+    def decrypt_files(filenames, password, jobs=None, is_cancelled=None, on_progress=None):
+        # Recipients come from the packet headers, so unlocking every needed
+        # key up front costs no extra gpg runs
+        recipient_ids = []
+        symmetric_files = set()
+        for filename in filenames:
+            try:
+                info = GpgUtils.get_encryped_file_info(filename)
+            except ValueError:
+                continue
 
-        if not status:
-            success = False
-            dialog_title = "FAILED!"
-            message_text = f"Unable to decrypt {filename}!"
-            message_type = Gtk.MessageType.ERROR
+            recipient_ids += info.key_ids
+            if info.is_symmetric:
+                symmetric_files.add(filename)
 
-        UiUtils.show_dialog(window,
-                            message_text,
-                            title=dialog_title,
-                            message_type=message_type)
+        with GpgUtils.unlock_keys(recipient_ids, password, filenames) as session:
+            def decrypt(filename):
+                if filename in symmetric_files:
+                    return GpgUtils.decrypt_file(filename, password)
 
-        return success
+                return GpgUtils.decrypt_file(filename, session.passphrase)
+
+            return GpgUtils.process_files(filenames, decrypt, jobs, is_cancelled, on_progress)
 
-    # XXX: There's no good way though python3-gnupg to find out what
-    #      type of encryption is on a file
     @staticmethod
-    def get_encryped_file_info(window, filename):
-        class Info:
-            def __init__(self):
-                self.is_symmetric = False
-                self.key_ids = []
-                self.matching_key = None
+    def encrypt_stream(src, dst, key_ids=None, password=None, use_armor=False,
+                       on_progress=None, total_size=None,
+                       chunk_size=GpgStream.DEFAULT_CHUNK_SIZE, is_cancelled=None,
+                       compression=None):
+        """Encrypt from any readable file object into any writable one.
+
+        Uses PKI encryption when key_ids are given and symmetric encryption
+        with the password otherwise. on_progress gets Progress snapshots from
+        the pumping threads.
+        """
+        args = []
+        if use_armor:
+            args.append('--armor')
+
+        if compression is not None:
+            args += compression.get_args()
+
+        if key_ids:
+            args += ['--always-trust', '--encrypt']   # XXX: No key mgmt = no point
+            for key_id in key_ids:
+                args += ['--recipient', key_id]
+            password = None
+        else:
+            args.append('--symmetric')
 
-        info = Info()
+        stream = GpgStream(GpgUtils.get_gpg_binary(), args,
+                           passphrase=password,
+                           chunk_size=chunk_size,
+                           on_progress=on_progress,
+                           total_size=total_size,
+                           is_cancelled=is_cancelled,
+                           instrumentation=_INSTRUMENTATION)
+        return stream.run(src, dst)
 
-        gpg_binary = GpgUtils._find_gpg_binary()
+    @staticmethod
+    def decrypt_stream(src, dst, password=None, on_progress=None, total_size=None,
+                       chunk_size=GpgStream.DEFAULT_CHUNK_SIZE, is_cancelled=None):
+        stream = GpgStream(GpgUtils.get_gpg_binary(), ['--decrypt'],
+                           passphrase=password,
+                           chunk_size=chunk_size,
+                           on_progress=on_progress,
+                           total_size=total_size,
+                           is_cancelled=is_cancelled,
+                           instrumentation=_INSTRUMENTATION)
+        return stream.run(src, dst)
 
-        # Sanity check
-        try:
-            subprocess.check_output([gpg_binary, '--version'])
-        except Exception:
-            print("ERRROR! GPG not found!")
-            UiUtils.show_dialog(window,
-                                "ERROR! GPG binary not found in path!",
-                                title="GPG not found")
-
-            window.destroy()
+    @staticmethod
+    def _get_stream_error(result):
+        if result:
             return None
 
-        command = [gpg_binary, f'--keyring={os.devnull}',
-                   '--no-default-keyring',
-                   '--list-only', '--verbose', filename]
+        if result.cancelled:
+            return 'cancelled'
+
+        if result.stderr:
+            return result.stderr[-1]
+
+        return f"gpg exited with {result.returncode}"
+
+    @staticmethod
+    def encrypt_folder(folder, key_ids=None, password=None, use_armor=False,
+                       compression=COMPRESSION_GZIP, output_filename=None,
+                       on_progress=None, is_cancelled=None, gpg_compression=None):
+        """Encrypt a whole folder into one archive with a single gpg run.
+
+        The tar stream is piped straight into gpg so no plaintext archive
+        ever hits the disk. gpg's own compression (`gpg_compression`, a
+        CompressionPolicy) is skipped when the archive is compressed already.
+        """
+        output_filename = output_filename or get_archive_filename(folder, compression)
+        if not os.path.isdir(folder):
+            return FileResult(folder, output_filename, error="Not a folder")
+
+        print(f"Archiving {folder} to {output_filename}")
+
+        errors = []
+        read_fd, write_fd = os.pipe()
+
+        def archive():
+            try:
+                with open(write_fd, 'wb') as pipe:
+                    write_archive(folder, pipe, compression, is_cancelled)
+            except BrokenPipeError:
+                # gpg stopped reading; its own result says why
+                pass
+            except Exception as error:
+                errors.append(error)
+
+        archive_thread = threading.Thread(target=archive, daemon=True)
+        archive_thread.start()
+
+        if compression != COMPRESSION_NONE:
+            gpg_compression = CompressionPolicy(ALGO_NONE)
 
         try:
-            gpg_file_info_results = subprocess.check_output(command,
-                                                            stderr=subprocess.STDOUT,
-                                                            universal_newlines=True)
-        except Exception:
-            print("Invalid file!")
-            UiUtils.show_dialog(window,
-                                "ERROR! Not a GPG-encrypted file!",
-                                title="Invalid file")
-            return None
+            with open(read_fd, 'rb') as src, open(output_filename, 'wb') as dst:
+                result = GpgUtils.encrypt_stream(src, dst, key_ids, password, use_armor,
+                                                 on_progress=on_progress,
+                                                 is_cancelled=is_cancelled,
+                                                 compression=gpg_compression)
+        finally:
+            archive_thread.join()
+
+        error = None
+        if errors:
+            error = str(errors[0])
+        else:
+            error = GpgUtils._get_stream_error(result)
 
+        if error is not None:
+            # A truncated archive would look fine until someone needs it
+            print(f"Failed to archive {folder}: {error}")
+            if os.path.exists(output_filename):
+                os.remove(output_filename)
+            return FileResult(folder, output_filename, error=error)
 
-        # print("Output:")
-        # print(gpg_file_info_results)
+        print(f"Encrypted {folder} to {output_filename}")
+        return FileResult(folder, output_filename, True, 'encryption ok')
 
-        gpg_file_info_results = gpg_file_info_results.split('\n')
+    @staticmethod
+    def encrypt_folders(folders, key_ids=None, password=None, use_armor=False,
+                        compression=COMPRESSION_GZIP, jobs=None, is_cancelled=None,
+                        gpg_compression=None, on_progress=None):
+        """encrypt_folder() for every folder; on_progress sees the bytes of all of them."""
+        batch = BatchProgress(on_progress) if on_progress is not None else None
 
-        key_id_regx = re.compile(' ([0-9a-fA-f]{8,16})$')
-        symmetric_regex = re.compile(r' \d+ pass')
+        def encrypt(folder):
+            return GpgUtils.encrypt_folder(folder, key_ids, password, use_armor, compression,
+                                           on_progress=batch and batch.item(folder),
+                                           is_cancelled=is_cancelled,
+                                           gpg_compression=gpg_compression)
 
-        for gpg_line in gpg_file_info_results:
-            if not gpg_line.startswith('gpg:'):
-                continue
+        results = GpgUtils.process_files(folders, encrypt, jobs, is_cancelled)
+        if batch is not None:
+            batch.done()
 
-            # print("Line:", gpg_line)
+        return results
 
-            # Extract key ids (if any)
-            key_match = key_id_regx.search(gpg_line)
-            if key_match:
-                key_id = key_match.group(1)
-                # print("Key match:", key_id)
-                if key_id not in info.key_ids:
-                    info.key_ids.append(key_id)
+    @staticmethod
+    def decrypt_archive(filename, password=None, dest_dir=None, on_progress=None,
+                        is_cancelled=None):
+        """Decrypt an archive made by encrypt_folder() and extract it as it streams.
+
+        Files land in dest_dir (next to the archive by default). The stream
+        is extracted into a hidden folder inside dest_dir first and only moved
+        into place once gpg's integrity check has passed, so a failed or
+        tampered archive leaves nothing behind.
+        """
+        dest_dir = dest_dir or os.path.dirname(os.path.abspath(filename))
+        info = GpgUtils.get_encryped_file_info(filename)
+
+        print(f"Extracting {filename} to {dest_dir}")
+
+        os.makedirs(dest_dir, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix='.ezgpg-extract-', dir=dest_dir)
+        try:
+            error, file_count = GpgUtils._extract_archive(filename, password, info,
+                                                          staging_dir, on_progress,
+                                                          is_cancelled)
+            if error is None:
+                try:
+                    move_extracted(staging_dir, dest_dir)
+                except (OSError, ValueError) as move_error:
+                    error = str(move_error)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+        if error is not None:
+            print(f"Failed to extract {filename}: {error}")
+            return FileResult(filename, dest_dir, error=error)
+
+        print(f"Extracted {file_count} file(s) from {filename} to {dest_dir}")
+        return FileResult(filename, dest_dir, True, 'decryption ok')
 
-            sym_match = symmetric_regex.search(gpg_line)
-            if sym_match:
-                # print("Symmetric match")
-                info.is_symmetric = True
+    @staticmethod
+    def _extract_archive(filename, password, info, dest_dir, on_progress, is_cancelled):
+        """Returns (error or None, file count) of decrypting filename into dest_dir."""
+        file_count = 0
+        with GpgUtils.unlock_keys(info.key_ids, password, [filename]) as session:
+            passphrase = password if info.is_symmetric else session.passphrase
+
+            outcome = {}
+            read_fd, write_fd = os.pipe()
+
+            def decrypt():
+                try:
+                    with open(write_fd, 'wb') as dst, open(filename, 'rb') as src:
+                        outcome['result'] = GpgUtils.decrypt_stream(
+                            src, dst, passphrase,
+                            on_progress=on_progress,
+                            total_size=os.path.getsize(filename),
+                            is_cancelled=is_cancelled)
+                except Exception as error:
+                    outcome['error'] = error
+
+            decrypt_thread = threading.Thread(target=decrypt, daemon=True)
+            decrypt_thread.start()
+
+            extract_error = None
+            try:
+                with open(read_fd, 'rb') as src:
+                    file_count = extract_archive(src, dest_dir)
+
+                    # Let gpg finish so that its integrity check runs
+                    while src.read(GpgStream.DEFAULT_CHUNK_SIZE):
+                        pass
+            except (OSError, ValueError) as error:
+                extract_error = error
+            finally:
+                decrypt_thread.join()
+
+        result = outcome.get('result')
+        if result is not None and not result:
+            error = GpgUtils._get_stream_error(result)
+        elif extract_error is not None:
+            error = str(extract_error)
+        elif 'error' in outcome:
+            error = str(outcome['error'])
+        else:
+            error = None
 
-        return info
+        return error, file_count
 
+    # XXX: There's no good way though python3-gnupg to find out what
+    #      type of encryption is on a file
     @staticmethod
-    def verify_file(window, source_filename, signature_filename=None):
+    def get_encryped_file_info(filename):
+        # Only the session key packets at the front of the file are read
+        try:
+            with open(filename, 'rb') as encrypted_file:
+                key_ids, is_symmetric = read_session_key_info(encrypted_file)
+        except (OSError, PacketError) as error:
+            print("Invalid file!", error)
+            raise ValueError(f"Not a GPG-encrypted file: {filename}")
+
+        return EncryptedFileInfo(filename, is_symmetric, key_ids)
+
+    @staticmethod
+    def get_verify_cache():
+        global _VERIFY_CACHE
+
+        if _VERIFY_CACHE is None:
+            _VERIFY_CACHE = DiskCache(os.path.join(Config.get_cache_dir(), 'verify.sqlite'),
+                                      max_entries=VERIFY_CACHE_MAX_ENTRIES,
+                                      ttl=VERIFY_CACHE_TTL)
+
+        return _VERIFY_CACHE
+
+    @staticmethod
+    def get_keyring_state():
+        """Digest of the keyring files, changes on key import/deletion/trust updates."""
+        stamp = repr(_KEY_LIST_CACHE.get_keyring_stamp()).encode('utf-8')
+        return hashlib.sha256(stamp).hexdigest()
+
+    @staticmethod
+    def _get_verify_cache_key(source_filename, signature_filename):
+        signature_digest = hash_file(signature_filename) if signature_filename else ''
+
+        return ':'.join((hash_file(source_filename),
+                         signature_digest,
+                         GpgUtils.get_keyring_state()))
+
+    @staticmethod
+    def verify_file(source_filename, signature_filename=None, use_cache=False):
+        """Verify a detached (or, without signature_filename, inline) signature.
+
+        With use_cache, valid results are remembered on disk by content hash
+        and keyring state so re-verifying unchanged files skips gpg.
+        """
+        cache_key = None
+        if use_cache:
+            cache_key = GpgUtils._get_verify_cache_key(source_filename, signature_filename)
+            record = GpgUtils.get_verify_cache().get(cache_key)
+            if record is not None:
+                result = VerifyResult.from_dict(record, source_filename, signature_filename)
+                if not result.is_expired:
+                    print(f"Verification of {source_filename} found in cache")
+                    return result
+
         gpg = GpgUtils.get_gpg_keyring()
         print("Verifying file:", source_filename)
 
@@ -426,60 +1043,158 @@ class GpgUtils:
         print(" - Fingerprint:", verification.fingerprint)
         print(" - Key ID:", verification.key_id)
 
-        trust_level = None
-        username = None
         if verification.valid:
             print("Trust level:", verification.trust_text)
-            trust_level = verification.trust_level
-
             print("Username level:", verification.username)
-            username = verification.username
 
-        success_message = [f"File {source_filename} verified!",
-                           f"User: {username}",
-                           f"Trust = {verification.trust_text}"]
+        result = VerifyResult.from_verification(source_filename, signature_filename, verification)
+
+        # Only good signatures are cached; bad ones may just be missing a key
+        if cache_key and result.valid and not result.is_expired:
+            GpgUtils.get_verify_cache().put(cache_key, result.to_dict())
+
+        return result
+
+    @staticmethod
+    def find_signature(filename):
+        for suffix in Config.SIGNATURE_SUFFIXES:
+            if os.path.exists(filename + suffix):
+                return filename + suffix
+
+        return None
+
+    @staticmethod
+    def find_signature_pairs(paths, recursive=True):
+        """(data file, signature) pairs for files and directory trees.
+
+        Signatures are matched with the file next to them and data files
+        with their .sig/.asc sibling. A data file without one is paired with
+        None so its inline signature gets checked. Directories are only
+        searched for signatures, including their subdirectories unless
+        recursive is off.
+        """
+        pairs = []
+        seen = set()
+
+        def add(data_filename, signature_filename):
+            if data_filename not in seen:
+                seen.add(data_filename)
+                pairs.append((data_filename, signature_filename))
+
+        for path in paths:
+            if not os.path.isdir(path):
+                base, suffix = os.path.splitext(path)
+                if suffix in Config.SIGNATURE_SUFFIXES and os.path.exists(base):
+                    add(base, path)
+                else:
+                    add(path, GpgUtils.find_signature(path))
+                continue
+
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for filename in sorted(files):
+                    base, suffix = os.path.splitext(filename)
+                    if suffix in Config.SIGNATURE_SUFFIXES and base in files:
+                        add(os.path.join(root, base), os.path.join(root, filename))
+
+                if not recursive:
+                    break
+
+        return pairs
+
+    @staticmethod
+    def verify_files(pairs, jobs=None, is_cancelled=None, use_cache=False, io_limit=None):
+        """Verify many (data file, signature) pairs concurrently.
+
+        Plain filenames get their sibling signature. Returns a VerifyReport
+        with a VerifyResult per pair; errors become invalid results instead
+        of aborting the batch.
+        """
+        pairs = [(pair, GpgUtils.find_signature(pair)) if isinstance(pair, str) else tuple(pair)
+                 for pair in pairs]
+
+        def verify(pair):
+            filename, signature_filename = pair
+            try:
+                return GpgUtils.verify_file(filename, signature_filename, use_cache)
+            except Exception as error:
+                print(f"Failed to verify {filename}: {error}")
+                return VerifyResult(filename, signature_filename, error=str(error))
+
+        max_jobs = Config.get_max_jobs(jobs, io_limit)
+        print(f" - Jobs: {max_jobs}")
 
-        dialog_title = "Verified!"
-        message_text = '\n'.join(success_message)
-        message_type = Gtk.MessageType.INFO
+        return VerifyReport(parallel_map(verify, pairs, max_jobs, is_cancelled))
 
+    @staticmethod
+    def is_manifest(filename):
+        return is_manifest(filename)
+
+    @staticmethod
+    def verify_manifest(manifest_filename, signature_filename=None, jobs=None, use_cache=False,
+                        io_limit=None):
+        """Check a manifest's signature once, then re-hash the files it lists."""
+        verification = GpgUtils.verify_file(manifest_filename, signature_filename, use_cache)
         if not verification.valid:
-            dialog_title = "BAD SIGNATURE!"
-            message_text = f"Signature for {source_filename} was verified and it was bad!"
-            message_type = Gtk.MessageType.ERROR
-        elif not verification.trust_level:
-            dialog_title = "NOT VERIFIED!"
-            message_text = f"Signature for {source_filename} CANNOT be verified!\nIt was either not included or was bad!"
-            message_type = Gtk.MessageType.ERROR
-        elif verification.trust_level < verification.TRUST_MARGINAL:
-            dialog_title = "NOT TRUSTED ENOGUH!"
-            message_text = f"Signature for {source_filename} was verified but you don't trust it enough!"
-            message_type = Gtk.MessageType.ERROR
-
-        UiUtils.show_dialog(window,
-                            message_text,
-                            title=dialog_title,
-                            message_type=message_type)
-
-        return verification.valid
-
-    @staticmethod
-    def create_key(name, email, passphrase, key_type='RSA', key_length=4096):
+            return ManifestVerifyResult(verification)
+
+        files = []
+        for name, filename, status in check_manifest(manifest_filename,
+                                                     Config.get_max_jobs(jobs, io_limit)):
+            if status != STATUS_OK:
+                print(f" - {status}: {name}")
+
+            files.append(FileResult(filename,
+                                    output=manifest_filename,
+                                    success=status == STATUS_OK,
+                                    status=status))
+
+        return ManifestVerifyResult(verification, files)
+
+    @staticmethod
+    def create_key(name, email, passphrase, key_type='RSA', key_length=4096, key_curve=None):
+        # ECC keys (key_type='EDDSA', key_curve='ed25519') can only sign so
+        # they get an ECDH subkey for encryption
+        key_params = {'key_length': key_length}
+        if key_curve:
+            key_params = {'key_curve': key_curve,
+                          'subkey_type': 'ECDH',
+                          'subkey_curve': ECDH_CURVES.get(key_curve, key_curve)}
+
         gpg = GpgUtils.get_gpg_keyring()
         input_data = gpg.gen_key_input(
             key_type=key_type,
-            key_length=key_length,
             name_real=name,
             name_email=email,
             passphrase=passphrase,
+            **key_params,
         )
         key = gpg.gen_key(input_data)
+        GpgUtils.invalidate_key_cache()
         if not key.fingerprint:
             return None
         return key.fingerprint
 
+    @staticmethod
+    def is_key_password_cached(key_id, password):
+        # Memory only (no key lookup) so the UI can ask on the main loop
+        return _PASSPHRASE_CACHE.contains(key_id, password)
+
     @staticmethod
     def check_key_password(key_id, password):
+        # A signature per check is expensive (~100ms for RSA-4096) so
+        # passphrases that worked recently are remembered for a while
+        key = GpgUtils.get_key_by_id(key_id, secret=True)
+        fingerprint = key.fingerprint if key is not None and key.fingerprint else key_id
+        if _PASSPHRASE_CACHE.contains(fingerprint, password):
+            return True
+
+        # gpg signs with any passphrase while gpg-agent has the right one
+        # cached, so the agent has to forget it first. When it can't, a
+        # success isn't worth remembering
+        is_trusted = clear_passphrases(key.keygrips if key is not None else [],
+                                       GpgUtils.get_agent_socket)
+
         gpg = GpgUtils.get_gpg_keyring()
         signed_data = gpg.sign("check string",
                                keyid=key_id,
@@ -487,7 +1202,33 @@ class GpgUtils:
 
         if str(signed_data):
             print("Password is valid!")
+            if is_trusted:
+                _PASSPHRASE_CACHE.add(fingerprint, password, aliases=[key_id])
             return True
 
         # print("Password is NOT valid!")
         return False
+
+
+_INSTRUMENTATION = Instrumentation()
+if Config.get_trace_file():
+    _INSTRUMENTATION.enable_trace(Config.get_trace_file())
+
+# Resolved lazily so that the binary lookup happens once per process
+_KEYRING_POOL = KeyringPool(lambda: GpgUtils._find_gpg_binary(),
+                            on_create=_INSTRUMENTATION.attach)
+_KEY_LIST_CACHE = KeyListCache(Config.get_gnupg_home)
+_PASSPHRASE_CACHE = PassphraseCache()
+
+# Encryption subkey curves matching the signing curves
+ECDH_CURVES = {'ed25519': 'cv25519'}
+
+# Opt-in, created on first use by GpgUtils.get_verify_cache()
+VERIFY_CACHE_MAX_ENTRIES = 50000
+VERIFY_CACHE_TTL = 7 * 24 * 60 * 60
+_VERIFY_CACHE = None
+
+# Keyserver search answers, created on first use by GpgUtils.get_keyserver_cache()
+KEYSERVER_CACHE_MAX_ENTRIES = 10000
+KEYSERVER_CACHE_TTL = 24 * 60 * 60
+_KEYSERVER_CACHE = None
@@ -0,0 +1,390 @@
+# vim:ff=unix ts=4 sw=4 expandtab
+
+"""Timing and traffic records for every gpg run.
+
+Each run becomes a GpgCall which goes to the 'ez_gpg.gpg' logger, to an
+in-process MetricsRegistry and to any extra sinks, like a JSON lines trace
+file. Nothing here changes what gpg does; a failing sink only gets logged.
+"""
+
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+
+import gnupg
+
+STATUS_PREFIX = '[GNUPG:] '
+
+# Private python-gnupg (0.5.x) methods Instrumentation.attach() relies on
+GNUPG_HOOKS = ('_open_subprocess', '_handle_io', '_collect_output', '_get_fileobj')
+
+# First match wins, so commands that imply others come first
+OPERATIONS = (
+    ('--gen-key', 'gen_key'),
+    ('--quick-gen-key', 'gen_key'),
+    ('--delete-secret-and-public-key', 'delete_keys'),
+    ('--delete-secret-keys', 'delete_keys'),
+    ('--delete-keys', 'delete_keys'),
+    ('--recv-keys', 'recv_keys'),
+    ('--search-keys', 'search_keys'),
+    ('--refresh-keys', 'refresh_keys'),
+    ('--import', 'import'),
+    ('--export-secret-keys', 'export'),
+    ('--export', 'export'),
+    ('--list-secret-keys', 'list_keys'),
+    ('--list-keys', 'list_keys'),
+    ('--list-packets', 'list_packets'),
+    ('--verify', 'verify'),
+    ('--decrypt', 'decrypt'),
+    ('--encrypt', 'encrypt'),
+    ('--symmetric', 'encrypt'),
+    ('--detach-sign', 'sign'),
+    ('--clearsign', 'sign'),
+    ('--clear-sign', 'sign'),
+    ('--sign', 'sign'),
+    ('-s', 'sign'),
+    ('--version', 'version'),
+)
+
+
+def get_operation(args):
+    args = set(args)
+    for option, operation in OPERATIONS:
+        if option in args:
+            return operation
+
+    return 'other'
+
+
+def parse_status(stderr):
+    """Returns the (keyword, value) pairs of gpg's status lines in stderr."""
+    status = []
+    for line in (stderr or '').splitlines():
+        if line.startswith(STATUS_PREFIX):
+            keyword, _, value = line[len(STATUS_PREFIX):].partition(' ')
+            status.append((keyword, value))
+
+    return status
+
+
+class GpgCall:
+    """Measurements of a single gpg process."""
+
+    def __init__(self, operation, args):
+        self.operation = operation
+        self.args = list(args)
+        self.pid = None
+        self.start_time = time.time()
+        self.spawn_time = None
+        self.wall_time = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.returncode = None
+        self.status = []
+
+        self._started = time.monotonic()
+
+    def spawned(self, pid):
+        self.pid = pid
+        self.spawn_time = time.monotonic() - self._started
+
+    def finish(self, returncode, bytes_in=0, bytes_out=0, status=None):
+        self.wall_time = time.monotonic() - self._started
+        self.returncode = returncode
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out
+        self.status = list(status or [])
+
+    @property
+    def success(self):
+        return self.returncode == 0
+
+    def to_dict(self):
+        return {
+            'operation': self.operation,
+            'args': self.args,
+            'pid': self.pid,
+            'start_time': self.start_time,
+            'spawn_time': self.spawn_time,
+            'wall_time': self.wall_time,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'returncode': self.returncode,
+            'status': [f"{keyword} {value}".rstrip() for keyword, value in self.status],
+        }
+
+    def __repr__(self):
+        return (f"GpgCall({self.operation!r}, pid={self.pid}, returncode={self.returncode}, "
+                f"wall_time={self.wall_time})")
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def to_dict(self):
+        return {'value': self.value}
+
+
+class Histogram:
+    """Bucketed distribution of observed values (seconds by default)."""
+
+    # 1ms to ~65s, doubling
+    DEFAULT_BUCKETS = tuple(0.001 * 2 ** exponent for exponent in range(17))
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    def get_percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of values."""
+        with self._lock:
+            if not self.count:
+                return None
+
+            rank = fraction * self.count
+            seen = 0
+            for index, bucket_count in enumerate(self.bucket_counts):
+                seen += bucket_count
+                if seen >= rank and bucket_count:
+                    if index == len(self.buckets):
+                        return self.max
+                    return min(self.buckets[index], self.max)
+
+            return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.get_percentile(0.5),
+            'p95': self.get_percentile(0.95),
+            'buckets': dict(zip([str(bucket) for bucket in self.buckets] + ['inf'],
+                                self.bucket_counts)),
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name):
+        with self._lock:
+            if name not in self._counters:
+                self._counters[name] = Counter()
+
+            return self._counters[name]
+
+    def histogram(self, name):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram()
+
+            return self._histograms[name]
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = dict(self._histograms)
+
+        return {
+            'counters': {name: counter.value for name, counter in sorted(counters.items())},
+            'histograms': {name: histogram.to_dict()
+                           for name, histogram in sorted(histograms.items())},
+        }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+class JsonLinesTrace:
+    """Sink appending one JSON object per gpg run to a file."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._trace_file = None
+        self._lock = threading.Lock()
+
+    def __call__(self, call):
+        line = json.dumps(call.to_dict(), sort_keys=True) + '\n'
+        with self._lock:
+            if self._trace_file is None:
+                self._trace_file = open(self.filename, 'a', encoding='utf-8')
+
+            self._trace_file.write(line)
+            self._trace_file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._trace_file is not None:
+                self._trace_file.close()
+                self._trace_file = None
+
+
+class _CountingReader:
+    def __init__(self, stream):
+        self._stream = stream
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self.count += len(data)
+        return data
+
+
+class Instrumentation:
+    """Collects GpgCalls and fans them out to the log, metrics and sinks."""
+
+    def __init__(self, registry=None, logger=None):
+        self.metrics = registry or MetricsRegistry()
+        self.logger = logger or logging.getLogger('ez_gpg.gpg')
+        self._sinks = []
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink):
+        """sink gets every finished GpgCall, on the thread that ran gpg."""
+        with self._lock:
+            self._sinks.append(sink)
+
+        return sink
+
+    def remove_sink(self, sink):
+        with self._lock:
+            if sink in self._sinks:
+                self._sinks.remove(sink)
+
+        if hasattr(sink, 'close'):
+            sink.close()
+
+    def enable_trace(self, filename):
+        return self.add_sink(JsonLinesTrace(filename))
+
+    def record(self, call):
+        metrics = self.metrics
+        metrics.counter('gpg.calls').inc()
+        metrics.counter(f"gpg.calls.{call.operation}").inc()
+        if not call.success:
+            metrics.counter(f"gpg.failures.{call.operation}").inc()
+        metrics.counter('gpg.bytes_in').inc(call.bytes_in)
+        metrics.counter('gpg.bytes_out').inc(call.bytes_out)
+        if call.spawn_time is not None:
+            metrics.histogram('gpg.spawn_time').observe(call.spawn_time)
+        if call.wall_time is not None:
+            metrics.histogram(f"gpg.wall_time.{call.operation}").observe(call.wall_time)
+
+        log_level = logging.DEBUG if call.success else logging.INFO
+        if self.logger.isEnabledFor(log_level):
+            self.logger.log(log_level,
+                            "gpg %s (pid %s): exit %s, spawn %.1fms, wall %.1fms, "
+                            "%d bytes in, %d bytes out",
+                            call.operation, call.pid, call.returncode,
+                            (call.spawn_time or 0) * 1000, (call.wall_time or 0) * 1000,
+                            call.bytes_in, call.bytes_out)
+
+        with self._lock:
+            sinks = list(self._sinks)
+
+        for sink in sinks:
+            try:
+                sink(call)
+            except Exception as error:
+                self.logger.warning("Instrumentation sink %r failed: %s", sink, error)
+
+    def attach(self, gpg):
+        """Record every gpg run made through a gnupg.GPG instance.
+
+        python-gnupg has no hooks of its own so the private methods that
+        start gpg and collect its output are wrapped on this instance. If a
+        python-gnupg release doesn't have them, gpg is left uninstrumented.
+        """
+        missing = [name for name in GNUPG_HOOKS if not callable(getattr(gpg, name, None))]
+        if missing:
+            self.logger.warning("Not instrumenting gpg runs, python-gnupg %s lacks %s",
+                                getattr(gnupg, '__version__', '?'), ', '.join(missing))
+            return gpg
+
+        open_subprocess = gpg._open_subprocess
+        collect_output = gpg._collect_output
+        handle_io = gpg._handle_io
+        local = threading.local()
+
+        def instrumented_open_subprocess(args, *open_args, **open_kwargs):
+            call = GpgCall(get_operation(args), args)
+            process = open_subprocess(args, *open_args, **open_kwargs)
+            call.spawned(process.pid)
+            local.call = call
+            return process
+
+        def instrumented_handle_io(args, fileobj_or_path, result, *io_args, **io_kwargs):
+            fileobj = gpg._get_fileobj(fileobj_or_path)
+            local.reader = _CountingReader(fileobj)
+            try:
+                return handle_io(args, local.reader, result, *io_args, **io_kwargs)
+            finally:
+                local.reader = None
+                if fileobj is not fileobj_or_path:
+                    fileobj.close()
+
+        def instrumented_collect_output(process, result, *collect_args, **collect_kwargs):
+            try:
+                return collect_output(process, result, *collect_args, **collect_kwargs)
+            finally:
+                call = getattr(local, 'call', None)
+                local.call = None
+                if call is not None:
+                    reader = getattr(local, 'reader', None)
+                    call.finish(process.returncode,
+                                bytes_in=reader.count if reader else 0,
+                                bytes_out=_get_output_size(call.args, result),
+                                status=parse_status(getattr(result, 'stderr', '')))
+                    self.record(call)
+
+        gpg._open_subprocess = instrumented_open_subprocess
+        gpg._handle_io = instrumented_handle_io
+        gpg._collect_output = instrumented_collect_output
+
+        return gpg
+
+
+def _get_output_size(args, result):
+    data = getattr(result, 'data', None)
+    if data:
+        return len(data)
+
+    # Output written straight to a file by gpg
+    if '--output' in args:
+        index = args.index('--output') + 1
+        if index < len(args):
+            try:
+                return os.path.getsize(args[index])
+            except OSError:
+                pass
+
+    return 0
@@ -0,0 +1,71 @@
+# vim:ff=unix ts=4 sw=4 expandtab
+
+import os
+import threading
+
+from .keys import KeyIndex
+
+
+class KeyListCache:
+    """Caches key listings until the keyring changes on disk.
+
+    The keyring "stamp" is the (mtime, size) of the files gpg rewrites when
+    keys are imported, deleted or have their trust changed, so a stat() of a
+    handful of files replaces a `gpg --list-keys` run. Operations that we
+    perform ourselves also call invalidate() so that we don't depend on the
+    filesystem timestamp granularity.
+    """
+
+    KEYRING_FILES = ('pubring.kbx',
+                     'pubring.gpg',
+                     'secring.gpg',
+                     'trustdb.gpg',
+                     'private-keys-v1.d')
+
+    def __init__(self, homedir_resolver):
+        self._homedir_resolver = homedir_resolver
+        self._entries = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get_keyring_stamp(self):
+        homedir = self._homedir_resolver()
+
+        stamp = [homedir]
+        for filename in self.KEYRING_FILES:
+            try:
+                stat = os.stat(os.path.join(homedir, filename))
+            except OSError:
+                stamp.append(None)
+                continue
+
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+
+        return tuple(stamp)
+
+    def get_index(self, secret, loader):
+        stamp = self.get_keyring_stamp()
+
+        with self._lock:
+            entry = self._entries.get(secret)
+            if entry and entry[0] == stamp:
+                return entry[1]
+
+            generation = self._generation
+
+        key_index = KeyIndex(loader())
+
+        with self._lock:
+            # Don't store a listing that raced with an invalidation
+            if generation == self._generation:
+                self._entries[secret] = (stamp, key_index)
+
+        return key_index
+
+    def get(self, secret, loader):
+        return list(self.get_index(secret, loader))
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
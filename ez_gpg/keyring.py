@@ -0,0 +1,66 @@
+# vim:ff=unix ts=4 sw=4 expandtab
+
+import threading
+
+import gnupg  # Requires python3-gnupg
+
+
+class KeyringPool:
+    """Process-wide pool of configured gnupg.GPG instances.
+
+    Creating a gnupg.GPG object probes the gpg binary with a subprocess so
+    we build one per (binary, homedir, options) combination and hand the
+    same instance out to every caller. on_create gets every new instance.
+    """
+
+    DEFAULT_OPTIONS = ('--pinentry-mode', 'loopback')
+
+    def __init__(self, binary_resolver, on_create=None):
+        self._binary_resolver = binary_resolver
+        self._on_create = on_create
+        self._binary = None
+        self._keyrings = {}
+        self._lock = threading.RLock()
+
+    def get_binary(self):
+        with self._lock:
+            if self._binary is None:
+                self._binary = self._binary_resolver()
+
+            return self._binary
+
+    def get(self, homedir=None, options=DEFAULT_OPTIONS):
+        options = tuple(options or ())
+
+        with self._lock:
+            pool_key = (self.get_binary(), homedir, options)
+
+            keyring = self._keyrings.get(pool_key)
+            if keyring is None:
+                kwargs = {}
+                if homedir:
+                    kwargs['gnupghome'] = homedir
+
+                keyring = gnupg.GPG(gpgbinary=pool_key[0],
+                                    options=list(options),
+                                    **kwargs)
+                if self._on_create:
+                    self._on_create(keyring)
+                self._keyrings[pool_key] = keyring
+
+            return keyring
+
+    def invalidate(self, homedir=None):
+        """Drop pooled instances (all of them if no homedir is given)."""
+        with self._lock:
+            if homedir is None:
+                self._binary = None
+                self._keyrings.clear()
+                return
+
+            for pool_key in [key for key in self._keyrings if key[1] == homedir]:
+                del self._keyrings[pool_key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._keyrings)
@@ -0,0 +1,389 @@
+# vim:ff=unix ts=4 sw=4 expandtab
+
+import threading
+import time
+
+from .config import Config
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Guards the one-off Subkey construction in Key.subkeys; shared since it's
+# only ever held for a single key's worth of work
+_SUBKEYS_LOCK = threading.Lock()
+
+
+class _FrozenRecord:
+    __slots__ = ()
+
+    def _set(self, **fields):
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} is read-only")
+
+    @property
+    def is_revoked(self):
+        return self.validity == 'r'
+
+    @property
+    def is_expired(self):
+        if self.validity == 'e':
+            return True
+
+        return self.expires is not None and self.expires <= time.time()
+
+
+class Subkey(_FrozenRecord):
+    __slots__ = ('key_id', 'fingerprint', 'capabilities', 'algorithm',
+                 'length', 'created', 'expires', 'validity', 'keygrip')
+
+    def __init__(self, key_id, fingerprint=None, capabilities='', algorithm=None,
+                 length=None, created=None, expires=None, validity=None, keygrip=None):
+        self._set(key_id=key_id,
+                  fingerprint=fingerprint,
+                  capabilities=capabilities or '',
+                  algorithm=algorithm,
+                  length=length,
+                  created=created,
+                  expires=expires,
+                  validity=validity,
+                  keygrip=keygrip)
+
+    @staticmethod
+    def from_listing(subkey_row, subkey_info=None):
+        # python-gnupg rows are [keyid, capabilities, fingerprint, keygrip]
+        subkey_info = subkey_info or {}
+
+        return Subkey(subkey_row[0],
+                      fingerprint=subkey_row[2] if len(subkey_row) > 2 else None,
+                      capabilities=subkey_info.get('cap') or subkey_row[1],
+                      algorithm=_to_int(subkey_info.get('algo')),
+                      length=_to_int(subkey_info.get('length')),
+                      created=_to_int(subkey_info.get('date')),
+                      expires=_to_int(subkey_info.get('expires')),
+                      validity=subkey_info.get('trust'),
+                      keygrip=subkey_row[3] if len(subkey_row) > 3 else None)
+
+    @property
+    def can_encrypt(self):
+        return 'e' in self.capabilities
+
+    @property
+    def can_sign(self):
+        return 's' in self.capabilities
+
+    def to_dict(self):
+        return {
+            'key_id': self.key_id,
+            'fingerprint': self.fingerprint,
+            'capabilities': self.capabilities,
+            'algorithm': self.algorithm,
+            'length': self.length,
+            'created': self.created,
+            'expires': self.expires,
+            'validity': self.validity,
+        }
+
+    def __eq__(self, other):
+        if not isinstance(other, Subkey):
+            return NotImplemented
+
+        return (self.key_id, self.fingerprint) == (other.key_id, other.fingerprint)
+
+    def __hash__(self):
+        return hash((self.key_id, self.fingerprint))
+
+    def __repr__(self):
+        return f"Subkey({self.key_id!r}, capabilities={self.capabilities!r})"
+
+
+class Key(_FrozenRecord):
+    """A key from a gpg listing.
+
+    Subkeys are only turned into Subkey objects when first accessed (once,
+    even with several threads asking) and the display names are computed on
+    demand. Indexing and unpacking still work
+    like the old (key_id, key_name, friendly_name, subkey_ids, fingerprint)
+    tuples.
+    """
+
+    __slots__ = ('key_id', 'fingerprint', 'uids', 'capabilities', 'algorithm',
+                 'length', 'created', 'expires', 'validity', 'keygrip',
+                 '_subkey_rows', '_subkey_info', '_subkeys')
+
+    MAX_NAME_LENGTH = 60
+
+    def __init__(self, key_id, fingerprint, uids=(), capabilities='', algorithm=None,
+                 length=None, created=None, expires=None, validity=None, keygrip=None,
+                 subkeys=()):
+        self._set(key_id=key_id,
+                  fingerprint=fingerprint,
+                  uids=tuple(uids),
+                  capabilities=capabilities or '',
+                  algorithm=algorithm,
+                  length=length,
+                  created=created,
+                  expires=expires,
+                  validity=validity,
+                  keygrip=keygrip,
+                  _subkey_rows=(),
+                  _subkey_info=None,
+                  _subkeys=tuple(subkeys))
+
+    @staticmethod
+    def from_listing(listing):
+        key = Key(listing['keyid'],
+                  listing.get('fingerprint'),
+                  uids=listing.get('uids') or (),
+                  capabilities=listing.get('cap'),
+                  algorithm=_to_int(listing.get('algo')),
+                  length=_to_int(listing.get('length')),
+                  created=_to_int(listing.get('date')),
+                  expires=_to_int(listing.get('expires')),
+                  validity=listing.get('trust'),
+                  keygrip=listing.get('keygrip'))
+
+        key._set(_subkey_rows=tuple(listing.get('subkeys') or ()),
+                 _subkey_info=listing.get('subkey_info'),
+                 _subkeys=None)
+
+        return key
+
+    @property
+    def subkeys(self):
+        subkeys = self._subkeys
+        if subkeys is None:
+            with _SUBKEYS_LOCK:
+                subkeys = self._subkeys
+                if subkeys is None:
+                    subkey_info = self._subkey_info or {}
+                    subkeys = tuple(Subkey.from_listing(row, subkey_info.get(row[0]))
+                                    for row in self._subkey_rows)
+                    self._set(_subkeys=subkeys)
+
+        return subkeys
+
+    # The source rows are kept after subkeys is built, so these never race it
+
+    @property
+    def subkey_ids(self):
+        subkeys = self._subkeys
+        if subkeys is None:
+            return [row[0] for row in self._subkey_rows]
+
+        return [subkey.key_id for subkey in subkeys]
+
+    @property
+    def subkey_fingerprints(self):
+        subkeys = self._subkeys
+        if subkeys is None:
+            return [row[2] for row in self._subkey_rows if len(row) > 2 and row[2]]
+
+        return [subkey.fingerprint for subkey in subkeys if subkey.fingerprint]
+
+    @property
+    def keygrips(self):
+        """Keygrips of the primary key and all subkeys, as gpg-agent knows them."""
+        keygrips = [self.keygrip] + [subkey.keygrip for subkey in self.subkeys]
+
+        return [keygrip for keygrip in keygrips if keygrip]
+
+    @property
+    def name(self):
+        if not self.uids:
+            return ''
+
+        return self.uids[0]
+
+    @property
+    def key_name(self):
+        name = self.name
+        if len(name) > Key.MAX_NAME_LENGTH:
+            name = name[:Key.MAX_NAME_LENGTH] + '...'
+
+        return name
+
+    @property
+    def friendly_name(self):
+        return f"{self.key_name} |{self.key_id[-Config.KEY_ID_SIZE:]}|"
+
+    @property
+    def can_encrypt(self):
+        return 'E' in self.capabilities
+
+    @property
+    def can_sign(self):
+        return 'S' in self.capabilities
+
+    def to_dict(self):
+        return {
+            'key_id': self.key_id,
+            'fingerprint': self.fingerprint,
+            'uids': list(self.uids),
+            'capabilities': self.capabilities,
+            'algorithm': self.algorithm,
+            'length': self.length,
+            'created': self.created,
+            'expires': self.expires,
+            'validity': self.validity,
+            'subkeys': [subkey.to_dict() for subkey in self.subkeys],
+        }
+
+    def get_changes(self, newer):
+        """What a newer listing of this key adds: revocations, subkeys, user IDs, expiry.
+
+        Returns a dict that is empty when nothing changed.
+        """
+        changes = {}
+        if newer.is_revoked and not self.is_revoked:
+            changes['revoked'] = True
+
+        if newer.expires != self.expires:
+            changes['expires'] = [self.expires, newer.expires]
+
+        old_subkeys = {subkey.key_id: subkey for subkey in self.subkeys}
+        new_subkeys = [subkey.key_id for subkey in newer.subkeys
+                       if subkey.key_id not in old_subkeys]
+        if new_subkeys:
+            changes['new_subkeys'] = new_subkeys
+
+        revoked_subkeys = [subkey.key_id for subkey in newer.subkeys
+                           if subkey.is_revoked and subkey.key_id in old_subkeys and
+                           not old_subkeys[subkey.key_id].is_revoked]
+        if revoked_subkeys:
+            changes['revoked_subkeys'] = revoked_subkeys
+
+        new_uids = [uid for uid in newer.uids if uid not in self.uids]
+        if new_uids:
+            changes['new_uids'] = new_uids
+
+        return changes
+
+    # Compatibility with the old tuple API
+    def _as_tuple(self):
+        return (self.key_id,
+                self.key_name,
+                self.friendly_name,
+                self.subkey_ids,
+                self.fingerprint)
+
+    def __getitem__(self, index):
+        return self._as_tuple()[index]
+
+    def __iter__(self):
+        return iter(self._as_tuple())
+
+    def __len__(self):
+        return 5
+
+    def __eq__(self, other):
+        if isinstance(other, tuple):
+            return self._as_tuple() == other
+
+        if not isinstance(other, Key):
+            return NotImplemented
+
+        return (self.key_id, self.fingerprint) == (other.key_id, other.fingerprint)
+
+    def __hash__(self):
+        return hash((self.key_id, self.fingerprint))
+
+    def __repr__(self):
+        return f"Key({self.key_id!r}, {self.key_name!r})"
+
+
+class KeyIndex:
+    """Lookup table over a single key listing.
+
+    Every primary key ID, fingerprint and subkey ID is indexed along with its
+    long (16) and short (8) hex suffixes so that resolving a recipient ID
+    from an encrypted file or a user-entered ID is a dictionary hit instead
+    of a scan over every key and subkey.
+    """
+
+    SUFFIX_LENGTHS = (8, 16)
+
+    def __init__(self, keys):
+        self._keys = list(keys)
+        self._by_id = {}
+
+        for key in self._keys:
+            for key_id in self._get_key_ids(key):
+                for lookup_id in self._get_lookup_ids(key_id):
+                    matches = self._by_id.setdefault(lookup_id, [])
+                    if not any(match is key for match in matches):
+                        matches.append(key)
+
+    @staticmethod
+    def _get_key_ids(key):
+        return [key.key_id, key.fingerprint] + key.subkey_ids + key.subkey_fingerprints
+
+    @staticmethod
+    def _get_lookup_ids(key_id):
+        key_id = KeyIndex.normalize_id(key_id)
+        if not key_id:
+            return []
+
+        lookup_ids = {key_id}
+        for suffix_length in KeyIndex.SUFFIX_LENGTHS:
+            if len(key_id) > suffix_length:
+                lookup_ids.add(key_id[-suffix_length:])
+
+        return lookup_ids
+
+    @staticmethod
+    def normalize_id(key_id):
+        if not key_id:
+            return ''
+
+        key_id = key_id.strip().upper()
+        if key_id.startswith('0X'):
+            key_id = key_id[2:]
+
+        return key_id.replace(' ', '')
+
+    def get_all(self, key_id):
+        key_id = KeyIndex.normalize_id(key_id)
+
+        matches = self._by_id.get(key_id)
+        if matches is None and len(key_id) > KeyIndex.SUFFIX_LENGTHS[-1]:
+            # Full fingerprint of a subkey that we only know by its ID
+            matches = self._by_id.get(key_id[-KeyIndex.SUFFIX_LENGTHS[-1]:])
+
+        return list(matches or [])
+
+    def get(self, key_id, default=None):
+        matches = self.get_all(key_id)
+        if not matches:
+            return default
+
+        return matches[0]
+
+    def find_recipients(self, recipient_ids):
+        """Keys able to decrypt for any of the given recipient IDs, in order."""
+        found = []
+        for recipient_id in recipient_ids:
+            for key in self.get_all(recipient_id):
+                if not any(match is key for match in found):
+                    found.append(key)
+
+        return found
+
+    def __contains__(self, key_id):
+        return bool(self.get_all(key_id))
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
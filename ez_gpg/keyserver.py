@@ -0,0 +1,574 @@
+# vim:ff=unix ts=4 sw=4 expandtab
+
+"""Concurrent key lookups over HKP/HKPS and WKD.
+
+Every configured keyserver (plus the WKD locations for email queries) is
+asked at the same time. The first response that passes validation wins and
+the other requests are cancelled, so a lookup takes as long as the fastest
+live server instead of the slowest dead one. Searches (HKP op=index) ask
+all servers too but merge what each of them knows. Only the standard
+library is used: a minimal HTTP/1.1 client runs on asyncio streams so that
+timeouts and cancellation actually close the connections.
+"""
+
+import asyncio
+import hashlib
+import ssl
+import urllib.parse
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_RETRIES = 2
+RETRY_DELAY = 0.5
+
+# Bulk fetches: keys in flight at once and requests per second per host
+DEFAULT_JOBS = 16
+DEFAULT_RATE = 10
+
+MAX_RESPONSE_SIZE = 16 * 1024 * 1024
+MAX_REDIRECTS = 3
+MAX_HEADER_LINE = 8192
+
+USER_AGENT = 'ezgpg'
+
+# Bare hostnames are HKP like they are for gpg
+DEFAULT_SCHEME = 'hkp'
+SCHEMES = {
+    'hkp': ('http', 11371),
+    'hkps': ('https', 443),
+    'http': ('http', 80),
+    'https': ('https', 443),
+}
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+ARMOR_HEADER = b'-----BEGIN PGP PUBLIC KEY BLOCK-----'
+
+ZBASE32_ALPHABET = 'ybndrfg8ejkmcpqxot1uwisza345h769'
+
+
+class KeyserverError(RuntimeError):
+    pass
+
+
+class KeyNotFoundError(KeyserverError):
+    pass
+
+
+class _RetryableError(KeyserverError):
+    pass
+
+
+def normalize_query(query):
+    """Key IDs and fingerprints lose their 0x and get upper-cased; emails stay as is."""
+    query = query.strip()
+    if '@' in query:
+        return query
+
+    if query[:2].lower() == '0x':
+        query = query[2:]
+
+    return query.replace(' ', '').upper()
+
+
+def is_email(query):
+    return '@' in query
+
+
+def is_fingerprint(query):
+    """v4 (40) and v5 (64) fingerprints identify a key; shorter IDs can collide."""
+    query = normalize_query(query)
+    return len(query) in (40, 64) and all(char in '0123456789ABCDEF' for char in query)
+
+
+def _format_host(host):
+    return f"[{host}]" if ':' in host else host
+
+
+def get_keyserver_base(keyserver):
+    """http(s)://host:port for a keyserver given as hostname or hkp(s)/http(s) URL."""
+    if '://' not in keyserver:
+        keyserver = f"{DEFAULT_SCHEME}://{keyserver}"
+
+    parts = urllib.parse.urlsplit(keyserver)
+    if parts.scheme not in SCHEMES or not parts.hostname:
+        raise KeyserverError(f"Unsupported keyserver: {keyserver}")
+
+    scheme, default_port = SCHEMES[parts.scheme]
+    return f"{scheme}://{_format_host(parts.hostname)}:{parts.port or default_port}"
+
+
+def get_lookup_url(keyserver, query, operation='get'):
+    query = normalize_query(query)
+    search = query if is_email(query) else f"0x{query}"
+    parameters = urllib.parse.urlencode({'op': operation, 'options': 'mr', 'search': search})
+
+    return f"{get_keyserver_base(keyserver)}/pks/lookup?{parameters}"
+
+
+def zbase32_encode(data):
+    bits = ''.join(f"{byte:08b}" for byte in data)
+    bits += '0' * (-len(bits) % 5)
+
+    return ''.join(ZBASE32_ALPHABET[int(bits[index:index + 5], 2)]
+                   for index in range(0, len(bits), 5))
+
+
+def get_wkd_urls(email):
+    """Advanced and direct Web Key Directory URLs for email."""
+    local_part, _, domain = email.rpartition('@')
+    domain = domain.lower()
+    local_hash = zbase32_encode(hashlib.sha1(local_part.lower().encode('utf-8')).digest())
+    parameters = urllib.parse.urlencode({'l': local_part})
+
+    return [f"https://openpgpkey.{domain}/.well-known/openpgpkey/{domain}/hu/"
+            f"{local_hash}?{parameters}",
+            f"https://{domain}/.well-known/openpgpkey/hu/{local_hash}?{parameters}"]
+
+
+def looks_like_key(data, query=None):
+    """Cheap check that data is an armored key block or binary public key packets."""
+    if not data:
+        return False
+
+    if data.lstrip().startswith(ARMOR_HEADER) or ARMOR_HEADER in data[:4096]:
+        return True
+
+    # Binary data starts with a public key packet (tag 6), old or new format
+    first = data[0]
+    if not first & 0x80:
+        return False
+
+    tag = first & 0x3f if first & 0x40 else (first >> 2) & 0x0f
+    return tag == 6
+
+
+async def _read_line(reader):
+    line = await reader.readline()
+    if len(line) > MAX_HEADER_LINE:
+        raise KeyserverError("Response header too long")
+
+    return line
+
+
+async def _read_body(reader, headers, max_size):
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        body = bytearray()
+        while True:
+            size_line = await _read_line(reader)
+            size = int(size_line.split(b';')[0].strip() or b'0', 16)
+            if size == 0:
+                break
+            if len(body) + size > max_size:
+                raise KeyserverError("Response too large")
+            body += await reader.readexactly(size)
+            await reader.readline()
+
+        return bytes(body)
+
+    if 'content-length' in headers:
+        size = int(headers['content-length'])
+        if size > max_size:
+            raise KeyserverError("Response too large")
+
+        return await reader.readexactly(size)
+
+    body = await reader.read(max_size + 1)
+    if len(body) > max_size:
+        raise KeyserverError("Response too large")
+
+    return body
+
+
+async def _request(url, ssl_context, max_size):
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        raise KeyserverError(f"Unsupported URL: {url}")
+
+    is_https = parts.scheme == 'https'
+    port = parts.port or (443 if is_https else 80)
+    reader, writer = await asyncio.open_connection(
+        parts.hostname, port,
+        ssl=(ssl_context or ssl.create_default_context()) if is_https else None)
+    try:
+        path = parts.path or '/'
+        if parts.query:
+            path += f"?{parts.query}"
+
+        writer.write((f"GET {path} HTTP/1.1\r\n"
+                      f"Host: {parts.netloc}\r\n"
+                      f"User-Agent: {USER_AGENT}\r\n"
+                      f"Accept: */*\r\n"
+                      f"Connection: close\r\n\r\n").encode('ascii'))
+        await writer.drain()
+
+        status_line = (await _read_line(reader)).decode('iso-8859-1').split(None, 2)
+        if len(status_line) < 2 or not status_line[0].startswith('HTTP/'):
+            raise KeyserverError("Invalid HTTP response")
+
+        headers = {}
+        while True:
+            line = (await _read_line(reader)).decode('iso-8859-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        return int(status_line[1]), headers, await _read_body(reader, headers, max_size)
+    finally:
+        writer.close()
+
+
+async def http_get(url, timeout=DEFAULT_TIMEOUT, ssl_context=None,
+                   max_size=MAX_RESPONSE_SIZE):
+    """GET url and return (status, body), following a few redirects.
+
+    The timeout covers the whole exchange including redirects.
+    """
+    async def get(url):
+        for _ in range(MAX_REDIRECTS + 1):
+            status, headers, body = await _request(url, ssl_context, max_size)
+            if status not in REDIRECT_CODES or 'location' not in headers:
+                return status, body
+
+            url = urllib.parse.urljoin(url, headers['location'])
+
+        raise KeyserverError("Too many redirects")
+
+    return await asyncio.wait_for(get(url), timeout)
+
+
+class SearchResult:
+    """A key listed by a keyserver search (one `pub` record of HKP's mr index)."""
+
+    def __init__(self, key_id, algorithm=None, key_length=None, created=None, expires=None,
+                 flags='', uids=None, keyservers=None):
+        self.key_id = key_id.upper()
+        self.algorithm = algorithm
+        self.key_length = key_length
+        self.created = created
+        self.expires = expires
+        self.flags = flags
+        self.uids = list(uids or [])
+        self.keyservers = list(keyservers or [])
+
+    @property
+    def fingerprint(self):
+        """The full fingerprint if the server listed one (v4: 40 hex digits)."""
+        return self.key_id if len(self.key_id) >= 40 else None
+
+    @property
+    def is_revoked(self):
+        return 'r' in self.flags
+
+    @property
+    def is_expired(self):
+        return 'e' in self.flags
+
+    def to_dict(self):
+        return {
+            'key_id': self.key_id,
+            'fingerprint': self.fingerprint,
+            'algorithm': self.algorithm,
+            'key_length': self.key_length,
+            'created': self.created,
+            'expires': self.expires,
+            'flags': self.flags,
+            'revoked': self.is_revoked,
+            'expired': self.is_expired,
+            'uids': self.uids,
+            'keyservers': self.keyservers,
+        }
+
+    @staticmethod
+    def from_dict(record):
+        return SearchResult(record['key_id'], record['algorithm'], record['key_length'],
+                            record['created'], record['expires'], record['flags'],
+                            record['uids'], record['keyservers'])
+
+    def __repr__(self):
+        return f"SearchResult({self.key_id!r}, uids={self.uids!r})"
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_index(data, keyserver=None):
+    """SearchResults from an HKP machine-readable (options=mr) index response."""
+    results = []
+    for line in data.decode('utf-8', 'replace').splitlines():
+        fields = line.strip().split(':')
+        if fields[0] == 'pub' and len(fields) > 1 and fields[1]:
+            fields += [''] * (7 - len(fields))
+            results.append(SearchResult(fields[1], _to_int(fields[2]), _to_int(fields[3]),
+                                        _to_int(fields[4]), _to_int(fields[5]), fields[6],
+                                        keyservers=[keyserver] if keyserver else []))
+        elif fields[0] == 'uid' and len(fields) > 1 and results:
+            results[-1].uids.append(urllib.parse.unquote(fields[1]))
+
+    return results
+
+
+def merge_search_results(result_lists):
+    """Merge what several servers listed, keyed by key ID, in first-seen order."""
+    merged = {}
+    for results in result_lists:
+        for result in results:
+            known = merged.get(result.key_id)
+            if known is None:
+                merged[result.key_id] = SearchResult.from_dict(result.to_dict())
+                continue
+
+            known.flags = ''.join(sorted(set(known.flags + result.flags)))
+            known.uids += [uid for uid in result.uids if uid not in known.uids]
+            known.keyservers += [keyserver for keyserver in result.keyservers
+                                 if keyserver not in known.keyservers]
+
+    return list(merged.values())
+
+
+class HostRateLimiter:
+    """Spaces out request starts so no host gets more than `rate` per second.
+
+    Only for use from a single event loop; a falsy rate disables it.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next_slots = {}
+
+    async def wait(self, url):
+        if not self.interval:
+            return
+
+        host = urllib.parse.urlsplit(url).netloc
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slots.get(host, now))
+        self._next_slots[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class FetchedKey:
+    """Key data a lookup returned and where it came from."""
+
+    def __init__(self, source, data):
+        self.source = source
+        self.data = data
+
+    def __repr__(self):
+        return f"FetchedKey({self.source!r}, {len(self.data)} bytes)"
+
+
+class KeyFetcher:
+    """Races a key lookup across keyservers (and WKD for email queries).
+
+    Every source gets `timeout` seconds per attempt and `retries` more
+    attempts after connection errors, timeouts and 5xx/429 responses.
+    `validate(data, query)` decides whether a response is usable; it runs
+    in a worker thread so it may call out to gpg. Search answers go into
+    `cache` (anything with DiskCache's get/put) keyed by server and query.
+    """
+
+    def __init__(self, keyservers, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 use_wkd=True, validate=looks_like_key, ssl_context=None,
+                 retry_delay=RETRY_DELAY, cache=None):
+        self.keyservers = list(keyservers)
+        self.timeout = timeout
+        self.retries = retries
+        self.use_wkd = use_wkd
+        self.retry_delay = retry_delay
+        self._validate = validate
+        self._ssl_context = ssl_context
+        self._cache = cache
+
+    def get_sources(self, query):
+        query = normalize_query(query)
+        sources = []
+        if self.use_wkd and is_email(query):
+            sources += get_wkd_urls(query)
+
+        sources += [get_lookup_url(keyserver, query) for keyserver in self.keyservers]
+
+        return sources
+
+    def fetch(self, query):
+        """Blocking fetch for callers that don't run an event loop."""
+        return asyncio.run(self.fetch_async(query))
+
+    async def fetch_async(self, query):
+        query = normalize_query(query)
+        tasks = [asyncio.ensure_future(self._fetch_from(url, query))
+                 for url in self.get_sources(query)]
+        if not tasks:
+            raise KeyserverError("No keyservers configured")
+
+        errors = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    return await next_done
+                except KeyserverError as error:
+                    errors.append(str(error))
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if all(isinstance(task.exception(), KeyNotFoundError)
+               for task in tasks if not task.cancelled()):
+            raise KeyNotFoundError(f"'{query}' not found: " + '; '.join(errors))
+
+        raise KeyserverError(f"Could not fetch '{query}': " + '; '.join(errors))
+
+    def fetch_all(self, queries, on_fetched, jobs=DEFAULT_JOBS, rate=DEFAULT_RATE,
+                  is_cancelled=None):
+        """Blocking fetch_all_async for callers that don't run an event loop."""
+        return asyncio.run(self.fetch_all_async(queries, on_fetched, jobs, rate, is_cancelled))
+
+    async def fetch_all_async(self, queries, on_fetched, jobs=DEFAULT_JOBS, rate=DEFAULT_RATE,
+                              is_cancelled=None):
+        """Fetch many keys with at most `jobs` in flight, calling on_fetched as they arrive.
+
+        Unlike fetch_async the servers are not raced: each key tries them in
+        turn, starting from a different one for every key, so a bulk run
+        spreads its load instead of multiplying it. on_fetched(query, fetched,
+        error) gets a FetchedKey or the KeyserverError of each query, where
+        KeyNotFoundError means no server had it. on_fetched runs on a worker
+        thread, so it can write to disk without holding up the other fetches.
+        Queries not started once is_cancelled() turns true are skipped.
+        """
+        if not self.keyservers:
+            raise KeyserverError("No keyservers configured")
+
+        semaphore = asyncio.Semaphore(max(1, jobs))
+        rate_limiter = HostRateLimiter(rate)
+        loop = asyncio.get_running_loop()
+
+        async def fetch(index, query):
+            async with semaphore:
+                if is_cancelled and is_cancelled():
+                    return
+
+                query = normalize_query(query)
+                start = index % len(self.keyservers)
+                keyservers = self.keyservers[start:] + self.keyservers[:start]
+
+                fetched = None
+                errors = []
+                for keyserver in keyservers:
+                    try:
+                        fetched = await self._fetch_from(get_lookup_url(keyserver, query), query,
+                                                         rate_limiter=rate_limiter)
+                        break
+                    except KeyserverError as error:
+                        errors.append(error)
+
+            if fetched is not None:
+                error = None
+            elif all(isinstance(error, KeyNotFoundError) for error in errors):
+                error = KeyNotFoundError(f"'{query}' not found")
+            else:
+                error = KeyserverError(f"Could not fetch '{query}': " +
+                                       '; '.join(str(error) for error in errors))
+
+            await loop.run_in_executor(None, on_fetched, query, fetched, error)
+
+        await asyncio.gather(*[fetch(index, query) for index, query in enumerate(queries)])
+
+    def search(self, query):
+        """Blocking search for callers that don't run an event loop."""
+        return asyncio.run(self.search_async(query))
+
+    async def search_async(self, query):
+        """List every key the keyservers know for query, without importing anything.
+
+        Servers that fail are skipped; KeyserverError is only raised when
+        none of them answered.
+        """
+        query = normalize_query(query)
+        if not self.keyservers:
+            raise KeyserverError("No keyservers configured")
+
+        answers = await asyncio.gather(*[self._search_server(keyserver, query)
+                                         for keyserver in self.keyservers],
+                                       return_exceptions=True)
+
+        errors = [answer for answer in answers if isinstance(answer, BaseException)]
+        for error in errors:
+            if not isinstance(error, KeyserverError):
+                raise error
+
+        if len(errors) == len(answers):
+            raise KeyserverError(f"Could not search for '{query}': " +
+                                 '; '.join(str(error) for error in errors))
+
+        return merge_search_results(answer for answer in answers
+                                    if not isinstance(answer, BaseException))
+
+    @staticmethod
+    def get_cache_key(keyserver, query):
+        return f"{get_keyserver_base(keyserver)} {normalize_query(query)}"
+
+    async def _search_server(self, keyserver, query):
+        cache_key = self.get_cache_key(keyserver, query)
+        if self._cache is not None:
+            records = self._cache.get(cache_key)
+            if records is not None:
+                return [SearchResult.from_dict(record) for record in records]
+
+        url = get_lookup_url(keyserver, query, 'index')
+        try:
+            body = await self._fetch_from(url, query, validate=False)
+            results = parse_index(body, keyserver)
+        except KeyNotFoundError:
+            results = []
+
+        if self._cache is not None:
+            self._cache.put(cache_key, [result.to_dict() for result in results])
+
+        return results
+
+    async def _fetch_from(self, url, query, validate=True, rate_limiter=None):
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+            if rate_limiter is not None:
+                await rate_limiter.wait(url)
+
+            try:
+                return await self._fetch_once(url, query, validate)
+            except _RetryableError as error:
+                last_error = error
+            except (OSError, EOFError, asyncio.TimeoutError) as error:
+                # EOFError: connection dropped mid-response
+                last_error = KeyserverError(f"{url}: {str(error) or 'timed out'}")
+            except ValueError as error:
+                raise KeyserverError(f"{url}: invalid response ({error})")
+
+        raise KeyserverError(str(last_error))
+
+    async def _fetch_once(self, url, query, validate=True):
+        status, body = await http_get(url, self.timeout, self._ssl_context)
+        if status == 404:
+            raise KeyNotFoundError(f"{url}: not found")
+
+        if status == 429 or status >= 500:
+            raise _RetryableError(f"{url}: HTTP {status}")
+
+        if status != 200:
+            raise KeyserverError(f"{url}: HTTP {status}")
+
+        if not validate:
+            return body
+
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(None, self._validate, body, query):
+            raise KeyserverError(f"{url}: no matching key in response")
+
+        return FetchedKey(url, body)
@@ -0,0 +1,192 @@
+# vim:ff=unix ts=4 sw=4 expandtab
+
+"""SHA256SUMS style checksum manifests.
+
+Manifests are written canonically so that the same tree always produces
+the same bytes: entries are sorted by name, names use '/' separators and
+lines end in LF. The format is the one `sha256sum` writes and `sha256sum -c`
+reads, including its backslash escaping of odd file names.
+"""
+
+import hashlib
+import multiprocessing
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+from .executor import parallel_map
+
+HASH_BUFFER_SIZE = 1024 * 1024
+
+MANIFEST_NAME = 'SHA256SUMS'
+MANIFEST_SUFFIXES = ('.sha256', '.sha256sum')
+
+# Below this many files worker start-up costs more than it saves; hashlib
+# drops the GIL for big updates so threads still hash in parallel
+PROCESS_POOL_THRESHOLD = 64
+PROCESS_POOL_CHUNK_SIZE = 16
+
+STATUS_OK = 'OK'
+STATUS_MISMATCH = 'MISMATCH'
+STATUS_MISSING = 'MISSING'
+
+
+def hash_file(filename, buffer_size=HASH_BUFFER_SIZE):
+    digest = hashlib.sha256()
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+
+    with open(filename, 'rb', buffering=0) as source_file:
+        while True:
+            size = source_file.readinto(buffer)
+            if not size:
+                break
+
+            digest.update(view[:size])
+
+    return digest.hexdigest()
+
+
+def _try_hash_file(filename):
+    try:
+        return hash_file(filename), None
+    except OSError as error:
+        return None, error
+
+
+def hash_files(filenames, max_workers=1):
+    """Returns (sha256, error) for every filename, in order.
+
+    Big sets are spread over a process pool. It uses 'spawn' since forking
+    a process that is running GTK and worker threads isn't safe.
+    """
+    filenames = list(filenames)
+    if max_workers <= 1 or len(filenames) < PROCESS_POOL_THRESHOLD:
+        return parallel_map(_try_hash_file, filenames, max_workers)
+
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+        return list(executor.map(_try_hash_file, filenames, chunksize=PROCESS_POOL_CHUNK_SIZE))
+
+
+def is_manifest(filename):
+    basename = os.path.basename(filename)
+    return basename == MANIFEST_NAME or basename.endswith(MANIFEST_SUFFIXES)
+
+
+def get_manifest_name(filename, base_dir):
+    # sha256sum -c resolves names relative to the manifest's directory
+    name = os.path.relpath(os.path.abspath(filename), os.path.abspath(base_dir))
+    return name.replace(os.sep, '/')
+
+
+def _escape_name(name):
+    return name.replace('\\', '\\\\').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _unescape_name(name):
+    result = []
+    characters = iter(name)
+    for character in characters:
+        if character == '\\':
+            escaped = next(characters, '')
+            character = {'n': '\n', 'r': '\r'}.get(escaped, escaped)
+        result.append(character)
+
+    return ''.join(result)
+
+
+def format_manifest(entries):
+    """Render (name, sha256) pairs in canonical `sha256sum` format."""
+    lines = []
+    for name, digest in sorted(entries, key=lambda entry: entry[0].encode('utf-8')):
+        escaped_name = _escape_name(name)
+        prefix = '\\' if escaped_name != name else ''
+        lines.append(f"{prefix}{digest}  {escaped_name}\n")
+
+    return ''.join(lines)
+
+
+def parse_manifest(text):
+    """Parse `sha256sum` output into (name, sha256) pairs.
+
+    Raises ValueError on lines that aren't checksum entries.
+    """
+    entries = []
+    for line_number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+
+        is_escaped = line.startswith('\\')
+        if is_escaped:
+            line = line[1:]
+
+        digest, separator, name = line.partition(' ')
+        if len(digest) != 64 or not separator or not name or name[0] not in ' *':
+            raise ValueError(f"Invalid manifest line {line_number}")
+
+        try:
+            int(digest, 16)
+        except ValueError:
+            raise ValueError(f"Invalid checksum on manifest line {line_number}")
+
+        name = name[1:]
+        if is_escaped:
+            name = _unescape_name(name)
+
+        entries.append((name, digest.lower()))
+
+    return entries
+
+
+def read_manifest(manifest_filename):
+    with open(manifest_filename, 'r', encoding='utf-8', newline='') as manifest_file:
+        return parse_manifest(manifest_file.read())
+
+
+def write_manifest(filenames, manifest_filename, max_workers=1):
+    """Hash filenames and write them to manifest_filename.
+
+    Returns (entries, failures) where entries are the (name, sha256) pairs
+    written and failures are (filename, error) pairs for unreadable files.
+    """
+    filenames = list(filenames)
+    base_dir = os.path.dirname(os.path.abspath(manifest_filename))
+
+    entries = []
+    failures = []
+    for filename, (digest, error) in zip(filenames, hash_files(filenames, max_workers)):
+        if error is not None:
+            failures.append((filename, error))
+        else:
+            entries.append((get_manifest_name(filename, base_dir), digest))
+
+    with open(manifest_filename, 'w', encoding='utf-8', newline='\n') as manifest_file:
+        manifest_file.write(format_manifest(entries))
+
+    return sorted(entries, key=lambda entry: entry[0].encode('utf-8')), failures
+
+
+def check_manifest(manifest_filename, max_workers=1):
+    """Re-hash every file listed in the manifest.
+
+    Returns (name, filename, status) triples in manifest order, with
+    STATUS_OK, STATUS_MISMATCH or STATUS_MISSING as the status.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_filename))
+    entries = read_manifest(manifest_filename)
+    filenames = [os.path.join(base_dir, *name.split('/')) for name, _ in entries]
+
+    checked = []
+    for (name, expected), filename, (digest, error) in zip(entries, filenames,
+                                                            hash_files(filenames, max_workers)):
+        if error is not None:
+            status = STATUS_MISSING
+        elif digest != expected:
+            status = STATUS_MISMATCH
+        else:
+            status = STATUS_OK
+
+        checked.append((name, filename, status))
+
+    return checked
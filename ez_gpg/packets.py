@@ -0,0 +1,246 @@
+# vim:ff=unix ts=4 sw=4 expandtab
+
+"""Minimal OpenPGP (RFC 4880 / RFC 9580) packet reader.
+
+Only the session key packets at the start of an encrypted message are
+parsed. Reading stops at the first encrypted data packet so inspecting a
+file costs a few hundred bytes of I/O no matter how big it is.
+"""
+
+import binascii
+
+TAG_PKESK = 1
+TAG_SKESK = 3
+TAG_SED = 9
+TAG_MARKER = 10
+TAG_SEIPD = 18
+TAG_AEAD = 20
+
+ENCRYPTED_DATA_TAGS = (TAG_SED, TAG_SEIPD, TAG_AEAD)
+
+ARMOR_HEADER = b'-----BEGIN PGP MESSAGE-----'
+
+# Session key packets are tiny; anything bigger means we're reading garbage
+MAX_SESSION_KEY_PACKET_SIZE = 64 * 1024
+MAX_ARMOR_PREAMBLE = 4096
+
+
+class PacketError(ValueError):
+    pass
+
+
+class _ArmorReader:
+    """File-like reader decoding ASCII armor one line at a time."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._buffer = b''
+        self._pending = b''
+        self._done = False
+
+        # Armor headers ("Version: ...") run up to the first blank line
+        while True:
+            line = stream.readline(MAX_ARMOR_PREAMBLE).strip()
+            if not line:
+                break
+
+            if b':' not in line:
+                self._pending = line
+                break
+
+    def _decode_line(self, line):
+        if not line or line.startswith(b'=') or line.startswith(b'-----'):
+            self._done = True
+            return
+
+        data = self._pending + line
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        try:
+            self._buffer += binascii.a2b_base64(data[:usable])
+        except binascii.Error:
+            raise PacketError("Invalid ASCII armor")
+
+    def read(self, size):
+        if self._pending and not self._buffer:
+            pending, self._pending = self._pending, b''
+            self._decode_line(pending)
+
+        while len(self._buffer) < size and not self._done:
+            self._decode_line(self._stream.readline(MAX_ARMOR_PREAMBLE).strip())
+
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _read_exactly(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise PacketError("Truncated OpenPGP packet")
+
+    return data
+
+
+def _read_new_length(stream):
+    """Returns (length, is_partial) for a new format length."""
+    first = _read_exactly(stream, 1)[0]
+    if first < 192:
+        return first, False
+
+    if first < 224:
+        return ((first - 192) << 8) + _read_exactly(stream, 1)[0] + 192, False
+
+    if first == 255:
+        return int.from_bytes(_read_exactly(stream, 4), 'big'), False
+
+    return 1 << (first & 0x1f), True
+
+
+def read_packet_header(stream):
+    """Returns (tag, length, is_partial) or None at the end of the stream.
+
+    A length of None means the packet runs to the end of the stream (old
+    format indeterminate length).
+    """
+    header = stream.read(1)
+    if not header:
+        return None
+
+    header = header[0]
+    if not header & 0x80:
+        raise PacketError("Not an OpenPGP packet")
+
+    if header & 0x40:
+        length, is_partial = _read_new_length(stream)
+        return header & 0x3f, length, is_partial
+
+    tag = (header >> 2) & 0x0f
+    length_type = header & 0x03
+    if length_type == 3:
+        return tag, None, False
+
+    length_size = 1 << length_type
+    return tag, int.from_bytes(_read_exactly(stream, length_size), 'big'), False
+
+
+def _read_body(stream, length, is_partial):
+    body = b''
+    while True:
+        if len(body) + length > MAX_SESSION_KEY_PACKET_SIZE:
+            raise PacketError("Session key packet is too large")
+
+        body += _read_exactly(stream, length)
+        if not is_partial:
+            return body
+
+        length, is_partial = _read_new_length(stream)
+
+
+def parse_pkesk_key_id(body):
+    """Recipient key ID (or v6 fingerprint) of a public-key session key packet."""
+    if not body:
+        raise PacketError("Empty public-key session key packet")
+
+    version = body[0]
+    if version == 3:
+        return _read_hex(body[1:9])
+
+    if version == 6:
+        # Length octet, then key version and fingerprint (zero for anonymous)
+        if len(body) < 2 or body[1] == 0:
+            return '0' * 16
+
+        return _read_hex(body[3:2 + body[1]])
+
+    raise PacketError(f"Unsupported public-key session key packet version {version}")
+
+
+def _read_hex(data):
+    if len(data) < 8:
+        raise PacketError("Truncated key ID")
+
+    return data.hex().upper()
+
+
+def is_armored(data):
+    """Whether data (the start of a file) is ASCII armored rather than binary packets."""
+    return bool(data) and not data[0] & 0x80
+
+
+def open_message(stream):
+    """Wrap stream so that both binary and ASCII armored messages can be read."""
+    preamble = stream.read(1)
+    if not preamble:
+        raise PacketError("Empty file")
+
+    if preamble[0] & 0x80:
+        return PrefixedReader(preamble, stream)
+
+    line = preamble + stream.readline(MAX_ARMOR_PREAMBLE)
+    while line and not line.strip():
+        line = stream.readline(MAX_ARMOR_PREAMBLE)
+
+    if not line.strip().startswith(ARMOR_HEADER):
+        raise PacketError("Not an OpenPGP message")
+
+    return _ArmorReader(stream)
+
+
+class PrefixedReader:
+    """Puts bytes already read from a stream back in front of it."""
+
+    def __init__(self, prefix, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def read(self, size=-1):
+        if not self._prefix:
+            return self._stream.read(size)
+
+        if size is None or size < 0:
+            data, self._prefix = self._prefix, b''
+            return data + self._stream.read()
+
+        data, self._prefix = self._prefix[:size], self._prefix[size:]
+        if len(data) < size:
+            data += self._stream.read(size - len(data))
+
+        return data
+
+
+def read_session_key_info(stream):
+    """Returns (recipient key IDs, is_symmetric) of an encrypted message.
+
+    Raises PacketError if the stream does not start with an encrypted
+    OpenPGP message.
+    """
+    stream = open_message(stream)
+
+    key_ids = []
+    is_symmetric = False
+    while True:
+        header = read_packet_header(stream)
+        if header is None:
+            break
+
+        tag, length, is_partial = header
+        if tag in ENCRYPTED_DATA_TAGS:
+            # Symmetrically encrypted data without any session key packets
+            # is keyed straight from the passphrase
+            if tag == TAG_SED and not key_ids:
+                is_symmetric = True
+
+            return key_ids, is_symmetric
+
+        if tag not in (TAG_PKESK, TAG_SKESK, TAG_MARKER) or length is None:
+            break
+
+        body = _read_body(stream, length, is_partial)
+        if tag == TAG_PKESK:
+            key_id = parse_pkesk_key_id(body)
+            if key_id not in key_ids:
+                key_ids.append(key_id)
+        elif tag == TAG_SKESK:
+            is_symmetric = True
+
+    raise PacketError("Not an encrypted OpenPGP message")
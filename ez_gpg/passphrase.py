@@ -0,0 +1,137 @@
+# vim:ff=unix ts=4 sw=4 expandtab
+
+import hashlib
+import os
+import threading
+import time
+
+
+class PassphraseCache:
+    """Remembers passphrases that were recently found to be valid.
+
+    Only a salted hash of (fingerprint, passphrase) is kept and the salt
+    never leaves the process, so the cache holds nothing that can be used to
+    recover a passphrase. Entries expire after `ttl` seconds and nothing is
+    ever written to disk. Aliases (like the key ID a caller used) find the
+    same entry as the fingerprint without having to look the key up.
+    """
+
+    DEFAULT_TTL = 300
+
+    def __init__(self, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self._ttl = ttl
+        self._clock = clock
+        self._salt = os.urandom(32)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _get_digest(self, fingerprint, passphrase):
+        return hashlib.blake2b(f"{fingerprint}\0{passphrase}".encode('utf-8'),
+                               key=self._salt).digest()
+
+    def contains(self, fingerprint, passphrase):
+        digest = self._get_digest(fingerprint, passphrase)
+        now = self._clock()
+
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return False
+
+            if entry[1] <= now:
+                del self._entries[digest]
+                return False
+
+            return True
+
+    def add(self, fingerprint, passphrase, aliases=()):
+        digests = [self._get_digest(name, passphrase)
+                   for name in dict.fromkeys((fingerprint,) + tuple(aliases))]
+        expiry = self._clock() + self._ttl
+
+        with self._lock:
+            for digest in digests:
+                self._entries[digest] = (fingerprint, expiry)
+
+    def invalidate(self, fingerprint=None):
+        with self._lock:
+            if fingerprint is None:
+                self._entries.clear()
+                return
+
+            self._entries = {digest: entry for digest, entry in self._entries.items()
+                             if entry[0] != fingerprint}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class PassphraseValidator:
+    """Debounced background passphrase checks for a single password entry.
+
+    Each request() supersedes the previous one: a pending check is dropped
+    before it starts and the result of one that is already running is
+    discarded, so only the latest passphrase is ever reported. Checks run on
+    the given JobExecutor and on_result is called through its dispatch.
+    """
+
+    DEFAULT_DELAY = 0.3
+
+    def __init__(self, executor, check, is_cached=None, delay=DEFAULT_DELAY):
+        self._executor = executor
+        self._check = check
+        self._is_cached = is_cached
+        self._delay = delay
+
+        self._generation = 0
+        self._timer = None
+        self._job = None
+        self._lock = threading.Lock()
+
+    def request(self, key_id, passphrase, on_result):
+        """Schedule a check of passphrase for key_id.
+
+        Cached passphrases are reported straight away from the calling thread.
+        """
+        self.cancel()
+
+        if self._is_cached and self._is_cached(key_id, passphrase):
+            on_result(True)
+            return
+
+        with self._lock:
+            generation = self._generation
+            self._timer = threading.Timer(self._delay, self._start,
+                                          args=(generation, key_id, passphrase, on_result))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _start(self, generation, key_id, passphrase, on_result):
+        def deliver(valid):
+            if generation == self._generation:
+                on_result(valid)
+
+        def deliver_error(error):
+            print(f"Passphrase check failed: {error}")
+            deliver(False)
+
+        with self._lock:
+            if generation != self._generation:
+                return
+
+            self._timer = None
+            self._job = self._executor.submit(self._check, key_id, passphrase,
+                                              on_done=deliver,
+                                              on_error=deliver_error)
+
+    def cancel(self):
+        with self._lock:
+            self._generation += 1
+
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            if self._job is not None:
+                self._job.cancel()
+                self._job = None
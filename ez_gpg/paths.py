@@ -0,0 +1,40 @@
+# vim:ff=unix ts=4 sw=4 expandtab
+
+"""Turning the paths users give into file lists, shared by the CLI and the UI."""
+
+import glob
+import os
+
+
+def expand_paths(patterns, recursive=False):
+    """Expand globs and (optionally) directories into a de-duplicated file list.
+
+    Paths that don't exist are passed through so that they get reported as
+    per-file failures instead of being silently dropped.
+    """
+    filenames = []
+    seen = set()
+
+    def add(filename):
+        if filename not in seen:
+            seen.add(filename)
+            filenames.append(filename)
+
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+
+        for match in matches:
+            if not os.path.isdir(match):
+                add(match)
+                continue
+
+            if not recursive:
+                add(match)
+                continue
+
+            for root, dirs, files in os.walk(match):
+                dirs.sort()
+                for filename in sorted(files):
+                    add(os.path.join(root, filename))
+
+    return filenames
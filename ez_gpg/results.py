@@ -0,0 +1,530 @@
+# vim:ff=unix ts=4 sw=4 expandtab
+
+import json
+import time
+
+
+class FileResult:
+    """Outcome of a GpgUtils operation on a single file."""
+
+    def __init__(self, filename, output=None, success=False, status=None, error=None):
+        self.filename = filename
+        self.output = output
+        self.success = success
+        self.status = status
+        self.error = error
+
+    def to_dict(self):
+        return {
+            'file': self.filename,
+            'output': self.output,
+            'success': self.success,
+            'status': self.status,
+            'error': self.error,
+        }
+
+    def __bool__(self):
+        return self.success
+
+    def __repr__(self):
+        return (f"FileResult({self.filename!r}, output={self.output!r}, "
+                f"success={self.success})")
+
+
+class VerifyResult(FileResult):
+    """Outcome of a signature verification.
+
+    `output` holds the signature file that was checked (if it was detached).
+    """
+
+    # Same scale as python-gnupg's Verify.TRUST_* levels
+    TRUST_MARGINAL = 3
+
+    def __init__(self, filename, signature_filename=None, valid=False, status=None,
+                 fingerprint=None, key_id=None, username=None, trust_level=None,
+                 trust_text=None, timestamp=None, expire_timestamp=None, error=None):
+        super().__init__(filename, signature_filename, valid, status, error)
+        self.fingerprint = fingerprint
+        self.key_id = key_id
+        self.username = username
+        self.trust_level = trust_level
+        self.trust_text = trust_text
+        self.timestamp = timestamp
+        self.expire_timestamp = expire_timestamp
+
+    @staticmethod
+    def from_verification(filename, signature_filename, verification):
+        return VerifyResult(filename,
+                            signature_filename,
+                            bool(verification.valid),
+                            verification.status,
+                            fingerprint=verification.fingerprint,
+                            key_id=verification.key_id,
+                            username=verification.username,
+                            trust_level=verification.trust_level,
+                            trust_text=verification.trust_text,
+                            timestamp=verification.sig_timestamp or verification.timestamp,
+                            expire_timestamp=verification.expire_timestamp)
+
+    @staticmethod
+    def from_dict(record, filename=None, signature_filename=None):
+        """Rebuild a result from to_dict() output, optionally for another path."""
+        return VerifyResult(filename or record['file'],
+                            signature_filename or record['signature'],
+                            record['valid'],
+                            record['status'],
+                            fingerprint=record['fingerprint'],
+                            key_id=record['key_id'],
+                            username=record['username'],
+                            trust_level=record['trust_level'],
+                            trust_text=record['trust_text'],
+                            timestamp=record['timestamp'],
+                            expire_timestamp=record['expire_timestamp'],
+                            error=record['error'])
+
+    @property
+    def valid(self):
+        return self.success
+
+    @property
+    def is_expired(self):
+        try:
+            return int(self.expire_timestamp) <= time.time()
+        except (TypeError, ValueError):
+            return False
+
+    @property
+    def signature_filename(self):
+        return self.output
+
+    def is_trusted(self):
+        return self.valid and bool(self.trust_level) and \
+               self.trust_level >= VerifyResult.TRUST_MARGINAL
+
+    def to_dict(self):
+        result = super().to_dict()
+        result.update({
+            'signature': self.output,
+            'valid': self.valid,
+            'fingerprint': self.fingerprint,
+            'key_id': self.key_id,
+            'username': self.username,
+            'trust_level': self.trust_level,
+            'trust_text': self.trust_text,
+            'timestamp': self.timestamp,
+            'expire_timestamp': self.expire_timestamp,
+        })
+
+        return result
+
+    def __repr__(self):
+        return f"VerifyResult({self.filename!r}, valid={self.valid}, key_id={self.key_id!r})"
+
+
+class ExportResult(FileResult):
+    """Outcome of a key export into `filename`.
+
+    An empty `key_ids` stands for the whole keyring; `fingerprints` lists
+    the keys gpg actually wrote.
+    """
+
+    def __init__(self, filename, key_ids=None, fingerprints=None, success=False, status=None,
+                 error=None):
+        super().__init__(filename, filename, success, status, error)
+        self.key_ids = list(key_ids or [])
+        self.fingerprints = list(fingerprints or [])
+
+    def to_dict(self):
+        result = super().to_dict()
+        result.update({
+            'key_ids': self.key_ids,
+            'fingerprints': self.fingerprints,
+        })
+
+        return result
+
+    def __repr__(self):
+        return (f"ExportResult({self.filename!r}, keys={len(self.fingerprints)}, "
+                f"success={self.success})")
+
+
+class VerifyReport:
+    """Results of a batch verification, in input order."""
+
+    def __init__(self, results):
+        self.results = list(results)
+
+    @property
+    def valid(self):
+        return [result for result in self.results if result.valid]
+
+    @property
+    def invalid(self):
+        return [result for result in self.results if not result.valid]
+
+    def to_dict(self):
+        return {
+            'total': len(self.results),
+            'valid': len(self.valid),
+            'invalid': len(self.invalid),
+            'results': [result.to_dict() for result in self.results],
+        }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent, sort_keys=True)
+
+    def save(self, filename):
+        with open(filename, 'w', encoding='utf-8') as report_file:
+            report_file.write(self.to_json() + '\n')
+
+    def __bool__(self):
+        return bool(self.results) and not self.invalid
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    def __repr__(self):
+        return f"VerifyReport(total={len(self)}, invalid={len(self.invalid)})"
+
+
+class ManifestVerifyResult:
+    """Signature check of a checksum manifest plus a FileResult per listed file.
+
+    Files are only re-hashed when the manifest signature is valid.
+    """
+
+    def __init__(self, verification, files=None):
+        self.verification = verification
+        self.files = list(files or [])
+
+    @property
+    def filename(self):
+        return self.verification.filename
+
+    @property
+    def valid(self):
+        return self.verification.valid
+
+    def get_failed_files(self, status=None):
+        return [result for result in self.files
+                if not result and (status is None or result.status == status)]
+
+    def get_results(self):
+        """The manifest verification followed by the per-file results."""
+        return [self.verification] + self.files
+
+    def to_dict(self):
+        result = self.verification.to_dict()
+        result.update({
+            'success': bool(self),
+            'files': [file_result.to_dict() for file_result in self.files],
+        })
+
+        return result
+
+    def __bool__(self):
+        return self.valid and all(self.files)
+
+    def __repr__(self):
+        return (f"ManifestVerifyResult({self.filename!r}, valid={self.valid}, "
+                f"failed={len(self.get_failed_files())})")
+
+
+class EncryptedFileInfo:
+    """What we know about an encrypted file before decrypting it."""
+
+    def __init__(self, filename=None, is_symmetric=False, key_ids=None):
+        self.filename = filename
+        self.is_symmetric = is_symmetric
+        self.key_ids = key_ids if key_ids is not None else []
+        self.matching_key = None
+
+    def to_dict(self):
+        return {
+            'file': self.filename,
+            'is_symmetric': self.is_symmetric,
+            'key_ids': list(self.key_ids),
+            'matching_key': self.matching_key,
+        }
+
+    def __repr__(self):
+        return (f"EncryptedFileInfo({self.filename!r}, is_symmetric={self.is_symmetric}, "
+                f"key_ids={self.key_ids!r})")
+
+
+class KeyImportResult:
+    """What an import did with a single key, from gpg's IMPORT_* status lines."""
+
+    NEW = 'new'
+    UPDATED = 'updated'
+    UNCHANGED = 'unchanged'
+    REJECTED = 'rejected'
+
+    # IMPORT_OK flags
+    FLAG_NEW = 1
+    FLAG_UIDS = 2
+    FLAG_SIGNATURES = 4
+    FLAG_SUBKEYS = 8
+    FLAG_SECRET = 16
+
+    CHANGES = ((FLAG_UIDS, 'uids'), (FLAG_SIGNATURES, 'signatures'), (FLAG_SUBKEYS, 'subkeys'))
+
+    # IMPORT_PROBLEM reasons
+    PROBLEMS = {
+        '0': 'no specific reason',
+        '1': 'invalid certificate',
+        '2': 'issuer certificate missing',
+        '3': 'certificate chain too long',
+        '4': 'error storing certificate',
+    }
+
+    def __init__(self, fingerprint=None, flags=0, reason=None):
+        self.fingerprint = fingerprint
+        self.flags = flags
+        self.reason = reason
+
+    @property
+    def status(self):
+        if self.reason is not None:
+            return KeyImportResult.REJECTED
+
+        if self.flags & KeyImportResult.FLAG_NEW:
+            return KeyImportResult.NEW
+
+        if self.changes:
+            return KeyImportResult.UPDATED
+
+        return KeyImportResult.UNCHANGED
+
+    @property
+    def changes(self):
+        return [name for flag, name in KeyImportResult.CHANGES if self.flags & flag]
+
+    @property
+    def is_secret(self):
+        return bool(self.flags & KeyImportResult.FLAG_SECRET)
+
+    def to_dict(self):
+        return {
+            'fingerprint': self.fingerprint,
+            'status': self.status,
+            'changes': self.changes,
+            'secret': self.is_secret,
+            'reason': self.reason,
+        }
+
+    def __bool__(self):
+        return self.reason is None
+
+    def __repr__(self):
+        return f"KeyImportResult({self.fingerprint!r}, status={self.status!r})"
+
+
+class ImportReport:
+    """Per-key outcome of a key import, keys in the order gpg reported them.
+
+    `file_errors` holds FileResults for input files that could not be read
+    and `errors` anything gpg complained about as a whole.
+    """
+
+    # IMPORT_RES fields, in order
+    COUNT_FIELDS = ('count', 'no_user_id', 'imported', 'imported_rsa', 'unchanged',
+                    'n_uids', 'n_subk', 'n_sigs', 'n_revoc', 'sec_read', 'sec_imported',
+                    'sec_dups', 'skipped_new_keys', 'not_imported', 'skipped_v3_keys')
+
+    def __init__(self, keys=None, file_errors=None, errors=None):
+        self._keys = {}
+        self._rejected = []
+        self.counts = dict.fromkeys(ImportReport.COUNT_FIELDS, 0)
+        self.file_errors = list(file_errors or [])
+        self.errors = list(errors or [])
+
+        for key in keys or []:
+            self.add(key)
+
+    def add(self, key):
+        if not key or key.fingerprint is None:
+            self._rejected.append(key)
+            return
+
+        # A key in several input files gets one entry with all of its changes
+        known = self._keys.get(key.fingerprint)
+        if known is not None:
+            known.flags |= key.flags
+        else:
+            self._keys[key.fingerprint] = key
+
+    def add_status(self, status):
+        """Add the keys from (keyword, value) status pairs of a `gpg --import` run."""
+        for keyword, value in status:
+            fields = value.split()
+            if keyword == 'IMPORT_OK' and fields:
+                self.add(KeyImportResult(fields[1] if len(fields) > 1 else None,
+                                         int(fields[0])))
+            elif keyword == 'IMPORT_PROBLEM' and fields:
+                self.add(KeyImportResult(fields[1] if len(fields) > 1 else None,
+                                         reason=KeyImportResult.PROBLEMS.get(fields[0],
+                                                                             fields[0])))
+            elif keyword == 'IMPORT_RES':
+                for name, count in zip(ImportReport.COUNT_FIELDS, fields):
+                    self.counts[name] += int(count)
+
+    @property
+    def keys(self):
+        return list(self._keys.values()) + self._rejected
+
+    def get_keys(self, status):
+        return [key for key in self.keys if key.status == status]
+
+    @property
+    def new(self):
+        return self.get_keys(KeyImportResult.NEW)
+
+    @property
+    def updated(self):
+        return self.get_keys(KeyImportResult.UPDATED)
+
+    @property
+    def unchanged(self):
+        return self.get_keys(KeyImportResult.UNCHANGED)
+
+    @property
+    def rejected(self):
+        return self.get_keys(KeyImportResult.REJECTED)
+
+    @property
+    def fingerprints(self):
+        return [key.fingerprint for key in self.keys if key]
+
+    def to_dict(self):
+        return {
+            'total': len(self.keys),
+            'new': len(self.new),
+            'updated': len(self.updated),
+            'unchanged': len(self.unchanged),
+            'rejected': len(self.rejected),
+            'counts': dict(self.counts),
+            'keys': [key.to_dict() for key in self.keys],
+            'file_errors': [result.to_dict() for result in self.file_errors],
+            'errors': list(self.errors),
+        }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent, sort_keys=True)
+
+    def __bool__(self):
+        return bool(self.fingerprints) and not self.rejected and not self.file_errors
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __repr__(self):
+        return (f"ImportReport(total={len(self)}, new={len(self.new)}, "
+                f"updated={len(self.updated)}, rejected={len(self.rejected)})")
+
+
+class KeyRefreshResult:
+    """Outcome of refreshing one key from the keyservers.
+
+    `changes` is Key.get_changes() of the listings before and after.
+    """
+
+    CHANGED = 'changed'
+    UNCHANGED = 'unchanged'
+    NOT_FOUND = 'not found'
+    FAILED = 'failed'
+
+    def __init__(self, fingerprint, name=None, changes=None, found=True, error=None):
+        self.fingerprint = fingerprint
+        self.name = name
+        self.changes = dict(changes or {})
+        self.found = found
+        self.error = error
+
+    @property
+    def status(self):
+        if self.error is not None:
+            return KeyRefreshResult.FAILED
+
+        if not self.found:
+            return KeyRefreshResult.NOT_FOUND
+
+        return KeyRefreshResult.CHANGED if self.changes else KeyRefreshResult.UNCHANGED
+
+    @property
+    def is_revoked(self):
+        return bool(self.changes.get('revoked'))
+
+    @property
+    def is_expiry_extended(self):
+        old_expires, new_expires = self.changes.get('expires', (None, None))
+        return 'expires' in self.changes and \
+            (new_expires is None or (old_expires is not None and new_expires > old_expires))
+
+    def to_dict(self):
+        return {
+            'fingerprint': self.fingerprint,
+            'name': self.name,
+            'status': self.status,
+            'changes': self.changes,
+            'error': self.error,
+        }
+
+    def __bool__(self):
+        return self.error is None
+
+    def __repr__(self):
+        return f"KeyRefreshResult({self.fingerprint!r}, status={self.status!r})"
+
+
+class RefreshReport:
+    """Results of a keyring refresh, in keyring order."""
+
+    def __init__(self, results):
+        self.results = list(results)
+
+    def get_results(self, status):
+        return [result for result in self.results if result.status == status]
+
+    @property
+    def changed(self):
+        return self.get_results(KeyRefreshResult.CHANGED)
+
+    @property
+    def failed(self):
+        return self.get_results(KeyRefreshResult.FAILED)
+
+    @property
+    def not_found(self):
+        return self.get_results(KeyRefreshResult.NOT_FOUND)
+
+    def to_dict(self):
+        return {
+            'total': len(self.results),
+            'changed': len(self.changed),
+            'not_found': len(self.not_found),
+            'failed': len(self.failed),
+            'results': [result.to_dict() for result in self.results],
+        }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent, sort_keys=True)
+
+    def __bool__(self):
+        return not self.failed
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    def __repr__(self):
+        return (f"RefreshReport(total={len(self)}, changed={len(self.changed)}, "
+                f"failed={len(self.failed)})")
@@ -0,0 +1,403 @@
+# vim:ff=unix ts=4 sw=4 expandtab
+
+import collections
+import os
+import subprocess
+import threading
+import time
+
+from .instrumentation import GpgCall, get_operation
+
+
+def format_size(size):
+    for unit in ('B', 'KiB', 'MiB', 'GiB', 'TiB'):
+        if abs(size) < 1024 or unit == 'TiB':
+            break
+        size /= 1024.0
+
+    return f"{size:.1f} {unit}"
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes}m{seconds:02d}s"
+
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m"
+
+
+class Progress:
+    """Snapshot of a running stream, passed to on_progress callbacks."""
+
+    def __init__(self, bytes_in, bytes_out, elapsed, total_size=None, done=False):
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out
+        self.elapsed = elapsed
+        self.total_size = total_size
+        self.done = done
+
+    @property
+    def throughput(self):
+        """Input bytes per second."""
+        if self.elapsed <= 0:
+            return 0.0
+
+        return self.bytes_in / self.elapsed
+
+    @property
+    def fraction(self):
+        if not self.total_size:
+            return None
+
+        return min(1.0, self.bytes_in / self.total_size)
+
+    @property
+    def eta(self):
+        """Seconds left, if the total size is known."""
+        if not self.total_size or not self.throughput:
+            return None
+
+        return max(0.0, (self.total_size - self.bytes_in) / self.throughput)
+
+    def to_dict(self):
+        return {
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'elapsed': self.elapsed,
+            'total_size': self.total_size,
+            'throughput': self.throughput,
+            'eta': self.eta,
+            'done': self.done,
+        }
+
+    def __str__(self):
+        text = format_size(self.bytes_in)
+        if self.total_size:
+            text += f" / {format_size(self.total_size)} ({self.fraction:.0%})"
+
+        text += f" at {format_size(self.throughput)}/s"
+
+        eta = self.eta
+        if eta is not None and not self.done:
+            text += f", ETA {format_duration(eta)}"
+
+        return text
+
+
+class StreamResult:
+    """Outcome of a GpgStream run."""
+
+    def __init__(self, returncode, bytes_in, bytes_out, elapsed, status, stderr,
+                 cancelled=False):
+        self.returncode = returncode
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out
+        self.elapsed = elapsed
+        self.status = status
+        self.stderr = stderr
+        self.cancelled = cancelled
+
+    def has_status(self, keyword):
+        return any(status_keyword == keyword for status_keyword, _ in self.status)
+
+    def get_status(self, keyword):
+        return [value for status_keyword, value in self.status if status_keyword == keyword]
+
+    def __bool__(self):
+        return self.returncode == 0 and not self.cancelled
+
+    def __repr__(self):
+        return (f"StreamResult(returncode={self.returncode}, bytes_in={self.bytes_in}, "
+                f"bytes_out={self.bytes_out})")
+
+
+class BatchProgress:
+    """Folds the progress of many files or streams into one Progress.
+
+    Streams report through the callback from `item(key)` and plain files
+    count once `item_done(key, size)` is called. Calls may come from any
+    thread; on_progress gets at most one snapshot per PROGRESS_INTERVAL
+    besides the final one from `done()`.
+    """
+
+    def __init__(self, on_progress, total_size=None):
+        self._on_progress = on_progress
+        self._total_size = total_size
+        self._items = {}
+        self._start_time = time.monotonic()
+        self._last_progress = 0.0
+        self._lock = threading.Lock()
+
+    def item(self, key):
+        def on_item_progress(progress):
+            self._update(key, progress.bytes_in, progress.bytes_out)
+
+        return on_item_progress
+
+    def item_done(self, key, size):
+        self._update(key, size, 0)
+
+    def done(self):
+        self._report(force=True, done=True)
+
+    def _update(self, key, bytes_in, bytes_out):
+        with self._lock:
+            self._items[key] = (bytes_in, bytes_out)
+
+        self._report()
+
+    def _report(self, force=False, done=False):
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_progress < GpgStream.PROGRESS_INTERVAL:
+                return
+
+            self._last_progress = now
+            progress = Progress(sum(bytes_in for bytes_in, _ in self._items.values()),
+                                sum(bytes_out for _, bytes_out in self._items.values()),
+                                now - self._start_time,
+                                self._total_size,
+                                done)
+
+        self._on_progress(progress)
+
+
+class ConcatReader:
+    """Reads a list of files as one stream, opening them one at a time.
+
+    Files that can't be opened or read are skipped and end up in `errors` as
+    (filename, error) pairs. `separator` is emitted after every file.
+    """
+
+    def __init__(self, filenames, separator=b''):
+        self._filenames = collections.deque(filenames)
+        self._separator = separator
+        self._current = None
+        self.errors = []
+
+    def read(self, size=-1):
+        while self._current is not None or self._open_next():
+            try:
+                data = self._current.read(size)
+            except OSError as error:
+                self.errors.append((self._current.name, error))
+                data = b''
+
+            if data:
+                return data
+
+            self._current.close()
+            self._current = None
+            if self._separator:
+                return self._separator
+
+        return b''
+
+    def _open_next(self):
+        while self._filenames:
+            filename = self._filenames.popleft()
+            try:
+                self._current = open(filename, 'rb')
+                return True
+            except OSError as error:
+                self.errors.append((filename, error))
+
+        return False
+
+    def close(self):
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+
+        self._filenames.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class GpgStream:
+    """Pumps data through a gpg process in fixed-size chunks.
+
+    Input is written from a helper thread while output is copied on the
+    calling thread, so memory use stays at a couple of chunks no matter how
+    big the data is. The passphrase goes over its own pipe so stdin stays
+    free for the payload.
+    """
+
+    DEFAULT_CHUNK_SIZE = 1024 * 1024
+    PROGRESS_INTERVAL = 0.25
+    STDERR_LINES = 200
+
+    STATUS_PREFIX = '[GNUPG:] '
+
+    def __init__(self, gpg_binary, args, passphrase=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 on_progress=None, total_size=None, is_cancelled=None, instrumentation=None):
+        self._gpg_binary = gpg_binary
+        self._instrumentation = instrumentation
+        self._args = list(args)
+        self._passphrase = passphrase
+        self._chunk_size = chunk_size
+        self._on_progress = on_progress
+        self._total_size = total_size
+        self._is_cancelled = is_cancelled
+
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._start_time = None
+        self._last_progress = 0.0
+        self._progress_lock = threading.Lock()
+        self._errors = []
+
+    def get_command(self, passphrase_fd=None):
+        command = [self._gpg_binary, '--batch', '--no-tty', '--yes', '--status-fd', '2']
+        if passphrase_fd is not None:
+            command += ['--pinentry-mode', 'loopback', '--passphrase-fd', str(passphrase_fd)]
+
+        return command + self._args
+
+    def run(self, src=None, dst=None):
+        passphrase_fd = None
+        pass_fds = ()
+        if self._passphrase is not None:
+            passphrase_fd, write_fd = os.pipe()
+            try:
+                os.write(write_fd, self._passphrase.encode('utf-8') + b'\n')
+            finally:
+                os.close(write_fd)
+            pass_fds = (passphrase_fd,)
+
+        call = GpgCall(get_operation(self._args), self._args)
+        self._start_time = time.monotonic()
+        try:
+            process = subprocess.Popen(self.get_command(passphrase_fd),
+                                       stdin=subprocess.PIPE if src is not None else subprocess.DEVNULL,
+                                       stdout=subprocess.PIPE if dst is not None else subprocess.DEVNULL,
+                                       stderr=subprocess.PIPE,
+                                       pass_fds=pass_fds)
+        finally:
+            if passphrase_fd is not None:
+                os.close(passphrase_fd)
+        call.spawned(process.pid)
+
+        status = []
+        stderr_lines = collections.deque(maxlen=GpgStream.STDERR_LINES)
+        stderr_thread = threading.Thread(target=self._read_stderr,
+                                         args=(process.stderr, status, stderr_lines),
+                                         daemon=True)
+        stderr_thread.start()
+
+        writer_thread = None
+        if src is not None:
+            writer_thread = threading.Thread(target=self._write_input,
+                                             args=(src, process),
+                                             daemon=True)
+            writer_thread.start()
+
+        try:
+            if dst is not None:
+                self._read_output(process, dst)
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            if writer_thread:
+                writer_thread.join()
+            returncode = process.wait()
+            stderr_thread.join()
+
+            if self._instrumentation is not None:
+                call.finish(returncode, self._bytes_in, self._bytes_out, status)
+                self._instrumentation.record(call)
+
+        if self._errors:
+            raise self._errors[0]
+
+        self._report_progress(force=True, done=True)
+
+        return StreamResult(returncode,
+                            self._bytes_in,
+                            self._bytes_out,
+                            time.monotonic() - self._start_time,
+                            status,
+                            list(stderr_lines),
+                            cancelled=self._cancelled())
+
+    def _cancelled(self):
+        return self._is_cancelled is not None and self._is_cancelled()
+
+    def _write_input(self, src, process):
+        try:
+            while True:
+                if self._cancelled():
+                    process.kill()
+                    break
+
+                chunk = src.read(self._chunk_size)
+                if not chunk:
+                    break
+
+                process.stdin.write(chunk)
+                with self._progress_lock:
+                    self._bytes_in += len(chunk)
+                self._report_progress()
+        except BrokenPipeError:
+            # gpg bailed out early; its exit code and status tell the story
+            pass
+        except Exception as error:
+            self._errors.append(error)
+            process.kill()
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def _read_output(self, process, dst):
+        while True:
+            chunk = process.stdout.read(self._chunk_size)
+            if not chunk:
+                break
+
+            dst.write(chunk)
+            with self._progress_lock:
+                self._bytes_out += len(chunk)
+            self._report_progress()
+
+            if self._cancelled():
+                process.kill()
+                break
+
+    def _read_stderr(self, stream, status, stderr_lines):
+        for raw_line in stream:
+            line = raw_line.decode('utf-8', 'replace').rstrip('\n')
+            if line.startswith(GpgStream.STATUS_PREFIX):
+                keyword, _, value = line[len(GpgStream.STATUS_PREFIX):].partition(' ')
+                status.append((keyword, value))
+            else:
+                stderr_lines.append(line)
+
+    def _report_progress(self, force=False, done=False):
+        if not self._on_progress:
+            return
+
+        with self._progress_lock:
+            now = time.monotonic()
+            if not force and now - self._last_progress < GpgStream.PROGRESS_INTERVAL:
+                return
+
+            self._last_progress = now
+            progress = Progress(self._bytes_in,
+                                self._bytes_out,
+                                now - self._start_time,
+                                self._total_size,
+                                done)
+
+        self._on_progress(progress)
@@ -17,18 +17,28 @@ if sys.platform == 'darwin' and 'GI_TYPELIB_PATH' not in os.environ:
 
 import gi
 import re
+import time
 
 gi.require_version('Gtk', '3.0')
 gi.require_version('Gdk', '3.0')
 
 from gi.repository import Gdk, Gio, GLib, GObject, Gtk
 
+from .archive import COMPRESSION_GZIP, is_encrypted_archive
+from .compression import CompressionPolicy
 from .config import Config
+from .executor import JobExecutor
 from .gpg_utils import GpgUtils
+from .keyserver import is_fingerprint
+from .passphrase import PassphraseValidator
+from .paths import expand_paths
 from .ui_utils import error_wrapper, UiUtils
 
 _DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
 
+# Keyserver combo entry that races every configured keyserver
+ALL_KEYSERVERS = '*'
+
 
 class GenericWindow(Gtk.Window):
     def __init__(self, app, window_name, title,
@@ -36,6 +46,8 @@ class GenericWindow(Gtk.Window):
         window_title = f"EZ GPG - {title}"
 
         self._app = app
+        self._jobs = []
+        self._password_validator = None
 
         Gtk.Window.__init__(self, title=window_title, application=app)
 
@@ -74,8 +86,71 @@ class GenericWindow(Gtk.Window):
         return False
 
     def _close_window(self, *args, **kwargs):
+        self._cancel_jobs()
         self.destroy()
 
+    def _run_job(self, func, *args, on_done=None, on_error=None, **kwargs):
+        """Run a GpgUtils operation off the main loop.
+
+        Callbacks are invoked on the main loop and are dropped if the window
+        gets closed first.
+        """
+        def on_job_error(error):
+            if on_error:
+                on_error(error)
+            else:
+                self._show_error_message(str(error))
+
+        job = self._app.get_executor().submit(func, *args,
+                                              on_done=on_done,
+                                              on_error=error_wrapper(on_job_error),
+                                              **kwargs)
+        self._jobs = [pending for pending in self._jobs if not pending.is_done()]
+        self._jobs.append(job)
+
+        return job
+
+    def _get_progress_callback(self, label):
+        """on_progress for GpgUtils calls that shows the progress in label.
+
+        Snapshots arrive on worker threads, so the label is updated from the
+        main loop.
+        """
+        def show_progress(text):
+            if label.get_mapped():
+                label.set_text(text)
+            return False
+
+        def on_progress(progress):
+            GLib.idle_add(show_progress, str(progress))
+
+        return on_progress
+
+    def _cancel_jobs(self):
+        for job in self._jobs:
+            job.cancel()
+
+        self._jobs = []
+
+        if self._password_validator:
+            self._password_validator.cancel()
+
+    def _validate_key_password(self, key_id, password_field):
+        """Check the passphrase in the background once the user stops typing."""
+        if not self._password_validator:
+            self._password_validator = PassphraseValidator(self._app.get_executor(),
+                                                           GpgUtils.check_key_password,
+                                                           GpgUtils.is_key_password_cached)
+
+        def show_result(valid):
+            if valid:
+                password_field.set_icon_from_icon_name(1, None)
+            else:
+                password_field.set_icon_from_icon_name(1, "dialog-error")
+                password_field.set_icon_tooltip_text(1, "Invalid password for the selected key!")
+
+        self._password_validator.request(key_id, password_field.get_text(), show_result)
+
     def _get_actions(self):
         return []
 
@@ -157,6 +232,7 @@ class KeyManagementWindow(GenericWindow):
 
         # Populate keyserver list
         keyserver_list = Gtk.ListStore(str, str)
+        keyserver_list.append([ALL_KEYSERVERS, "All keyservers (fastest wins)"])
         for keyserver in Config.get_keyservers():
             keyserver_list.append([keyserver, keyserver])
 
@@ -187,12 +263,9 @@ class KeyManagementWindow(GenericWindow):
             # TODO: Disconnect notify::active signal
 
         for key in GpgUtils.get_gpg_keys():
-            key_id = key[0]
-            key_friendly_name = key[2]
-
-            key_row = Gtk.CheckButton(GObject.markup_escape_text(key_friendly_name))
+            key_row = Gtk.CheckButton(GObject.markup_escape_text(key.friendly_name))
             key_row.get_children()[0].set_use_markup(True)
-            key_row.set_name(key_id)
+            key_row.set_name(key.key_id)
 
             key_row.connect('notify::active', self._key_changed_active_state)
 
@@ -205,6 +278,7 @@ class KeyManagementWindow(GenericWindow):
                 ('key_management_window.do_import_keys', self.import_keys),
                 ('key_management_window.do_edit_keys',   self.edit_keys),
                 ('key_management_window.do_fetch_keys',  self.fetch_keys),
+                ('key_management_window.do_refresh_keys', self.refresh_keys),
                 ('key_management_window.do_upload_keys', self.upload_keys),
                 ('key_management_window.do_export_keys', self.export_keys),
                 ('key_management_window.do_delete_keys', self.delete_keys),
@@ -224,7 +298,7 @@ class KeyManagementWindow(GenericWindow):
 
     def _update_button_state(self):
         self._edit_key_button.set_sensitive(len(self._selected_keys) == 1)
-        self._export_key_button.set_sensitive(len(self._selected_keys) == 1)
+        self._export_key_button.set_sensitive(len(self._selected_keys) > 0)
         self._upload_key_button.set_sensitive(len(self._selected_keys) > 0)
         self._delete_key_button.set_sensitive(len(self._selected_keys) > 0)
 
@@ -242,16 +316,17 @@ class KeyManagementWindow(GenericWindow):
 
     def import_keys(self, action=None, param=None):
         print("Import Keys pressed...")
-        filename = UiUtils.get_filename(self)
-        if filename:
-            print("Chosen file to import:", filename)
-            if GpgUtils.import_key(filename):
-                # TODO: Make the new key bold
+        filenames = UiUtils.get_filenames(self)
+        if filenames:
+            print(f"Chosen {len(filenames)} file(s) to import")
+
+            def on_done(report):
+                # TODO: Make the new keys bold
                 self._refresh_key_list()
-            else:
-                UiUtils.show_dialog(self,
-                                    "ERROR! Keyfile could not be imported",
-                                    title="Keyfile error")
+                UiUtils.show_import_report(self, report)
+
+            self._run_job(GpgUtils.import_keys_bulk, filenames, on_done=on_done,
+                          cancellable=True)
 
     def export_keys(self, action=None, param=None):
         print("Export Keys pressed...")
@@ -259,17 +334,20 @@ class KeyManagementWindow(GenericWindow):
                             "This function only exports the public key!",
                             title="Notice")
 
-        key_id = self._selected_keys[0]
-        key = GpgUtils.get_key_by_id(key_id)
-        key_name = key[2]
-
-        # Turn key name into something FS-friendly
-        # XXX: There's probably a better way to do this
-        key_name = key_name.replace('|','')
-        key_name = key_name.replace('<','(')
-        key_name = key_name.replace('>',')')
-        key_name = re.sub(r'[^@a-zA-Z0-9()]+','_', key_name)
-        key_name = re.sub(r'__+','_', key_name)
+        key_ids = list(self._selected_keys)
+        if len(key_ids) == 1:
+            key = GpgUtils.get_key_by_id(key_ids[0])
+            key_name = key.friendly_name
+
+            # Turn key name into something FS-friendly
+            # XXX: There's probably a better way to do this
+            key_name = key_name.replace('|','')
+            key_name = key_name.replace('<','(')
+            key_name = key_name.replace('>',')')
+            key_name = re.sub(r'[^@a-zA-Z0-9()]+','_', key_name)
+            key_name = re.sub(r'__+','_', key_name)
+        else:
+            key_name = f"{len(key_ids)}_keys"
 
         filename, armor = UiUtils.get_save_filename(self, key_name)
 
@@ -279,9 +357,14 @@ class KeyManagementWindow(GenericWindow):
 
         print("Export target:", filename)
 
-        GpgUtils.export_key(key_id, filename, armor)
+        def on_done(result):
+            if result:
+                print(f"Keys exported as {filename}...")
+            else:
+                self._show_error_message(f"Could not export keys: {result.error}")
 
-        print(f"Key exported as {filename}...")
+        self._run_job(GpgUtils.export_keys, key_ids, filename, armor, on_done=on_done,
+                      cancellable=True)
 
     def upload_keys(self, action=None, param=None):
         print("Upload Keys pressed...")
@@ -326,21 +409,67 @@ class KeyManagementWindow(GenericWindow):
                 return
 
         keyserver = self._keyserver_combo.get_active_id()
-        try:
-            fingerprint = GpgUtils.fetch_key(keyserver, key_id)
+        if keyserver == ALL_KEYSERVERS:
+            keyserver = None
+
+        def on_fetched(fingerprint):
             if not fingerprint:
                 self._show_error_message(f"ERROR! Could not fetch key with ID '0x{key_id}'")
                 return
-        except Exception as e:
-            self._show_error_message(str(e))
-            return
 
-        print("Fetched:", fingerprint)
-        UiUtils.show_dialog(self,
-                            f"Successful import of '0x{key_id}':!\n"
-                            f"Fingerprint: {fingerprint}",
-                            title="Fetch success",
-                            message_type=Gtk.MessageType.INFO)
+            print("Fetched:", fingerprint)
+            self._refresh_key_list()
+            UiUtils.show_dialog(self,
+                                f"Successful import of '0x{key_id}':!\n"
+                                f"Fingerprint: {fingerprint}",
+                                title="Fetch success",
+                                message_type=Gtk.MessageType.INFO)
+
+        def on_searched(candidates):
+            fetch_id = key_id
+            if len(candidates) > 1:
+                choices = [(candidate.fingerprint or candidate.key_id,
+                            f"{candidate.key_id} {candidate.uids[0] if candidate.uids else ''}"
+                            f"{' (revoked)' if candidate.is_revoked else ''}")
+                           for candidate in candidates]
+                fetch_id = UiUtils.choose_from_list(self,
+                                                    f"{len(candidates)} keys match '0x{key_id}'!\n"
+                                                    "Only fetch the one you know is right:",
+                                                    choices,
+                                                    title="Multiple keys found")
+                if not fetch_id:
+                    print("Fetch cancelled")
+                    return
+
+            self._run_job(GpgUtils.fetch_key, keyserver, fetch_id, on_done=on_fetched)
+
+        def on_search_error(error):
+            # Not every keyserver can search; fetching still refuses colliding keys
+            print(f"Search failed: {error}")
+            on_searched([])
+
+        if is_fingerprint(key_id):
+            on_searched([])
+        else:
+            self._run_job(GpgUtils.search_keys, key_id, keyserver,
+                          on_done=on_searched, on_error=on_search_error)
+
+    def refresh_keys(self, action=None, param=None):
+        print("Refresh Keys pressed...")
+
+        # Everything unless some keys are selected
+        key_ids = list(self._selected_keys) or None
+
+        keyserver = self._keyserver_combo.get_active_id()
+        if keyserver == ALL_KEYSERVERS:
+            keyserver = None
+
+        def on_done(report):
+            self._refresh_key_list()
+            UiUtils.show_refresh_report(self, report)
+
+        self._run_job(GpgUtils.refresh_keys, key_ids, keyserver, on_done=on_done,
+                      cancellable=True)
 
     def delete_keys(self, action=None, param=None):
         print("Delete Keys pressed...")
@@ -441,8 +570,11 @@ class CreateKeyWindow(GenericWindow):
         self._create_button.set_sensitive(False)
         self._create_spinner.start()
 
-        fingerprint = GpgUtils.create_key(name, email, passphrase, key_type, key_length)
+        self._run_job(GpgUtils.create_key, name, email, passphrase, key_type, key_length,
+                      on_done=self._on_key_created,
+                      on_error=self._on_create_failed)
 
+    def _on_key_created(self, fingerprint):
         self._create_spinner.stop()
 
         if fingerprint:
@@ -457,9 +589,13 @@ class CreateKeyWindow(GenericWindow):
 
             self.destroy()
         else:
-            print(" - Key creation failed!")
-            self._create_button.set_sensitive(True)
-            self._show_error_message("Failed to create key!")
+            self._on_create_failed()
+
+    def _on_create_failed(self, error=None):
+        print(" - Key creation failed!", error or '')
+        self._create_spinner.stop()
+        self._create_button.set_sensitive(True)
+        self._show_error_message("Failed to create key!")
 
 
 class EncryptWindow(GenericWindow):
@@ -471,7 +607,9 @@ class EncryptWindow(GenericWindow):
         self._key_list_box = builder.get_object('lst_key_selection')
         self._file_chooser = builder.get_object('fc_main')
         self._armor_output_check_box = builder.get_object('chk_armor')
+        self._folder_check_box = builder.get_object('chk_folder')
         self._encrypt_spinner = builder.get_object('spn_encrypt')
+        self._encrypt_progress = builder.get_object('lbl_encrypt_progress')
         self._encrypt_button = builder.get_object('btn_do_encrypt')
 
         self._encryption_type = builder.get_object('ntb_encryption_type')
@@ -483,11 +621,8 @@ class EncryptWindow(GenericWindow):
         self._armor_output_check_box.set_visible(False)
 
         for key in GpgUtils.get_gpg_keys():
-            key_id = key[0]
-            key_friendly_name = key[2]
-
-            key_row = Gtk.CheckButton(key_friendly_name)
-            key_row.set_name(key_id)
+            key_row = Gtk.CheckButton(key.friendly_name)
+            key_row.set_name(key.key_id)
 
             self._key_list_box.add(key_row)
 
@@ -495,9 +630,17 @@ class EncryptWindow(GenericWindow):
 
         self._password_field.connect('changed', self._check_password_matching)
         self._confirm_password_field.connect('changed', self._check_password_matching)
+        self._folder_check_box.connect('toggled', self._toggle_folder_mode)
 
         self.add(builder.get_object('encrypt_window_vbox'))
 
+    def _toggle_folder_mode(self, widget):
+        action = Gtk.FileChooserAction.OPEN
+        if widget.get_active():
+            action = Gtk.FileChooserAction.SELECT_FOLDER
+
+        self._file_chooser.set_action(action)
+
     def _get_actions(self):
         return [('encrypt_window.do_encrypt', self.do_encrypt),
                 ]
@@ -543,6 +686,39 @@ class EncryptWindow(GenericWindow):
         else:
             self._encrypt_symmetric(filenames, use_armor)
 
+    def _start_encryption(self, filenames, key_ids, password, use_armor):
+        print(" - Locking UI and showing spinner.")
+        self._encrypt_button.set_sensitive(False)
+        self._encrypt_spinner.start()
+
+        # Don't make gpg deflate photos, videos and archives again
+        compression = CompressionPolicy(auto=True)
+        on_progress = self._get_progress_callback(self._encrypt_progress)
+
+        # One streamed tar per folder instead of a gpg run per file
+        if self._folder_check_box.get_active():
+            self._run_job(GpgUtils.encrypt_folders, filenames, key_ids, password, use_armor,
+                          COMPRESSION_GZIP,
+                          gpg_compression=compression,
+                          on_progress=on_progress,
+                          cancellable=True,
+                          on_done=self._finished_encryption,
+                          on_error=self._failed_encryption)
+        elif key_ids:
+            self._run_job(GpgUtils.encrypt_files_pki, filenames, key_ids, use_armor,
+                          compression=compression,
+                          on_progress=on_progress,
+                          cancellable=True,
+                          on_done=self._finished_encryption,
+                          on_error=self._failed_encryption)
+        else:
+            self._run_job(GpgUtils.encrypt_files_symmetric, filenames, password, use_armor,
+                          compression=compression,
+                          on_progress=on_progress,
+                          cancellable=True,
+                          on_done=self._finished_encryption,
+                          on_error=self._failed_encryption)
+
 
     def _encrypt_symmetric(self, filenames, use_armor):
         password_field = self._password_field
@@ -558,22 +734,7 @@ class EncryptWindow(GenericWindow):
             self._show_error_message("Passwords do not match!")
             return
 
-        print(" - Locking UI and showing spinner.")
-        self._encrypt_button.set_sensitive(False)
-        self._encrypt_spinner.start()
-
-        # XXX / TODO: We're having our main thread blocked by gnupg work
-        #             so we need to add threading at some point.
-        def finished_encryption_cb(self):
-            print(" - Finished. Stopping spinner.")
-            self._encrypt_spinner.stop()
-
-        GpgUtils.encrypt_files_symmetric(self, filenames, password,
-                                        use_armor, callback=finished_encryption_cb)
-
-        self.destroy()
-
-
+        self._start_encryption(filenames, None, password, use_armor)
 
     def _encrypt_pki(self, filenames, use_armor):
         print(" - Checking GPG key selection")
@@ -592,42 +753,43 @@ class EncryptWindow(GenericWindow):
             return
 
         # Disable encrypt button if we're in the middle of encryption
-        print(" - Locking UI and showing spinner.")
-        self._encrypt_button.set_sensitive(False)
-        self._encrypt_spinner.start()
+        self._start_encryption(filenames, selected_keys, None, use_armor)
 
-        # XXX / TODO: We're having our main thread blocked by gnupg work
-        #             so we need to add threading at some point.
-        def finished_encryption_cb(self):
-            print(" - Finished. Stopping spinner.")
-            self._encrypt_spinner.stop()
+    def _finished_encryption(self, results):
+        print(" - Finished. Stopping spinner.")
+        self._encrypt_spinner.stop()
 
-        GpgUtils.encrypt_files_pki(self, filenames, selected_keys,
-                                   use_armor, callback=finished_encryption_cb)
+        UiUtils.show_file_results(self, results, action="Encrypted")
 
-        self.destroy()
+        if all(results):
+            self.destroy()
+        else:
+            self._encrypt_button.set_sensitive(True)
+
+    def _failed_encryption(self, error):
+        print(" - Failed. Stopping spinner.")
+        self._encrypt_spinner.stop()
+        self._encrypt_button.set_sensitive(True)
+        self._show_error_message(str(error))
 
 class SignWindow(GenericWindow):
     def __init__(self, app):
-        super().__init__(app, 'sign_window', "Sign file")
+        super().__init__(app, 'sign_window', "Sign files")
 
         builder = self.get_builder()
 
         self._source_file = builder.get_object('fc_source_file')
 
         self._key_list = builder.get_object('cmb_key_list')
-        GpgUtils.add_gpg_keys_to_combo_box(self._key_list, True)
+        UiUtils.add_gpg_keys_to_combo_box(self._key_list, True)
 
         self._password_field = builder.get_object('ent_password')
 
         self._armor_output_check_box = builder.get_object('chk_armor')
+        self._manifest_check_box = builder.get_object('chk_manifest')
         self._sign_spinner = builder.get_object('spn_sign')
         self._sign_button = builder.get_object('btn_do_sign')
 
-        # XXX: Armor param doesn't seem to produce armored output so we
-        #      disable this for now
-        self._armor_output_check_box.set_visible(False)
-
         self._key_list.connect('changed', self._check_key_password)
         self._password_field.connect('changed', self._check_key_password)
 
@@ -642,19 +804,16 @@ class SignWindow(GenericWindow):
         password_field = window._password_field
         selected_key = self._key_list.get_active_id()
         if selected_key:
-            if GpgUtils.check_key_password(selected_key, password_field.get_text()):
-                password_field.set_icon_from_icon_name(1, None)
-            else:
-                password_field.set_icon_from_icon_name(1, "dialog-error")
-                password_field.set_icon_tooltip_text(1, "Invalid password for the selected key!")
+            self._validate_key_password(selected_key, password_field)
 
     def do_sign(self, action=None, param=None):
         print("Clicked Sign button")
 
         # TODO: Make this event driven vs post verification
         print(" - Checking source file(s)")
-        source_file = self._source_file.get_filename()
-        if not source_file:
+        filenames = expand_paths(self._source_file.get_filenames(), recursive=True)
+        print("   - Filenames:", filenames)
+        if not filenames:
             self._show_error_message("File not selected!")
             return
 
@@ -670,26 +829,38 @@ class SignWindow(GenericWindow):
         use_armor = self._armor_output_check_box.get_active()
         print(f" - Armor output: {use_armor}")
 
-        # Disable encrypt button if we're in the middle of encryption
+        manifest_filename = None
+        if self._manifest_check_box.get_active():
+            manifest_filename = GpgUtils.get_default_manifest_filename(filenames)
+        print(f" - Manifest: {manifest_filename}")
+
+        # Disable sign button if we're in the middle of signing
         print(" - Locking UI and showing spinner.")
         self._sign_button.set_sensitive(False)
         self._sign_spinner.start()
 
-        # XXX / TODO: We're having our main thread blocked by gnupg work
-        #             so we need to add threading at some point.
-        def finished_encryption_cb(self):
-            print(" - Finished. Stopping spinner.")
-            self._sign_spinner.stop()
+        self._run_job(GpgUtils.sign_files, filenames, selected_key,
+                      self._password_field.get_text(), use_armor, manifest_filename,
+                      cancellable=True,
+                      on_done=self._finished_signing,
+                      on_error=self._failed_signing)
+
+    def _finished_signing(self, results):
+        print(" - Finished. Stopping spinner.")
+        self._sign_spinner.stop()
+
+        UiUtils.show_file_results(self, results, action="Signed")
+
+        if not all(results):
             self._sign_button.set_sensitive(True)
+            return
 
-        success = GpgUtils.sign_file(self, source_file, selected_key,
-                                       self._password_field.get_text(),
-                                       callback=finished_encryption_cb)
+        self.destroy()
 
-        if success:
-            self.destroy()
-        else:
-            finished_encryption_cb(self)
+    def _failed_signing(self, error):
+        self._sign_spinner.stop()
+        self._sign_button.set_sensitive(True)
+        self._show_error_message(str(error))
 
 
 class DecryptWindow(GenericWindow):
@@ -701,14 +872,16 @@ class DecryptWindow(GenericWindow):
         self._source_file = builder.get_object('fc_source_file')
 
         self._key_list = builder.get_object('cmb_key_list')
-        GpgUtils.add_gpg_keys_to_combo_box(self._key_list, True)
+        UiUtils.add_gpg_keys_to_combo_box(self._key_list, True)
 
         # TODO: Use a real ID
         self._key_list.get_model().append(['symmetric',
                                            'Symmetric encryption (password only)'])
 
         # Prefetch the list
-        self._gpg_keys = GpgUtils.get_gpg_keys(True)
+        self._key_index = GpgUtils.get_key_index(True)
+        self._matching_key_ids = set()
+        self._encrypted_file_info = None
 
         # Install a filter
         self._key_filter = self._key_list.get_model().filter_new()
@@ -719,6 +892,7 @@ class DecryptWindow(GenericWindow):
 
         self._armor_output_check_box = builder.get_object('chk_armor')
         self._decrypt_spinner = builder.get_object('spn_decrypt')
+        self._decrypt_progress = builder.get_object('lbl_decrypt_progress')
         self._decrypt_button = builder.get_object('btn_do_decrypt')
 
         self._source_file.connect('file-set', self._update_key_list)
@@ -731,44 +905,40 @@ class DecryptWindow(GenericWindow):
         return [('decrypt_window.do_decrypt', self.do_decrypt),
                 ]
 
-    # XXX: Nasty but no easy way to compare subkeys for all items with
-    #      inconsistent lengths between two arrays
     def _filter_key_ids(self, model, iter, data):
         if not self._source_file.get_filename():
             return False
 
         info = self._encrypted_file_info
+        if not info:
+            return False
 
         if info.is_symmetric:
             return model[iter][0] == 'symmetric'
 
-        matching_keys = list(filter(lambda x: x[0] == model[iter][0], self._gpg_keys))
-        if len(matching_keys) == 0:
-            return False
-
-        key_id, key_name, key_friendly_name, subkeys, fingerprint = matching_keys[0]
-
-        # Check primary key ID, fingerprint, and all subkeys against
-        # the encryption key IDs extracted from the file
-        all_key_ids = [key_id, fingerprint] + subkeys
-        for candidate in all_key_ids:
-            # print(f"Comparing {candidate} in {info.key_ids}")
-            for encryption_key in info.key_ids:
-                if candidate.endswith(encryption_key) or encryption_key.endswith(candidate):
-                    print("Found! Matching key:", key_id, key_name)
-                    info.matching_key = key_id
-                    return True
-
-        return False
+        return model[iter][0] in self._matching_key_ids
 
     def _update_key_list(self, widget):
         print("File changed - checking for key_ids...")
-        self._encrypted_file_info = GpgUtils.get_encryped_file_info(self,
-                                                                      widget.get_filename())
+        try:
+            self._encrypted_file_info = GpgUtils.get_encryped_file_info(widget.get_filename())
+        except ValueError:
+            self._encrypted_file_info = None
+            self._key_filter.refilter()
+            UiUtils.show_dialog(self,
+                                "ERROR! Not a GPG-encrypted file!",
+                                title="Invalid file")
+            return
 
         info = self._encrypted_file_info
-        if not info:
-            return
+
+        # Primary key ID, fingerprint and all subkeys are indexed so this
+        # is a lookup per recipient rather than a scan of the keyring
+        matching_keys = self._key_index.find_recipients(info.key_ids)
+        self._matching_key_ids = set(key.key_id for key in matching_keys)
+        if matching_keys:
+            print("Found! Matching key:", matching_keys[0].key_id, matching_keys[0].key_name)
+            info.matching_key = matching_keys[0].key_id
 
         if info.is_symmetric:
             print("Symmetric encryption")
@@ -794,13 +964,11 @@ class DecryptWindow(GenericWindow):
 
         if not selected_key or \
            selected_key == 'symmetric':
+            if self._password_validator:
+                self._password_validator.cancel()
             password_field.set_icon_from_icon_name(1, None)
         else:
-            if GpgUtils.check_key_password(selected_key, password_field.get_text()):
-                password_field.set_icon_from_icon_name(1, None)
-            else:
-                password_field.set_icon_from_icon_name(1, "dialog-error")
-                password_field.set_icon_tooltip_text(1, "Invalid password for the selected key!")
+            self._validate_key_password(selected_key, password_field)
 
     def do_decrypt(self, action=None, param=None):
         print("Clicked Decrypt button")
@@ -815,29 +983,67 @@ class DecryptWindow(GenericWindow):
         selected_key = self._key_list.get_active_id()
         print(" - Key Id:", selected_key)
 
-        # Disable encrypt button if we're in the middle of encryption
+        # A .tar.gz.gpg may just as well be a tarball encrypted file by file
+        extract = is_encrypted_archive(source_file) and \
+            self.confirm_action(f"{os.path.basename(source_file)} looks like an encrypted "
+                                "folder archive.\n"
+                                "Extract its files? (No decrypts it back to the archive "
+                                "file)")
+
+        # Disable decrypt button if we're in the middle of decryption
         print(" - Locking UI and showing spinner.")
         self._decrypt_button.set_sensitive(False)
         self._decrypt_spinner.start()
 
-        # XXX / TODO: We're having our main thread blocked by gnupg work
-        #             so we need to add threading at some point.
-        def finished_decryption_cb(self):
-            print(" - Finished. Stopping spinner.")
-            self._decrypt_spinner.stop()
+        on_progress = self._get_progress_callback(self._decrypt_progress)
+        if extract:
+            # Folder archives get extracted as they decrypt
+            self._run_job(GpgUtils.decrypt_archive, source_file,
+                          self._password_field.get_text(),
+                          on_progress=on_progress,
+                          cancellable=True,
+                          on_done=self._finished_decryption,
+                          on_error=self._failed_decryption)
+            return
+
+        self._run_job(GpgUtils.decrypt_files, [source_file],
+                      self._password_field.get_text(),
+                      on_progress=on_progress,
+                      cancellable=True,
+                      on_done=lambda results: self._finished_decryption(results[0]),
+                      on_error=self._failed_decryption)
+
+    def _finished_decryption(self, result):
+        print(" - Finished. Stopping spinner.")
+        self._decrypt_spinner.stop()
+
+        if not result:
             self._decrypt_button.set_sensitive(True)
+            UiUtils.show_dialog(self,
+                                f"Unable to decrypt {result.filename}!",
+                                title="FAILED!",
+                                message_type=Gtk.MessageType.ERROR)
+            return
 
-        success = GpgUtils.decrypt_file(self, source_file,
-                                          self._password_field.get_text(),
-                                          callback=finished_decryption_cb)
+        location = "file"
+        if os.path.isdir(result.output):
+            location = "files"
 
-        if success:
-            self.destroy()
-        else:
-            finished_decryption_cb(self)
+        UiUtils.show_dialog(self,
+                            f"Decrypted {location} can be found at:\n{result.output}",
+                            title="Completed!",
+                            message_type=Gtk.MessageType.INFO)
+        self.destroy()
+
+    def _failed_decryption(self, error):
+        self._decrypt_spinner.stop()
+        self._decrypt_button.set_sensitive(True)
+        self._show_error_message(str(error))
 
 
 class VerifyWindow(GenericWindow):
+    REPORT_COLUMNS = ("File", "Status", "Signed by", "Fingerprint", "Trust", "Signed at")
+
     def __init__(self, app):
         super().__init__(app, 'verify_window', "Verify Signature")
 
@@ -845,12 +1051,26 @@ class VerifyWindow(GenericWindow):
 
         self._source_file = builder.get_object('fc_source_file')
         self._signature_file = builder.get_object('fc_signature_file')
+        self._folder = builder.get_object('fc_folder')
         self._verify_button = builder.get_object('btn_do_verify')
+        self._export_button = builder.get_object('btn_export_report')
+
+        self._report = None
+        self._report_view = builder.get_object('sw_report')
+        self._report_store = Gtk.ListStore(str, str, str, str, str, str)
+        self._report_table = builder.get_object('tv_report')
+        self._report_table.set_model(self._report_store)
+        for index, title in enumerate(VerifyWindow.REPORT_COLUMNS):
+            column = Gtk.TreeViewColumn(title, Gtk.CellRendererText(), text=index)
+            column.set_resizable(True)
+            column.set_sort_column_id(index)
+            self._report_table.append_column(column)
 
         self.add(builder.get_object('verify_window_vbox'))
 
     def _get_actions(self):
         return [('verify_window.do_verify', self.do_verify),
+                ('verify_window.export_report', self.export_report),
                 ]
 
     def do_verify(self, action=None, param=None):
@@ -859,21 +1079,107 @@ class VerifyWindow(GenericWindow):
         # TODO: Make this event driven vs post verification
         print(" - Checking source file(s)")
         source_file = self._source_file.get_filename()
+        folder = self._folder.get_filename()
+        if not source_file and folder:
+            self._verify_folder(folder)
+            return
+
         if not source_file:
             self._show_error_message("File not selected!")
             return
 
         signature_file = self._signature_file.get_filename()
+        if not signature_file:
+            # Same lookup as the CLI: <file>.sig/.asc, or the data file when
+            # the signature itself was picked
+            source_file, signature_file = GpgUtils.find_signature_pairs([source_file])[0]
         print(" - Using signature file:", signature_file)
 
         # Disable verify button if we're in the middle of verification
         self._verify_button.set_sensitive(False)
 
-        if GpgUtils.verify_file(self, source_file, signature_file):
+        if GpgUtils.is_manifest(source_file):
+            # One signature check, then every listed file gets re-hashed
+            self._run_job(GpgUtils.verify_manifest, source_file, signature_file,
+                          on_done=self._finished_manifest_verification,
+                          on_error=self._failed_verification)
+            return
+
+        self._run_job(GpgUtils.verify_file, source_file, signature_file,
+                      on_done=self._finished_verification,
+                      on_error=self._failed_verification)
+
+    def _finished_manifest_verification(self, result):
+        UiUtils.show_manifest_verification(self, result)
+
+        if result:
+            self.destroy()
+        else:
+            self._verify_button.set_sensitive(True)
+
+    def _finished_verification(self, result):
+        UiUtils.show_verification(self, result)
+
+        if result.valid:
             self.destroy()
         else:
             self._verify_button.set_sensitive(True)
 
+    def _failed_verification(self, error):
+        self._verify_button.set_sensitive(True)
+        self._show_error_message(str(error))
+
+    def _verify_folder(self, folder):
+        pairs = GpgUtils.find_signature_pairs([folder])
+        print(f" - Found {len(pairs)} signature(s) in {folder}")
+        if not pairs:
+            self._show_error_message("No .sig/.asc signatures found in the folder!")
+            return
+
+        self._verify_button.set_sensitive(False)
+        self._run_job(GpgUtils.verify_files, pairs,
+                      cancellable=True,
+                      on_done=self._finished_batch_verification,
+                      on_error=self._failed_verification)
+
+    def _finished_batch_verification(self, report):
+        self._verify_button.set_sensitive(True)
+        self._report = report
+
+        # One table instead of a dialog per file
+        self._report_store.clear()
+        for result in report:
+            if result.valid:
+                status = "VALID" if result.is_trusted() else "VALID (untrusted)"
+            else:
+                status = f"BAD: {result.error or result.status}"
+
+            try:
+                signed_at = time.strftime('%Y-%m-%d %H:%M:%S',
+                                          time.localtime(int(result.timestamp)))
+            except (TypeError, ValueError):
+                signed_at = result.timestamp or ''
+
+            self._report_store.append([result.filename,
+                                       status,
+                                       result.username or '',
+                                       result.fingerprint or '',
+                                       result.trust_text or '',
+                                       signed_at])
+
+        self._report_view.show()
+        self._export_button.show()
+
+        print(f" - {len(report.valid)} of {len(report)} signature(s) valid")
+
+    def export_report(self, action=None, param=None):
+        if not self._report:
+            return
+
+        filename = UiUtils.get_save_report_filename(self, 'verification_report.json')
+        if filename:
+            self._report.save(filename)
+
 
 class EzGpg(Gtk.Application):
     def __init__(self, *args, **kwargs):
@@ -886,6 +1192,7 @@ class EzGpg(Gtk.Application):
 
         self._window = None
         self._encrypt_window = None
+        self._executor = None
 
         self._actions = [
             ('about', True, self.on_about),
@@ -901,6 +1208,20 @@ class EzGpg(Gtk.Application):
             simple_action.connect('activate', callback)
             self.add_action(simple_action)
 
+    def do_shutdown(self):
+        print("Shutting down...")
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_pending=True)
+
+        Gtk.Application.do_shutdown(self)
+
+    def get_executor(self):
+        if not self._executor:
+            # Results get delivered on the GTK main loop
+            self._executor = JobExecutor(dispatch=GLib.idle_add)
+
+        return self._executor
+
     def do_activate(self):
         print("Activating...")
         if not self._window:
@@ -922,12 +1243,12 @@ class EzGpg(Gtk.Application):
         self._window.present()
 
     def do_command_line(self, command_line):
-        # options = command_line.get_options_dict()
+        # The headless commands don't need (or load) any of the windows
+        from . import cli
 
-        # if options.contains("test"):
-        #     pass
-        # self.activate()
-        # return 0
+        args = command_line.get_arguments()[1:]
+        if cli.is_cli_invocation(args):
+            return cli.main(args)
 
         self.activate()
 
@@ -947,4 +1268,4 @@ class EzGpg(Gtk.Application):
     @staticmethod
     def launch():
         print("Launching app")
-        EzGpg().run()
+        EzGpg().run(sys.argv)
@@ -8,6 +8,8 @@ gi.require_version('Gtk', '3.0')
 
 from gi.repository import Gtk
 
+from .gpg_utils import GpgUtils
+
 class UiUtils:
     @staticmethod
     def show_unimplemented_message_box(window):
@@ -28,6 +30,146 @@ class UiUtils:
 
         dialog.destroy()
 
+    @staticmethod
+    def add_gpg_keys_to_combo_box(combo_box, secret=False):
+        gpg_keys_list = Gtk.ListStore(str, str)
+        for key in GpgUtils.get_gpg_keys(secret):
+            gpg_keys_list.append([key.key_id, key.key_name])
+
+        cell = Gtk.CellRendererText()
+        combo_box.pack_start(cell, True)
+        combo_box.add_attribute(cell, 'text', 1)
+
+        combo_box.set_model(gpg_keys_list)
+        combo_box.set_entry_text_column(1)
+
+    @staticmethod
+    def show_file_results(window, results, action="Processed"):
+        """Summarize per-file results in one dialog instead of one per file."""
+        failed = [result for result in results if not result]
+
+        lines = [f"{action} {len(results) - len(failed)} of {len(results)} file(s)"]
+        for result in results:
+            if result:
+                lines.append(f"OK: {result.filename} -> {result.output}")
+            else:
+                lines.append(f"FAILED: {result.filename} ({result.error or result.status})")
+
+        title = "Completed!"
+        message_type = Gtk.MessageType.INFO
+        if failed:
+            title = "FAILED!"
+            message_type = Gtk.MessageType.ERROR
+
+        UiUtils.show_dialog(window,
+                            '\n'.join(lines),
+                            title=title,
+                            message_type=message_type)
+
+    @staticmethod
+    def show_import_report(window, report):
+        lines = [f"Imported {len(report.new)} new and {len(report.updated)} updated key(s), "
+                 f"{len(report.unchanged)} unchanged"]
+        for key in report.new + report.updated:
+            lines.append(f"{key.status.upper()}: {key.fingerprint}")
+        for key in report.rejected:
+            lines.append(f"REJECTED: {key.fingerprint or 'unknown key'} ({key.reason})")
+        for result in report.file_errors:
+            lines.append(f"FAILED: {result.filename} ({result.error})")
+        for error in report.errors:
+            lines.append(f"ERROR: {error}")
+
+        title = "Completed!"
+        message_type = Gtk.MessageType.INFO
+        if not report:
+            title = "FAILED!" if not report.fingerprints else "Completed with errors"
+            message_type = Gtk.MessageType.ERROR
+
+        UiUtils.show_dialog(window,
+                            '\n'.join(lines),
+                            title=title,
+                            message_type=message_type)
+
+    @staticmethod
+    def show_refresh_report(window, report):
+        lines = [f"Refreshed {len(report)} key(s): {len(report.changed)} changed, "
+                 f"{len(report.not_found)} not on the keyservers"]
+        for result in report.changed:
+            changes = []
+            if result.is_revoked:
+                changes.append("REVOKED")
+            if 'expires' in result.changes:
+                changes.append("expiry extended" if result.is_expiry_extended
+                               else "expiry changed")
+            if 'new_subkeys' in result.changes:
+                changes.append(f"{len(result.changes['new_subkeys'])} new subkey(s)")
+            if 'revoked_subkeys' in result.changes:
+                changes.append(f"{len(result.changes['revoked_subkeys'])} revoked subkey(s)")
+            if 'new_uids' in result.changes:
+                changes.append(f"{len(result.changes['new_uids'])} new user ID(s)")
+            lines.append(f"CHANGED: {result.name or result.fingerprint} ({', '.join(changes)})")
+        for result in report.failed:
+            lines.append(f"FAILED: {result.name or result.fingerprint} ({result.error})")
+
+        title = "Completed!" if report else "Completed with errors"
+        message_type = Gtk.MessageType.INFO if report else Gtk.MessageType.ERROR
+
+        UiUtils.show_dialog(window,
+                            '\n'.join(lines),
+                            title=title,
+                            message_type=message_type)
+
+    @staticmethod
+    def show_verification(window, result):
+        source_file = result.filename
+
+        success_message = [f"File {source_file} verified!",
+                           f"User: {result.username if result.valid else None}",
+                           f"Trust = {result.trust_text}"]
+
+        dialog_title = "Verified!"
+        message_text = '\n'.join(success_message)
+        message_type = Gtk.MessageType.INFO
+
+        if not result.valid:
+            dialog_title = "BAD SIGNATURE!"
+            message_text = f"Signature for {source_file} was verified and it was bad!"
+            message_type = Gtk.MessageType.ERROR
+        elif not result.trust_level:
+            dialog_title = "NOT VERIFIED!"
+            message_text = f"Signature for {source_file} CANNOT be verified!\nIt was either not included or was bad!"
+            message_type = Gtk.MessageType.ERROR
+        elif not result.is_trusted():
+            dialog_title = "NOT TRUSTED ENOGUH!"
+            message_text = f"Signature for {source_file} was verified but you don't trust it enough!"
+            message_type = Gtk.MessageType.ERROR
+
+        UiUtils.show_dialog(window,
+                            message_text,
+                            title=dialog_title,
+                            message_type=message_type)
+
+    @staticmethod
+    def show_manifest_verification(window, result):
+        if not result.valid:
+            UiUtils.show_verification(window, result.verification)
+            return
+
+        failed = result.get_failed_files()
+        if not failed:
+            UiUtils.show_verification(window, result.verification)
+            return
+
+        lines = [f"Manifest {result.filename} is signed by {result.verification.username} "
+                 f"but {len(failed)} of {len(result.files)} file(s) don't match it:"]
+        for file_result in failed:
+            lines.append(f"{file_result.status}: {file_result.filename}")
+
+        UiUtils.show_dialog(window,
+                            '\n'.join(lines),
+                            title="FILES CHANGED!",
+                            message_type=Gtk.MessageType.ERROR)
+
     @staticmethod
     def _set_keyfile_filter(dialog):
         filter_keys = Gtk.FileFilter()
@@ -64,6 +206,29 @@ class UiUtils:
         dialog.destroy()
         return filename
 
+    @staticmethod
+    def get_filenames(window, title="Open..."):
+        dialog = Gtk.FileChooserDialog(title,
+                                       window,
+                                       Gtk.FileChooserAction.OPEN,
+                                       ("_Cancel",
+                                        Gtk.ResponseType.CANCEL,
+                                        "_Open",
+                                        Gtk.ResponseType.OK))
+
+        dialog.set_default_response(Gtk.ResponseType.OK)
+        dialog.set_select_multiple(True)
+        UiUtils._set_keyfile_filter(dialog)
+
+        response = dialog.run()
+
+        filenames = []
+        if response == Gtk.ResponseType.OK:
+            filenames = dialog.get_filenames()
+
+        dialog.destroy()
+        return filenames
+
     @staticmethod
     def _set_save_keyfile_filter(dialog):
         filter_armor_key = Gtk.FileFilter()
@@ -114,6 +279,33 @@ class UiUtils:
         dialog.destroy()
         return filename, armor
 
+    @staticmethod
+    def get_save_report_filename(window, filename, title="Export report..."):
+        dialog = Gtk.FileChooserDialog(title,
+                                       window,
+                                       Gtk.FileChooserAction.SAVE,
+                                       ("_Cancel",
+                                        Gtk.ResponseType.CANCEL,
+                                        "_Save",
+                                        Gtk.ResponseType.ACCEPT))
+
+        dialog.set_do_overwrite_confirmation(True)
+        dialog.set_current_name(filename)
+
+        filter_json = Gtk.FileFilter()
+        filter_json.set_name("JSON report")
+        filter_json.add_pattern("*.json")
+        dialog.add_filter(filter_json)
+
+        filename = None
+        if dialog.run() == Gtk.ResponseType.ACCEPT:
+            filename = dialog.get_filename()
+            if not filename.endswith('.json'):
+                filename += '.json'
+
+        dialog.destroy()
+        return filename
+
     @staticmethod
     def get_string_from_user(window, message, title="Input required", max_length=None):
         dialog = Gtk.MessageDialog(window,
@@ -156,6 +348,35 @@ class UiUtils:
 
         return text
 
+    @staticmethod
+    def choose_from_list(window, message, choices, title="Choose one"):
+        """Let the user pick one of (id, label) choices. Returns the id or None."""
+        dialog = Gtk.MessageDialog(window,
+                                   Gtk.DialogFlags.MODAL | Gtk.DialogFlags.DESTROY_WITH_PARENT,
+                                   Gtk.MessageType.QUESTION,
+                                   Gtk.ButtonsType.OK_CANCEL,
+                                   message)
+        dialog.set_title(title)
+        dialog.set_default_response(Gtk.ResponseType.OK)
+
+        combo_box = Gtk.ComboBoxText()
+        for choice_id, label in choices:
+            combo_box.append(choice_id, label)
+        combo_box.set_active(0)
+
+        dialog.get_content_area().pack_end(combo_box, False, False, 0)
+        dialog.show_all()
+
+        response = dialog.run()
+        choice_id = combo_box.get_active_id()
+
+        dialog.destroy()
+
+        if response != Gtk.ResponseType.OK:
+            return None
+
+        return choice_id
+
     @staticmethod
     def confirm_dialog(window, message):
         dialog = Gtk.MessageDialog(window, 0,
@@ -0,0 +1,232 @@
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import unittest
+
+from ez_gpg.agent import PRESET_TTL, AgentConnection, AgentSession, AssuanError, \
+    clear_passphrases, get_agent_socket, get_preset_ttl, percent_unescape
+
+
+class FakeAgent:
+    """Answers Assuan commands from a dict of command prefix -> response lines."""
+
+    def __init__(self, socket_path, responses):
+        self.commands = []
+        self._responses = responses
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(socket_path)
+        self._server.listen(5)
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+
+            with client, client.makefile('rwb') as stream:
+                try:
+                    self._handle(stream)
+                except OSError:
+                    pass
+
+    def _handle(self, stream):
+        stream.write(b'OK Pleased to meet you\n')
+        stream.flush()
+        for line in stream:
+            command = line.decode().strip()
+            self.commands.append(command)
+            if command == 'BYE':
+                break
+
+            response = [b'OK']
+            for prefix, lines in self._responses.items():
+                if command.startswith(prefix):
+                    response = lines
+            stream.write(b''.join(line + b'\n' for line in response))
+            stream.flush()
+
+    def close(self):
+        self._server.close()
+
+
+class TestAgentConnection(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self._tmp_dir.name, 'S.gpg-agent')
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _start(self, responses=None):
+        agent = FakeAgent(self.socket_path, responses or {})
+        self.addCleanup(agent.close)
+        return agent
+
+    def test_data_and_status(self):
+        self._start({'GETINFO version': [b'# comment', b'S PROGRESS 1', b'D 2.2%2540', b'OK']})
+
+        with AgentConnection(self.socket_path) as agent:
+            data, status = agent.transact('GETINFO version')
+
+        self.assertEqual(data, b'2.2%40')
+        self.assertEqual(status, ['PROGRESS 1'])
+
+    def test_error(self):
+        self._start({'PRESET_PASSPHRASE': [b'ERR 67108941 Forbidden <GPG Agent>']})
+
+        with AgentConnection(self.socket_path) as agent:
+            with self.assertRaises(AssuanError) as context:
+                agent.transact('PRESET_PASSPHRASE GRIP -1 00')
+
+        self.assertEqual(context.exception.code, 67108941)
+
+    def test_percent_unescape(self):
+        self.assertEqual(percent_unescape(b'a%0Ab%25'), b'a\nb%')
+
+
+class TestAgentSession(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self._tmp_dir.name, 'S.gpg-agent')
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _start(self, responses=None):
+        agent = FakeAgent(self.socket_path, responses or {})
+        self.addCleanup(agent.close)
+        return agent
+
+    def test_preset_and_clear(self):
+        agent = self._start()
+
+        with AgentSession(['GRIP1', None, 'GRIP2'], 'pw', lambda: self.socket_path) as session:
+            self.assertTrue(session.is_preset)
+            self.assertIsNone(session.passphrase)
+
+        self.assertFalse(session.is_preset)
+        commands = [command for command in agent.commands if command != 'BYE']
+        self.assertEqual(commands, [f'PRESET_PASSPHRASE GRIP1 {PRESET_TTL} 7077',
+                                    f'PRESET_PASSPHRASE GRIP2 {PRESET_TTL} 7077',
+                                    'CLEAR_PASSPHRASE --mode=normal GRIP1',
+                                    'CLEAR_PASSPHRASE --mode=normal GRIP2'])
+
+    def test_agent_without_expiry_keeps_passphrase_until_cleared(self):
+        agent = self._start({'PRESET_PASSPHRASE GRIP1 60 ': [b'ERR 67108933 Not implemented']})
+
+        with AgentSession(['GRIP1', 'GRIP2'], 'pw', lambda: self.socket_path, ttl=60) as session:
+            self.assertTrue(session.is_preset)
+
+        commands = [command for command in agent.commands if command != 'BYE']
+        self.assertEqual(commands, ['PRESET_PASSPHRASE GRIP1 60 7077',
+                                    'PRESET_PASSPHRASE GRIP1 -1 7077',
+                                    'PRESET_PASSPHRASE GRIP2 -1 7077',
+                                    'CLEAR_PASSPHRASE --mode=normal GRIP1',
+                                    'CLEAR_PASSPHRASE --mode=normal GRIP2'])
+
+    def test_preset_ttl_grows_with_the_batch(self):
+        self.assertEqual(get_preset_ttl(), PRESET_TTL)
+        self.assertEqual(get_preset_ttl(600 * 1024 * 1024), PRESET_TTL + 600)
+
+    def test_forbidden_falls_back_to_passphrase(self):
+        agent = self._start({'PRESET_PASSPHRASE GRIP2': [b'ERR 67108941 Forbidden']})
+
+        with AgentSession(['GRIP1', 'GRIP2'], 'pw', lambda: self.socket_path) as session:
+            self.assertFalse(session.is_preset)
+            self.assertEqual(session.passphrase, 'pw')
+
+        # The keygrip that did get preset is cleared again right away
+        self.assertIn('CLEAR_PASSPHRASE --mode=normal GRIP1', agent.commands)
+
+    def test_missing_agent(self):
+        with AgentSession(['GRIP'], 'pw', lambda: self.socket_path) as session:
+            self.assertEqual(session.passphrase, 'pw')
+
+    def test_nothing_to_unlock(self):
+        resolver_calls = []
+
+        with AgentSession([], 'pw', lambda: resolver_calls.append(1)) as session:
+            self.assertEqual(session.passphrase, 'pw')
+
+        self.assertEqual(resolver_calls, [])
+
+    def test_clear_passphrases(self):
+        agent = self._start()
+
+        self.assertTrue(clear_passphrases(['GRIP1', None], lambda: self.socket_path))
+        self.assertIn('CLEAR_PASSPHRASE --mode=normal GRIP1', agent.commands)
+
+    def test_clear_passphrases_leaves_sessions_alone(self):
+        agent = self._start()
+
+        with AgentSession(['GRIP1'], 'pw', lambda: self.socket_path):
+            self.assertFalse(clear_passphrases(['GRIP1', 'GRIP2'], lambda: self.socket_path))
+            self.assertEqual(agent.commands.count('CLEAR_PASSPHRASE --mode=normal GRIP1'), 0)
+            self.assertIn('CLEAR_PASSPHRASE --mode=normal GRIP2', agent.commands)
+
+        self.assertTrue(clear_passphrases(['GRIP1'], lambda: self.socket_path))
+
+    def test_clear_passphrases_without_agent(self):
+        self.assertFalse(clear_passphrases(['GRIP'], lambda: self.socket_path))
+        self.assertTrue(clear_passphrases([], lambda: self.socket_path))
+
+
+@unittest.skipUnless(shutil.which('gpg') and shutil.which('gpgconf'), "gpg not installed")
+class TestRealAgent(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.home = os.path.join(self._tmp_dir.name, 'home')
+        os.mkdir(self.home, 0o700)
+        with open(os.path.join(self.home, 'gpg-agent.conf'), 'w') as agent_conf:
+            agent_conf.write('allow-preset-passphrase\n')
+
+        self._gpg('--passphrase', 'pw', '--quick-gen-key', 'Agent Test <agent@example.com>',
+                  'ed25519', 'sign', '0')
+        listing = self._gpg('--with-colons', '--with-keygrip', '--list-secret-keys').stdout
+        self.keygrip = [line.split(':')[9] for line in listing.decode().splitlines()
+                        if line.startswith('grp:')][0]
+
+    def tearDown(self):
+        subprocess.run(['gpgconf', '--homedir', self.home, '--kill', 'gpg-agent'], check=False)
+        self._tmp_dir.cleanup()
+
+    def _gpg(self, *args, check=True):
+        return subprocess.run(['gpg', '--homedir', self.home, '--batch',
+                               '--pinentry-mode', 'loopback'] + list(args),
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              input=b'data', check=check)
+
+    def _can_sign(self):
+        return self._gpg('--detach-sign', '-o', '-', check=False).returncode == 0
+
+    def test_session_unlocks_key_for_the_batch(self):
+        # Make sure the passphrase used to create the key isn't cached
+        subprocess.run(['gpgconf', '--homedir', self.home, '--reload', 'gpg-agent'], check=False)
+        self.assertFalse(self._can_sign())
+
+        socket_resolver = lambda: get_agent_socket(homedir=self.home)
+        with AgentSession([self.keygrip], 'pw', socket_resolver) as session:
+            self.assertTrue(session.is_preset)
+            self.assertTrue(self._can_sign())
+            self.assertTrue(self._can_sign())
+
+        self.assertFalse(self._can_sign())
+
+    def test_clear_passphrases_stops_wrong_passphrases_working(self):
+        self.assertEqual(self._gpg('--passphrase', 'pw', '--detach-sign', '-o', '-').returncode, 0)
+        wrong = ('--passphrase', 'wrong', '--detach-sign', '-o', '-')
+        self.assertEqual(self._gpg(*wrong, check=False).returncode, 0)
+
+        self.assertTrue(clear_passphrases([self.keygrip],
+                                          lambda: get_agent_socket(homedir=self.home)))
+        self.assertNotEqual(self._gpg(*wrong, check=False).returncode, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+
+from ez_gpg import archive
+from ez_gpg.archive import ArchiveError, extract_archive, get_archive_filename, \
+    is_encrypted_archive, write_archive
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.folder = os.path.join(self._tmp_dir.name, 'photos')
+        os.makedirs(os.path.join(self.folder, 'sub'))
+        for index in range(20):
+            with open(os.path.join(self.folder, 'sub', f"{index}.txt"), 'w') as data_file:
+                data_file.write(f"data {index}\n" * index)
+        with open(os.path.join(self.folder, 'top.txt'), 'w') as data_file:
+            data_file.write('top')
+        os.symlink('sub', os.path.join(self.folder, 'link'))
+
+        self.dest_dir = os.path.join(self._tmp_dir.name, 'out')
+        os.mkdir(self.dest_dir)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _roundtrip(self, compression):
+        stream = io.BytesIO()
+        self.assertEqual(write_archive(self.folder, stream, compression), 22)
+
+        stream.seek(0)
+        self.assertEqual(extract_archive(stream, self.dest_dir), 21)
+
+        extracted = os.path.join(self.dest_dir, 'photos')
+        with open(os.path.join(extracted, 'sub', '7.txt')) as data_file:
+            self.assertEqual(data_file.read(), "data 7\n" * 7)
+        self.assertEqual(os.readlink(os.path.join(extracted, 'link')), 'sub')
+
+        return stream.getvalue()
+
+    def test_roundtrip_uncompressed(self):
+        data = self._roundtrip(archive.COMPRESSION_NONE)
+        self.assertTrue(tarfile.is_tarfile(io.BytesIO(data)))
+
+    def test_roundtrip_gzip(self):
+        data = self._roundtrip(archive.COMPRESSION_GZIP)
+        self.assertTrue(data.startswith(b'\x1f\x8b'))
+
+    @unittest.skipIf(archive.zstandard is None, "zstandard not installed")
+    def test_roundtrip_zstd(self):
+        data = self._roundtrip(archive.COMPRESSION_ZSTD)
+        self.assertTrue(data.startswith(archive.ZSTD_MAGIC))
+
+    def test_unknown_compression(self):
+        with self.assertRaises(ArchiveError):
+            write_archive(self.folder, io.BytesIO(), 'lzma9000')
+
+        with self.assertRaises(ArchiveError):
+            write_archive(os.path.join(self.folder, 'top.txt'), io.BytesIO())
+
+    def test_refuses_members_outside_destination(self):
+        stream = io.BytesIO()
+        with tarfile.open(fileobj=stream, mode='w') as evil_archive:
+            member = tarfile.TarInfo('../evil.txt')
+            member.size = 4
+            evil_archive.addfile(member, io.BytesIO(b'evil'))
+        stream.seek(0)
+
+        with self.assertRaises(ArchiveError):
+            extract_archive(stream, self.dest_dir)
+
+        self.assertFalse(os.path.exists(os.path.join(self._tmp_dir.name, 'evil.txt')))
+
+    def test_invalid_archive(self):
+        with self.assertRaises(ArchiveError):
+            extract_archive(io.BytesIO(b'not an archive' * 100), self.dest_dir)
+
+    def test_filenames(self):
+        self.assertEqual(get_archive_filename('/data/photos/'), '/data/photos.tar.gz.gpg')
+        self.assertEqual(get_archive_filename('photos', archive.COMPRESSION_NONE),
+                         'photos.tar.gpg')
+        self.assertTrue(is_encrypted_archive('photos.tar.zst.gpg'))
+        self.assertFalse(is_encrypted_archive('photos.gpg'))
+
+
+if __name__ == '__main__':
+    unittest.main()
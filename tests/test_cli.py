@@ -0,0 +1,360 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import ANY, patch, MagicMock
+
+from ez_gpg import cli
+from ez_gpg.keyserver import KeyserverError, SearchResult
+from ez_gpg.streaming import Progress, StreamResult
+from ez_gpg.results import ExportResult, FileResult, ImportReport, KeyImportResult, \
+    KeyRefreshResult, ManifestVerifyResult, RefreshReport, VerifyResult
+
+
+class TestMain(unittest.TestCase):
+    def _run(self, argv):
+        output = io.StringIO()
+        exit_code = cli.main(argv, output)
+
+        return exit_code, [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_is_cli_invocation(self):
+        self.assertTrue(cli.is_cli_invocation(['encrypt', 'file']))
+        self.assertTrue(cli.is_cli_invocation(['--help']))
+        self.assertFalse(cli.is_cli_invocation([]))
+        self.assertFalse(cli.is_cli_invocation(['--gapplication-service']))
+
+    @patch('ez_gpg.cli.GpgUtils.sign_files')
+    def test_sign_with_default_manifest(self, mock_sign):
+        mock_sign.return_value = [FileResult('a', 'a.asc', True, 'signature created')]
+
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+             patch.dict(os.environ, {cli.PASSPHRASE_ENV: 'pass'}):
+            data_file = os.path.join(tmp_dir, 'a')
+            exit_code, records = self._run(['sign', '-k', 'KEY', '-a', '--manifest', data_file])
+
+        self.assertEqual(exit_code, 0)
+        mock_sign.assert_called_once_with([data_file], 'KEY', 'pass', True,
+                                          os.path.join(tmp_dir, 'SHA256SUMS'), None)
+        self.assertEqual(records[0]['operation'], 'sign')
+
+    @patch('ez_gpg.cli.GpgUtils.verify_manifest')
+    def test_verify_manifest_reports_every_file(self, mock_verify_manifest):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            manifest_filename = os.path.join(tmp_dir, 'SHA256SUMS')
+            open(manifest_filename, 'w').close()
+            open(manifest_filename + '.sig', 'w').close()
+            mock_verify_manifest.return_value = ManifestVerifyResult(
+                VerifyResult(manifest_filename, manifest_filename + '.sig', True),
+                [FileResult('a', manifest_filename, True, 'OK'),
+                 FileResult('b', manifest_filename, False, 'MISMATCH')])
+
+            exit_code, records = self._run(['verify', '-R', tmp_dir])
+
+        mock_verify_manifest.assert_called_once_with(manifest_filename,
+                                                     manifest_filename + '.sig', None, False)
+        self.assertEqual(exit_code, 1)
+        self.assertEqual([record['file'] for record in records], [manifest_filename, 'a', 'b'])
+        self.assertEqual(records[2]['status'], 'MISMATCH')
+
+    @patch('ez_gpg.cli.GpgUtils.encrypt_files_pki')
+    def test_encrypt_prints_json_lines(self, mock_encrypt):
+        mock_encrypt.return_value = [FileResult('a', 'a.gpg', True, 'encryption ok'),
+                                     FileResult('b', error='boom')]
+
+        exit_code, records = self._run(['encrypt', '-r', 'KEY1', '-r', 'KEY2', '-j', '3',
+                                        'a', 'b'])
+
+        self.assertEqual(exit_code, 1)
+        mock_encrypt.assert_called_once_with(['a', 'b'], ['KEY1', 'KEY2'], False, 3,
+                                             compression=ANY, on_progress=None)
+        self.assertTrue(mock_encrypt.call_args[1]['compression'].auto)
+        self.assertEqual(records[0], {'operation': 'encrypt', 'file': 'a', 'output': 'a.gpg',
+                                      'success': True, 'status': 'encryption ok',
+                                      'error': None})
+        self.assertEqual(records[1]['error'], 'boom')
+
+    @patch.dict(os.environ, {cli.PASSPHRASE_ENV: 'from-env'})
+    @patch('ez_gpg.cli.GpgUtils.encrypt_files_symmetric', return_value=[])
+    def test_symmetric_passphrase_from_environment(self, mock_encrypt):
+        exit_code, records = self._run(['encrypt', '--symmetric', 'a'])
+
+        self.assertEqual(exit_code, 0)
+        mock_encrypt.assert_called_once_with(['a'], 'from-env', False, None, compression=ANY,
+                                             on_progress=None)
+
+    @patch('ez_gpg.cli.GpgUtils.encrypt_files_pki', return_value=[])
+    def test_encrypt_compression_options(self, mock_encrypt):
+        self._run(['encrypt', '-r', 'KEY', '--compress-algo', 'bzip2', '--compress-level', '9',
+                   '--no-compress-detect', 'a'])
+
+        compression = mock_encrypt.call_args[1]['compression']
+        self.assertEqual((compression.algo, compression.level, compression.auto),
+                         ('bzip2', 9, False))
+
+        with self.assertRaises(SystemExit):
+            self._run(['encrypt', '-r', 'KEY', '--compress-level', '10', 'a'])
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_symmetric_requires_passphrase(self):
+        with self.assertRaises(SystemExit):
+            self._run(['encrypt', '--symmetric', 'a'])
+
+    @patch.dict(os.environ, {cli.PASSPHRASE_ENV: 'pass'})
+    @patch('ez_gpg.cli.GpgUtils.encrypt_folders')
+    def test_encrypt_archive(self, mock_encrypt_folders):
+        mock_encrypt_folders.return_value = [FileResult('photos', 'photos.tar.gpg', True,
+                                                        'encryption ok')]
+
+        exit_code, records = self._run(['encrypt', '-c', '--archive', '--archive-compression',
+                                        'none', 'photos'])
+
+        self.assertEqual(exit_code, 0)
+        mock_encrypt_folders.assert_called_once_with(['photos'], None, 'pass', False, 'none',
+                                                     None, gpg_compression=ANY,
+                                                     on_progress=None)
+        self.assertEqual(records[0]['output'], 'photos.tar.gpg')
+
+    @patch('ez_gpg.cli.GpgUtils.decrypt_archive')
+    def test_decrypt_extract(self, mock_decrypt_archive):
+        mock_decrypt_archive.return_value = FileResult('a.tar.gz.gpg', 'out', True,
+                                                       'decryption ok')
+
+        exit_code, records = self._run(['decrypt', '-x', '-C', 'out', 'a.tar.gz.gpg'])
+
+        self.assertEqual(exit_code, 0)
+        mock_decrypt_archive.assert_called_once_with('a.tar.gz.gpg', None, 'out')
+        self.assertEqual(records[0]['operation'], 'decrypt')
+
+    @patch.dict(os.environ, {cli.PASSPHRASE_ENV: 'pass'})
+    @patch('ez_gpg.cli.GpgUtils.decrypt_stream')
+    def test_decrypt_pipe(self, mock_decrypt_stream):
+        def decrypt_stream(src, dst, passphrase, on_progress=None):
+            dst.write(src.read().lower())
+            return StreamResult(0, 4, 4, 0.1, [], [])
+
+        mock_decrypt_stream.side_effect = decrypt_stream
+        stdin = io.TextIOWrapper(io.BytesIO(b'DATA'))
+        stdout = io.TextIOWrapper(io.BytesIO())
+        stderr = io.StringIO()
+
+        with patch('sys.stdin', stdin), patch('sys.stdout', stdout), patch('sys.stderr', stderr):
+            exit_code, records = self._run(['decrypt', '-'])
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(records, [])
+        self.assertEqual(stdout.buffer.getvalue(), b'data')
+        self.assertEqual(mock_decrypt_stream.call_args[0][2], 'pass')
+        record = json.loads(stderr.getvalue().splitlines()[-1])
+        self.assertEqual((record['file'], record['status']), ('-', 'decryption ok'))
+
+        with self.assertRaises(SystemExit):
+            self._run(['decrypt', '-', 'other.gpg'])
+
+    @patch('ez_gpg.cli.GpgUtils.encrypt_stream')
+    def test_encrypt_pipe_failure(self, mock_encrypt_stream):
+        mock_encrypt_stream.return_value = StreamResult(2, 0, 0, 0.1, [], ['gpg: no key'])
+        stderr = io.StringIO()
+
+        with patch('sys.stderr', stderr):
+            exit_code, _ = self._run(['encrypt', '-r', 'KEY', '-a', '-'])
+
+        self.assertEqual(exit_code, 1)
+        self.assertEqual(mock_encrypt_stream.call_args[0][2:5], (['KEY'], None, True))
+        self.assertEqual(json.loads(stderr.getvalue())['error'], 'gpg: no key')
+
+    @patch('ez_gpg.cli.GpgUtils.decrypt_files', return_value=[])
+    def test_progress_line(self, mock_decrypt):
+        self._run(['decrypt', '--progress', 'a.gpg'])
+
+        on_progress = mock_decrypt.call_args[1]['on_progress']
+        self.assertIsInstance(on_progress, cli.ProgressLine)
+
+        stream = io.StringIO()
+        line = cli.ProgressLine(stream)
+        line(Progress(512, 0, 1.0, total_size=1024))
+        line(Progress(1024, 0, 2.0, total_size=1024, done=True))
+
+        first, second = stream.getvalue().split('\r')[1:]
+        self.assertEqual(first, '512.0 B / 1.0 KiB (50%) at 512.0 B/s, ETA 1s')
+        # The shorter final line blanks out what's left of the previous one
+        self.assertEqual(len(second), len(first) + 1)
+        self.assertEqual(second.rstrip(), '1.0 KiB / 1.0 KiB (100%) at 512.0 B/s')
+        self.assertTrue(second.endswith('\n'))
+
+    @patch('ez_gpg.cli.GpgUtils.decrypt_files', return_value=[])
+    def test_directories_are_reported_not_processed(self, mock_decrypt):
+        with tempfile.TemporaryDirectory() as directory:
+            exit_code, records = self._run(['decrypt', directory])
+
+        self.assertEqual(exit_code, 1)
+        mock_decrypt.assert_called_once_with([], None, None, on_progress=None)
+        self.assertEqual(records[0]['file'], directory)
+        self.assertFalse(records[0]['success'])
+
+    @patch('ez_gpg.cli.GpgUtils.verify_file')
+    def test_verify_uses_sibling_signatures(self, mock_verify):
+        mock_verify.side_effect = lambda filename, signature, use_cache: \
+            VerifyResult(filename, signature, True, 'signature valid')
+
+        with tempfile.TemporaryDirectory() as directory:
+            data_file = os.path.join(directory, 'data')
+            open(data_file, 'w').close()
+            open(data_file + '.asc', 'w').close()
+
+            exit_code, records = self._run(['verify', '-R', '--cache', directory])
+
+        self.assertEqual(exit_code, 0)
+        mock_verify.assert_called_once_with(data_file, data_file + '.asc', True)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['signature'], data_file + '.asc')
+        self.assertTrue(records[0]['valid'])
+
+    @patch('ez_gpg.cli.GpgUtils.verify_file')
+    def test_verify_directory_skips_unsigned_files(self, mock_verify):
+        mock_verify.side_effect = lambda filename, signature, use_cache: \
+            VerifyResult(filename, signature, True, 'signature valid')
+
+        with tempfile.TemporaryDirectory() as directory:
+            os.mkdir(os.path.join(directory, 'sub'))
+            for index in range(5):
+                open(os.path.join(directory, 'sub', f"unsigned{index}"), 'w').close()
+            data_file = os.path.join(directory, 'sub', 'data')
+            open(data_file, 'w').close()
+            open(data_file + '.sig', 'w').close()
+            empty = os.path.join(directory, 'empty')
+            os.mkdir(empty)
+
+            exit_code, records = self._run(['verify', directory])
+            self.assertEqual(exit_code, 1)
+            self.assertEqual(records[0]['error'], "No signatures found")
+            mock_verify.assert_not_called()
+
+            exit_code, records = self._run(['verify', '-R', directory])
+            self.assertEqual(exit_code, 0)
+            mock_verify.assert_called_once_with(data_file, data_file + '.sig', False)
+            self.assertEqual([record['file'] for record in records], [data_file])
+
+            exit_code, records = self._run(['verify', empty])
+            self.assertEqual(exit_code, 1)
+            self.assertEqual(records[0]['error'], "No signatures found")
+
+    @patch('ez_gpg.cli.GpgUtils.import_keys_bulk')
+    def test_import_prints_a_line_per_key(self, mock_import):
+        mock_import.return_value = ImportReport(
+            [KeyImportResult('AAAA', KeyImportResult.FLAG_NEW), KeyImportResult('BBBB')],
+            file_errors=[FileResult('missing.asc', error='No such file')])
+
+        exit_code, records = self._run(['import', 'a.asc', 'missing.asc'])
+
+        self.assertEqual(exit_code, 1)
+        mock_import.assert_called_once_with(['a.asc', 'missing.asc'])
+        self.assertEqual([(record.get('fingerprint'), record.get('status')) for record in records],
+                         [('AAAA', 'new'), ('BBBB', 'unchanged'), (None, None)])
+        self.assertEqual(records[2]['file'], 'missing.asc')
+        self.assertEqual({record['operation'] for record in records}, {'import'})
+
+    @patch('ez_gpg.cli.GpgUtils.export_keys_to_dir')
+    @patch('ez_gpg.cli.GpgUtils.export_keys')
+    def test_export(self, mock_export, mock_export_to_dir):
+        mock_export.return_value = ExportResult('all.gpg', fingerprints=['AAAA'], success=True)
+        mock_export_to_dir.return_value = [ExportResult('keys/AAAA.asc', ['AAAA'], ['AAAA'], True),
+                                           ExportResult('keys/B.asc', ['B'], error='Unknown key')]
+
+        exit_code, records = self._run(['export', '-o', 'all.gpg'])
+
+        self.assertEqual(exit_code, 0)
+        mock_export.assert_called_once_with([], 'all.gpg', False)
+        self.assertEqual(records[0]['fingerprints'], ['AAAA'])
+
+        exit_code, records = self._run(['export', '-a', '-d', 'keys', 'AAAA', 'B'])
+
+        self.assertEqual(exit_code, 1)
+        mock_export_to_dir.assert_called_once_with(['AAAA', 'B'], 'keys', True, None)
+        self.assertEqual([record['success'] for record in records], [True, False])
+
+    @patch('ez_gpg.cli.GpgUtils.search_keys')
+    def test_search(self, mock_search):
+        mock_search.side_effect = [[SearchResult('A' * 40, uids=['Alice']), SearchResult('B' * 16)],
+                                   KeyserverError("all down")]
+
+        exit_code, records = self._run(['search', '--no-cache', 'alice@example.org', 'ABCD'])
+
+        self.assertEqual(exit_code, 1)
+        mock_search.assert_any_call('alice@example.org', None, 10, use_cache=False)
+        self.assertEqual([(record['query'], record['success']) for record in records],
+                         [('alice@example.org', True), ('alice@example.org', True),
+                          ('ABCD', False)])
+        self.assertEqual(records[0]['fingerprint'], 'A' * 40)
+        self.assertIsNone(records[1]['fingerprint'])
+
+    @patch('ez_gpg.cli.GpgUtils.fetch_key')
+    def test_fetch(self, mock_fetch):
+        mock_fetch.side_effect = ['AAAA', None, RuntimeError("rogue certs")]
+
+        exit_code, records = self._run(['fetch', '--timeout', '3', 'A', 'B', 'C'])
+
+        self.assertEqual(exit_code, 1)
+        mock_fetch.assert_any_call(None, 'A', 3.0)
+        self.assertEqual([(record['fingerprint'], record['success']) for record in records],
+                         [('AAAA', True), (None, False), (None, False)])
+        self.assertEqual(records[2]['error'], "rogue certs")
+
+    @patch('ez_gpg.cli.GpgUtils.refresh_keys')
+    def test_refresh(self, mock_refresh):
+        mock_refresh.return_value = RefreshReport([
+            KeyRefreshResult('AAAA', changes={'revoked': True}),
+            KeyRefreshResult('BBBB'),
+            KeyRefreshResult('CCCC', error="timed out")])
+
+        exit_code, records = self._run(['refresh', '--changed-only', '-j', '4', '--rate', '0'])
+
+        self.assertEqual(exit_code, 1)
+        mock_refresh.assert_called_once_with(None, None, 4, 0.0, cli.KEYSERVER_TIMEOUT)
+        self.assertEqual([(record['fingerprint'], record['status'], record['success'])
+                          for record in records],
+                         [('AAAA', 'changed', True), ('CCCC', 'failed', False)])
+
+        mock_refresh.return_value = RefreshReport([KeyRefreshResult('AAAA')])
+        exit_code, records = self._run(['refresh', 'AAAA', '-k', 'keys.example.org'])
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(mock_refresh.call_args[0][:2], (['AAAA'], 'keys.example.org'))
+        self.assertEqual(records[0]['operation'], 'refresh')
+
+    @patch('ez_gpg.cli.GpgUtils.get_gpg_keys')
+    def test_keys(self, mock_get_keys):
+        key = MagicMock()
+        key.to_dict.return_value = {'key_id': 'ABCD'}
+        mock_get_keys.return_value = [key]
+
+        exit_code, records = self._run(['keys', '--secret'])
+
+        self.assertEqual(exit_code, 0)
+        mock_get_keys.assert_called_once_with(True)
+        self.assertEqual(records, [{'key_id': 'ABCD', 'operation': 'keys'}])
+
+    @patch('ez_gpg.cli.GpgUtils.get_gpg_keys', return_value=[])
+    def test_metrics_go_to_stderr(self, mock_get_keys):
+        stderr = io.StringIO()
+        with patch('sys.stderr', stderr):
+            exit_code, records = self._run(['keys', '--metrics'])
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(records, [])
+        self.assertIn('counters', json.loads(stderr.getvalue()))
+
+    def test_cli_does_not_import_gtk(self):
+        code = "import sys, ez_gpg.cli; print('gi' in sys.modules)"
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=os.path.dirname(os.path.dirname(__file__)),
+                                         universal_newlines=True)
+
+        self.assertEqual(output.strip(), 'False')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from ez_gpg.compression import CompressionPolicy, get_entropy, has_compressed_signature, \
+    is_incompressible
+
+
+class TestDetection(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _write(self, name, data):
+        filename = os.path.join(self._tmp_dir.name, name)
+        with open(filename, 'wb') as data_file:
+            data_file.write(data)
+
+        return filename
+
+    def test_signatures(self):
+        self.assertTrue(has_compressed_signature(gzip.compress(b'data')))
+        self.assertTrue(has_compressed_signature(b'\x00\x00\x00\x18ftypmp42'))
+        self.assertTrue(has_compressed_signature(b'RIFF\x00\x00\x00\x00WEBPVP8 '))
+        self.assertFalse(has_compressed_signature(b'plain old text'))
+
+    def test_entropy(self):
+        self.assertEqual(get_entropy(b''), 0.0)
+        self.assertEqual(get_entropy(b'aaaa'), 0.0)
+        self.assertEqual(get_entropy(bytes(range(256))), 8.0)
+
+    def test_is_incompressible(self):
+        self.assertTrue(is_incompressible(self._write('random.bin', os.urandom(64 * 1024))))
+        self.assertTrue(is_incompressible(self._write('small.gz', gzip.compress(b'x'))))
+        self.assertFalse(is_incompressible(self._write('text.txt', b'hello world\n' * 10000)))
+
+        # Too little to judge by entropy
+        self.assertFalse(is_incompressible(self._write('tiny.bin', os.urandom(100))))
+
+    def test_policy_args(self):
+        random_file = self._write('random.bin', os.urandom(64 * 1024))
+        text_file = self._write('text.txt', b'hello world\n' * 10000)
+
+        self.assertEqual(CompressionPolicy().get_args(random_file), [])
+        self.assertEqual(CompressionPolicy('bzip2', 9).get_args(), ['--compress-algo', 'bzip2',
+                                                                    '-z', '9'])
+        self.assertEqual(CompressionPolicy(level=0).get_args(), ['--compress-algo', 'none'])
+
+        auto = CompressionPolicy('zlib', auto=True)
+        self.assertEqual(auto.get_args(random_file), ['--compress-algo', 'none'])
+        self.assertEqual(auto.get_args(text_file), ['--compress-algo', 'zlib'])
+        self.assertEqual(auto.get_args(os.path.join(self._tmp_dir.name, 'missing')),
+                         ['--compress-algo', 'zlib'])
+
+    def test_policy_validation(self):
+        with self.assertRaises(ValueError):
+            CompressionPolicy('lzma')
+
+        with self.assertRaises(ValueError):
+            CompressionPolicy(level=10)
+
+
+if __name__ == '__main__':
+    unittest.main()
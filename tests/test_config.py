@@ -1,4 +1,6 @@
+import os
 import unittest
+from unittest.mock import patch
 
 from ez_gpg.config import Config
 
@@ -7,6 +9,46 @@ class TestConfig(unittest.TestCase):
     def test_key_id_size(self):
         self.assertEqual(Config.KEY_ID_SIZE, 16)
 
+    @patch.dict(os.environ, {'GNUPGHOME': '/tmp/gnupg_home'})
+    def test_gnupg_home_from_environment(self):
+        self.assertEqual(Config.get_gnupg_home(), '/tmp/gnupg_home')
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_gnupg_home_default(self):
+        self.assertEqual(Config.get_gnupg_home(), os.path.expanduser('~/.gnupg'))
+
+    @patch.dict(os.environ, {}, clear=True)
+    @patch('os.cpu_count', return_value=8)
+    def test_max_jobs_defaults_to_cpu_count(self, mock_cpu_count):
+        self.assertEqual(Config.get_max_jobs(), 8)
+        self.assertEqual(Config.get_max_jobs(2), 2)
+
+    @patch.dict(os.environ, {}, clear=True)
+    @patch('os.cpu_count', return_value=2)
+    def test_explicit_max_jobs_not_bounded_by_cpu_count(self, mock_cpu_count):
+        self.assertEqual(Config.get_max_jobs(12), 12)
+        self.assertEqual(Config.get_max_jobs(64), Config.MAX_IO_JOBS)
+
+    @patch.dict(os.environ, {}, clear=True)
+    @patch('os.cpu_count', return_value=64)
+    def test_max_jobs_bounded_by_io_limit(self, mock_cpu_count):
+        self.assertEqual(Config.get_max_jobs(), Config.MAX_IO_JOBS)
+        self.assertEqual(Config.get_max_jobs(io_limit=4), 4)
+        self.assertEqual(Config.get_max_jobs(32, io_limit=24), 24)
+
+    @patch.dict(os.environ, {'EZGPG_MAX_IO_JOBS': '3'})
+    def test_io_limit_from_environment(self):
+        self.assertEqual(Config.get_io_limit(), 3)
+        self.assertEqual(Config.get_max_jobs(8), 3)
+
+    @patch.dict(os.environ, {'EZGPG_MAX_IO_JOBS': 'lots'})
+    def test_invalid_io_limit_ignored(self):
+        self.assertEqual(Config.get_io_limit(), Config.MAX_IO_JOBS)
+
+    @patch('os.cpu_count', return_value=None)
+    def test_max_jobs_at_least_one(self, mock_cpu_count):
+        self.assertEqual(Config.get_max_jobs(), 1)
+
     def test_keyservers_returns_list(self):
         servers = Config.get_keyservers()
         self.assertIsInstance(servers, list)
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+from ez_gpg.disk_cache import DiskCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp_dir.name, 'sub', 'cache.sqlite')
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _cache(self, **kwargs):
+        cache = DiskCache(self.path, clock=self.clock, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_round_trip_persists(self):
+        cache = self._cache()
+        cache.put('key', {'valid': True, 'list': [1, 2]})
+        cache.close()
+
+        self.assertEqual(self._cache().get('key'), {'valid': True, 'list': [1, 2]})
+        self.assertIsNone(self._cache().get('missing'))
+
+    def test_lru_eviction(self):
+        cache = self._cache(max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_ttl(self):
+        cache = self._cache(ttl=5)
+        cache.put('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+
+        self.clock.now += 10
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_delete_and_clear(self):
+        cache = self._cache()
+        cache.put('a', 1)
+        cache.put('b', 2)
+
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_unusable_path_is_a_miss(self):
+        blocker = os.path.join(self._tmp_dir.name, 'file')
+        open(blocker, 'w').close()
+        cache = DiskCache(os.path.join(blocker, 'cache.sqlite'))
+
+        cache.put('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
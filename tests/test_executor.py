@@ -0,0 +1,150 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from ez_gpg.executor import JobExecutor, parallel_map
+
+
+class TestJobExecutor(unittest.TestCase):
+    def setUp(self):
+        self.executor = JobExecutor(max_workers=1)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_result_is_delivered(self):
+        on_done = MagicMock()
+
+        job = self.executor.submit(lambda a, b: a + b, 1, 2, on_done=on_done)
+        self.assertEqual(job.future.result(timeout=5), 3)
+
+        on_done.assert_called_once_with(3)
+        self.assertTrue(job.is_done())
+
+    def test_error_is_delivered(self):
+        error = ValueError('bad')
+        on_error = MagicMock()
+        on_done = MagicMock()
+
+        def fail():
+            raise error
+
+        job = self.executor.submit(fail, on_done=on_done, on_error=on_error)
+        job.future.result(timeout=5)
+
+        on_error.assert_called_once_with(error)
+        on_done.assert_not_called()
+
+    def test_callbacks_go_through_dispatch(self):
+        dispatched = []
+        executor = JobExecutor(max_workers=1,
+                               dispatch=lambda func, *args: dispatched.append((func, args)))
+        on_done = MagicMock()
+
+        job = executor.submit(lambda: 'done', on_done=on_done)
+        job.future.result(timeout=5)
+        executor.shutdown()
+
+        on_done.assert_not_called()
+        self.assertEqual(len(dispatched), 1)
+
+        func, args = dispatched[0]
+        self.assertFalse(func(*args))
+        on_done.assert_called_once_with('done')
+
+    def test_cancelled_job_does_not_run(self):
+        blocker = threading.Event()
+        self.executor.submit(blocker.wait, 5)
+
+        func = MagicMock()
+        job = self.executor.submit(func)
+        job.cancel()
+        blocker.set()
+
+        self.executor.shutdown()
+        func.assert_not_called()
+        self.assertTrue(job.is_cancelled())
+
+    def test_cancelled_queued_job_is_forgotten(self):
+        blocker = threading.Event()
+        first = self.executor.submit(blocker.wait, 5)
+
+        queued = self.executor.submit(MagicMock())
+        queued.cancel()
+        self.assertTrue(queued.future.cancelled())
+        self.assertEqual(self.executor._jobs, {first})
+
+        blocker.set()
+        self.executor.shutdown()
+        self.assertEqual(self.executor._jobs, set())
+
+    def test_cancellable_job_can_stop_early(self):
+        started = threading.Event()
+        processed = []
+
+        def work(items, is_cancelled=None):
+            for item in items:
+                if item == 1:
+                    started.set()
+                    while not is_cancelled():
+                        time.sleep(0.001)
+                if is_cancelled():
+                    break
+                processed.append(item)
+            return processed
+
+        on_done = MagicMock()
+        job = self.executor.submit(work, [0, 1, 2], cancellable=True, on_done=on_done)
+        started.wait(5)
+        job.cancel()
+        self.executor.shutdown()
+
+        self.assertEqual(processed, [0])
+        on_done.assert_not_called()
+
+    def test_cancel_all(self):
+        blocker = threading.Event()
+        first = self.executor.submit(blocker.wait, 5)
+        second = self.executor.submit(MagicMock())
+
+        self.executor.cancel_all()
+        blocker.set()
+
+        self.assertTrue(first.is_cancelled())
+        self.assertTrue(second.is_cancelled())
+
+
+class TestParallelMap(unittest.TestCase):
+    def test_preserves_order(self):
+        def slow_square(value):
+            time.sleep(0.01 * (5 - value))
+            return value * value
+
+        self.assertEqual(parallel_map(slow_square, range(5), max_workers=5),
+                         [0, 1, 4, 9, 16])
+
+    def test_runs_concurrently(self):
+        barrier = threading.Barrier(4, timeout=5)
+
+        # Would time out if the items ran one after another
+        results = parallel_map(lambda item: barrier.wait() is not None, range(4), max_workers=4)
+        self.assertEqual(results, [True] * 4)
+
+    def test_single_worker_runs_inline(self):
+        thread_names = parallel_map(lambda item: threading.current_thread().name, [1, 2])
+        self.assertEqual(thread_names, [threading.current_thread().name] * 2)
+
+    def test_cancelled_items_are_skipped(self):
+        processed = []
+
+        def work(item):
+            processed.append(item)
+            return item
+
+        results = parallel_map(work, [1, 2, 3], is_cancelled=lambda: len(processed) >= 2)
+        self.assertEqual(results, [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
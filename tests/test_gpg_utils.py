@@ -1,16 +1,27 @@
 import os
+import shutil
+import subprocess
 import sys
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 
-# Mock gi and GTK before importing gpg_utils so tests run without GTK
-gi_mock = MagicMock()
-gi_mock.require_version = MagicMock()
-sys.modules['gi'] = gi_mock
-sys.modules['gi.repository'] = MagicMock()
-sys.modules['gi.repository.Gtk'] = MagicMock()
-
+from ez_gpg.archive import COMPRESSION_NONE
+from ez_gpg.compression import CompressionPolicy
+from ez_gpg.config import Config
 from ez_gpg.gpg_utils import GpgUtils
+from ez_gpg.keys import Key
+from tests.test_keyserver import FakeKeyserver
+
+
+class TestImport(unittest.TestCase):
+    def test_core_does_not_import_gtk(self):
+        code = "import sys, ez_gpg.gpg_utils; print('gi' in sys.modules)"
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=os.path.dirname(os.path.dirname(__file__)),
+                                         universal_newlines=True)
+
+        self.assertEqual(output.strip(), 'False')
 
 
 class TestFindGpgBinary(unittest.TestCase):
@@ -80,6 +91,12 @@ class TestFindGpgBinary(unittest.TestCase):
 
 
 class TestGetGpgKeyring(unittest.TestCase):
+    def setUp(self):
+        GpgUtils.invalidate_keyring()
+
+    def tearDown(self):
+        GpgUtils.invalidate_keyring()
+
     @patch('ez_gpg.gpg_utils.gnupg.GPG')
     @patch.object(GpgUtils, '_find_gpg_binary', return_value='/usr/local/bin/gpg')
     def test_passes_binary_to_gnupg(self, mock_find, mock_gpg_class):
@@ -87,8 +104,36 @@ class TestGetGpgKeyring(unittest.TestCase):
         mock_gpg_class.assert_called_once_with(gpgbinary='/usr/local/bin/gpg',
                                                      options=['--pinentry-mode', 'loopback'])
 
+    @patch('ez_gpg.gpg_utils.gnupg.GPG')
+    @patch.object(GpgUtils, '_find_gpg_binary', return_value='/usr/bin/gpg')
+    def test_reuses_pooled_keyring(self, mock_find, mock_gpg_class):
+        first = GpgUtils.get_gpg_keyring()
+        second = GpgUtils.get_gpg_keyring()
+
+        self.assertIs(first, second)
+        mock_find.assert_called_once_with()
+        mock_gpg_class.assert_called_once()
+
+    @patch('ez_gpg.gpg_utils.gnupg.GPG')
+    @patch.object(GpgUtils, '_find_gpg_binary', return_value='/usr/bin/gpg')
+    def test_invalidate_rebuilds_keyring(self, mock_find, mock_gpg_class):
+        mock_gpg_class.side_effect = [MagicMock(), MagicMock()]
+
+        first = GpgUtils.get_gpg_keyring()
+        GpgUtils.invalidate_keyring()
+        second = GpgUtils.get_gpg_keyring()
+
+        self.assertIsNot(first, second)
+        self.assertEqual(mock_gpg_class.call_count, 2)
+
 
 class TestCreateKey(unittest.TestCase):
+    def setUp(self):
+        GpgUtils.invalidate_keyring()
+
+    def tearDown(self):
+        GpgUtils.invalidate_keyring()
+
     @patch('ez_gpg.gpg_utils.gnupg.GPG')
     @patch.object(GpgUtils, '_find_gpg_binary', return_value='/usr/bin/gpg')
     def test_create_key_returns_fingerprint_on_success(self, mock_find, mock_gpg_class):
@@ -146,5 +191,799 @@ class TestCreateKey(unittest.TestCase):
         )
 
 
+    @patch('ez_gpg.gpg_utils.gnupg.GPG')
+    @patch.object(GpgUtils, '_find_gpg_binary', return_value='/usr/bin/gpg')
+    def test_create_key_with_curve_adds_encryption_subkey(self, mock_find, mock_gpg_class):
+        mock_gpg = mock_gpg_class.return_value
+        mock_gpg.gen_key.return_value.fingerprint = 'FINGERPRINT123'
+
+        GpgUtils.create_key('User', 'u@e.com', 'pass', key_type='EDDSA', key_curve='ed25519')
+
+        mock_gpg.gen_key_input.assert_called_once_with(
+            key_type='EDDSA',
+            key_curve='ed25519',
+            subkey_type='ECDH',
+            subkey_curve='cv25519',
+            name_real='User',
+            name_email='u@e.com',
+            passphrase='pass',
+        )
+
+
+class TestGetGpgKeys(unittest.TestCase):
+    def setUp(self):
+        GpgUtils.invalidate_keyring()
+
+    def tearDown(self):
+        GpgUtils.invalidate_keyring()
+
+    @patch('ez_gpg.gpg_utils.gnupg.GPG')
+    @patch.object(GpgUtils, '_find_gpg_binary', return_value='/usr/bin/gpg')
+    def test_listing_is_sorted_by_name(self, mock_find, mock_gpg_class):
+        mock_gpg = MagicMock()
+        mock_gpg_class.return_value = mock_gpg
+        mock_gpg.list_keys.return_value = [
+            {'keyid': '2222222222222222', 'fingerprint': 'F2', 'uids': ['zed'], 'subkeys': []},
+            {'keyid': '1111111111111111', 'fingerprint': 'F1', 'uids': ['Adam'], 'subkeys': []},
+        ]
+
+        keys = GpgUtils.get_gpg_keys()
+        self.assertEqual([key.key_name for key in keys], ['Adam', 'zed'])
+        self.assertIs(GpgUtils.get_key_by_id('2222222222222222'), keys[1])
+
+    @patch('ez_gpg.gpg_utils.gnupg.GPG')
+    @patch.object(GpgUtils, '_find_gpg_binary', return_value='/usr/bin/gpg')
+    def test_listing_is_cached_until_invalidated(self, mock_find, mock_gpg_class):
+        mock_gpg = MagicMock()
+        mock_gpg_class.return_value = mock_gpg
+        mock_gpg.list_keys.return_value = [{
+            'keyid': '0123456789ABCDEF',
+            'fingerprint': 'FFFF0123456789ABCDEF',
+            'uids': ['Test User <test@example.com>'],
+            'subkeys': [['FEDCBA9876543210', 'e', 'FFFFFEDCBA9876543210']],
+        }]
+
+        keys = GpgUtils.get_gpg_keys()
+        self.assertEqual(keys[0].key_id, '0123456789ABCDEF')
+        self.assertEqual(keys[0].friendly_name,
+                         'Test User <test@example.com> |0123456789ABCDEF|')
+        self.assertEqual(keys[0][3], ['FEDCBA9876543210'])
+
+        GpgUtils.get_gpg_keys()
+        mock_gpg.list_keys.assert_called_once_with(False)
+
+        GpgUtils.invalidate_key_cache()
+        GpgUtils.get_gpg_keys()
+        self.assertEqual(mock_gpg.list_keys.call_count, 2)
+
+
+class TestFileOperations(unittest.TestCase):
+    def setUp(self):
+        GpgUtils.invalidate_keyring()
+
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.filenames = []
+        for name in ('a.txt', 'b.txt'):
+            filename = os.path.join(self._tmp_dir.name, name)
+            with open(filename, 'w') as source:
+                source.write(name)
+            self.filenames.append(filename)
+
+        patcher = patch('ez_gpg.gpg_utils.gnupg.GPG')
+        self.mock_gpg = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+        find_patcher = patch.object(GpgUtils, '_find_gpg_binary', return_value='/usr/bin/gpg')
+        find_patcher.start()
+        self.addCleanup(find_patcher.stop)
+
+    def tearDown(self):
+        GpgUtils.invalidate_keyring()
+        self._tmp_dir.cleanup()
+
+    def _status(self, ok, status='ok'):
+        result = MagicMock()
+        result.__bool__.return_value = ok
+        result.status = status
+        return result
+
+    def test_encrypt_pki_returns_per_file_results(self):
+        self.mock_gpg.encrypt_file.side_effect = [self._status(True, 'encryption ok'),
+                                                  self._status(False, 'invalid recipient')]
+
+        results = GpgUtils.encrypt_files_pki(self.filenames, ['KEYID'])
+
+        self.assertEqual([result.filename for result in results], self.filenames)
+        self.assertEqual([result.output for result in results],
+                         [f"{filename}.gpg" for filename in self.filenames])
+        self.assertEqual([result.success for result in results], [True, False])
+        self.assertEqual(results[1].status, 'invalid recipient')
+
+    def test_encrypt_skips_compression_for_compressed_files(self):
+        self.mock_gpg.encrypt_file.return_value = self._status(True)
+        with open(self.filenames[1], 'wb') as compressed:
+            compressed.write(b'\x28\xb5\x2f\xfd' + os.urandom(1024))
+
+        GpgUtils.encrypt_files_symmetric(self.filenames, 'pass', jobs=1,
+                                         compression=CompressionPolicy(auto=True))
+
+        extra_args = [call[1]['extra_args'] for call in self.mock_gpg.encrypt_file.call_args_list]
+        self.assertEqual(extra_args, [[], ['--compress-algo', 'none']])
+
+    def test_encrypt_symmetric_stops_when_cancelled(self):
+        self.mock_gpg.encrypt_file.return_value = self._status(True)
+        cancelled = MagicMock(side_effect=[False, True])
+
+        results = GpgUtils.encrypt_files_symmetric(self.filenames, 'pass', jobs=1,
+                                                   is_cancelled=cancelled)
+
+        self.assertEqual(len(results), 1)
+        self.mock_gpg.encrypt_file.assert_called_once()
+
+    def test_encrypt_reports_per_file_errors(self):
+        self.mock_gpg.encrypt_file.return_value = self._status(True)
+        missing = os.path.join(self._tmp_dir.name, 'missing.txt')
+
+        results = GpgUtils.encrypt_files_pki([self.filenames[0], missing], ['KEYID'], jobs=2)
+
+        self.assertTrue(results[0])
+        self.assertFalse(results[1])
+        self.assertEqual(results[1].filename, missing)
+        self.assertIn('No such file', results[1].error)
+
+    def test_encrypt_progress(self):
+        self.mock_gpg.encrypt_file.return_value = self._status(True)
+        snapshots = []
+
+        GpgUtils.encrypt_files_pki(self.filenames, ['KEYID'], jobs=2,
+                                   on_progress=snapshots.append)
+
+        total_size = sum(os.path.getsize(filename) for filename in self.filenames)
+        self.assertTrue(snapshots[-1].done)
+        self.assertEqual((snapshots[-1].bytes_in, snapshots[-1].total_size),
+                         (total_size, total_size))
+
+    @patch('ez_gpg.gpg_utils.parallel_map', return_value=[])
+    @patch('os.cpu_count', return_value=32)
+    def test_encrypt_jobs_are_bounded(self, mock_cpu_count, mock_parallel_map):
+        GpgUtils.encrypt_files_pki(self.filenames, ['KEYID'], jobs=4)
+        self.assertEqual(mock_parallel_map.call_args[0][2], 4)
+
+        GpgUtils.encrypt_files_pki(self.filenames, ['KEYID'], jobs=100)
+        self.assertEqual(mock_parallel_map.call_args[0][2], Config.MAX_IO_JOBS)
+
+        GpgUtils.encrypt_files_pki(self.filenames, ['KEYID'], jobs=100, io_limit=48)
+        self.assertEqual(mock_parallel_map.call_args[0][2], 48)
+
+    def test_sign_file_result(self):
+        self.mock_gpg.sign_file.return_value = self._status(True, 'signature created')
+
+        result = GpgUtils.sign_file(self.filenames[0], 'KEYID', 'pass')
+
+        self.assertTrue(result)
+        self.assertEqual(result.output, f"{self.filenames[0]}.sig")
+
+    def test_sign_file_armor_writes_asc(self):
+        self.mock_gpg.sign_file.return_value = self._status(True, 'signature created')
+
+        result = GpgUtils.sign_file(self.filenames[0], 'KEYID', 'pass', use_armor=True)
+
+        self.assertEqual(result.output, f"{self.filenames[0]}.asc")
+        self.assertFalse(self.mock_gpg.sign_file.call_args.kwargs['binary'])
+
+    def test_sign_files_with_manifest(self):
+        self.mock_gpg.list_keys.return_value = []
+        self.mock_gpg.sign_file.side_effect = lambda *args, **kwargs: \
+            self._status(True, 'signature created')
+        manifest_filename = os.path.join(self._tmp_dir.name, 'SHA256SUMS')
+
+        results = GpgUtils.sign_files(self.filenames, 'KEYID', 'pass',
+                                      manifest_filename=manifest_filename, jobs=2)
+
+        self.assertEqual([result.filename for result in results],
+                         self.filenames + [manifest_filename])
+        self.assertEqual(results[-1].output, f"{manifest_filename}.sig")
+        self.assertTrue(all(results))
+        with open(manifest_filename) as manifest_file:
+            self.assertEqual([line.split()[1] for line in manifest_file], ['a.txt', 'b.txt'])
+
+    def test_sign_files_leaves_failures_out_of_manifest(self):
+        self.mock_gpg.list_keys.return_value = []
+        self.mock_gpg.sign_file.side_effect = [self._status(True, 'signature created'),
+                                               self._status(False, 'bad passphrase'),
+                                               self._status(True, 'signature created')]
+        manifest_filename = os.path.join(self._tmp_dir.name, 'SHA256SUMS')
+
+        results = GpgUtils.sign_files(self.filenames, 'KEYID', 'pass',
+                                      manifest_filename=manifest_filename)
+
+        self.assertEqual([bool(result) for result in results], [True, False, True])
+        with open(manifest_filename) as manifest_file:
+            self.assertEqual([line.split()[1] for line in manifest_file], ['a.txt'])
+
+    def test_sign_manifest_signs_once(self):
+        self.mock_gpg.list_keys.return_value = []
+        self.mock_gpg.sign_file.return_value = self._status(True, 'signature created')
+        manifest_filename = os.path.join(self._tmp_dir.name, 'SHA256SUMS')
+        open(manifest_filename, 'w').close()
+
+        results = GpgUtils.sign_manifest(self.filenames + [manifest_filename], 'KEYID', 'pass')
+
+        self.assertEqual(self.mock_gpg.sign_file.call_count, 1)
+        self.assertEqual([result.output for result in results], [f"{manifest_filename}.sig"])
+        with open(manifest_filename) as manifest_file:
+            self.assertEqual([line.split()[1] for line in manifest_file], ['a.txt', 'b.txt'])
+
+    def test_verify_manifest_reports_changed_files(self):
+        self.mock_gpg.list_keys.return_value = []
+        self.mock_gpg.sign_file.return_value = self._status(True, 'signature created')
+        self.mock_gpg.verify_file.return_value = MagicMock(valid=True, status='signature valid')
+        manifest_filename = os.path.join(self._tmp_dir.name, 'SHA256SUMS')
+        GpgUtils.sign_manifest(self.filenames, 'KEYID', 'pass', manifest_filename)
+        open(f"{manifest_filename}.sig", 'w').close()
+
+        with open(self.filenames[1], 'w') as changed_file:
+            changed_file.write('changed')
+
+        result = GpgUtils.verify_manifest(manifest_filename, f"{manifest_filename}.sig")
+
+        self.assertTrue(result.valid)
+        self.assertFalse(result)
+        self.assertEqual([file_result.filename for file_result in result.get_failed_files()],
+                         [self.filenames[1]])
+        self.assertEqual(result.get_failed_files()[0].status, 'MISMATCH')
+        self.assertEqual(len(result.get_results()), 3)
+
+    def test_verify_manifest_bad_signature_skips_hashing(self):
+        self.mock_gpg.verify_file.return_value = MagicMock(valid=False, status='bad signature')
+        manifest_filename = os.path.join(self._tmp_dir.name, 'SHA256SUMS')
+        with open(manifest_filename, 'w') as manifest_file:
+            manifest_file.write('garbage')
+
+        with patch('ez_gpg.gpg_utils.check_manifest') as mock_check:
+            result = GpgUtils.verify_manifest(manifest_filename)
+
+        self.assertFalse(result)
+        self.assertEqual(result.files, [])
+        mock_check.assert_not_called()
+
+    def test_find_signature_pairs(self):
+        signed = self.filenames[0]
+        open(f"{signed}.sig", 'w').close()
+        sub_dir = os.path.join(self._tmp_dir.name, 'sub')
+        os.mkdir(sub_dir)
+        nested = os.path.join(sub_dir, 'c.txt')
+        open(nested, 'w').close()
+        open(f"{nested}.asc", 'w').close()
+        open(os.path.join(sub_dir, 'orphan.sig'), 'w').close()
+
+        self.assertEqual(GpgUtils.find_signature_pairs([self._tmp_dir.name]),
+                         [(signed, f"{signed}.sig"), (nested, f"{nested}.asc")])
+        self.assertEqual(GpgUtils.find_signature_pairs([self._tmp_dir.name], recursive=False),
+                         [(signed, f"{signed}.sig")])
+        self.assertEqual(GpgUtils.find_signature_pairs([f"{signed}.sig", signed, self.filenames[1]]),
+                         [(signed, f"{signed}.sig"), (self.filenames[1], None)])
+
+    def test_verify_files_report(self):
+        def verify(sig_file, filename=None):
+            if filename == self.filenames[1]:
+                raise RuntimeError("unreadable")
+            return MagicMock(valid=True, status='signature valid', fingerprint='FPR',
+                             key_id='KEYID', username='Signer', trust_level=4,
+                             trust_text='TRUST_FULLY', sig_timestamp='1500000000',
+                             expire_timestamp=None)
+
+        self.mock_gpg.verify_file.side_effect = verify
+        pairs = []
+        for filename in self.filenames:
+            open(f"{filename}.sig", 'w').close()
+            pairs.append((filename, f"{filename}.sig"))
+
+        report = GpgUtils.verify_files(pairs, jobs=2)
+
+        self.assertEqual([result.filename for result in report], self.filenames)
+        self.assertEqual([result.filename for result in report.valid], [self.filenames[0]])
+        self.assertEqual(report.invalid[0].error, 'unreadable')
+        self.assertEqual(report.to_dict()['results'][0]['username'], 'Signer')
+
+    def test_verify_cache(self):
+        verification = MagicMock(valid=True, status='signature valid', fingerprint='FPR',
+                                 key_id='KEYID', username='Signer', trust_level=4,
+                                 trust_text='TRUST_FULLY', sig_timestamp='1500000000',
+                                 expire_timestamp=None)
+        self.mock_gpg.verify_file.return_value = verification
+        signature = f"{self.filenames[0]}.sig"
+        with open(signature, 'w') as signature_file:
+            signature_file.write('signature')
+
+        gnupg_home = os.path.join(self._tmp_dir.name, 'gnupg')
+        os.mkdir(gnupg_home)
+        with patch.dict(os.environ, {'XDG_CACHE_HOME': self._tmp_dir.name,
+                                     'GNUPGHOME': gnupg_home}), \
+             patch('ez_gpg.gpg_utils._VERIFY_CACHE', None):
+            first = GpgUtils.verify_file(self.filenames[0], signature, use_cache=True)
+            second = GpgUtils.verify_file(self.filenames[0], signature, use_cache=True)
+            self.assertEqual(self.mock_gpg.verify_file.call_count, 1)
+            self.assertTrue(second.valid)
+            self.assertEqual(second.to_dict(), first.to_dict())
+
+            # Changed data misses the cache
+            with open(self.filenames[0], 'w') as source:
+                source.write('changed')
+            GpgUtils.verify_file(self.filenames[0], signature, use_cache=True)
+            self.assertEqual(self.mock_gpg.verify_file.call_count, 2)
+
+            # So does a keyring change
+            with open(os.path.join(gnupg_home, 'pubring.kbx'), 'w') as keyring:
+                keyring.write('new key')
+            GpgUtils.verify_file(self.filenames[0], signature, use_cache=True)
+            self.assertEqual(self.mock_gpg.verify_file.call_count, 3)
+
+            # Bad signatures are never cached
+            verification.valid = False
+            os.remove(os.path.join(gnupg_home, 'pubring.kbx'))
+            GpgUtils.verify_file(self.filenames[1], signature, use_cache=True)
+            GpgUtils.verify_file(self.filenames[1], signature, use_cache=True)
+            self.assertEqual(self.mock_gpg.verify_file.call_count, 5)
+
+            GpgUtils.get_verify_cache().close()
+
+    def test_decrypt_file_failure(self):
+        self.mock_gpg.decrypt_file.return_value = self._status(False, 'bad passphrase')
+
+        result = GpgUtils.decrypt_file(self.filenames[0], 'pass')
+
+        self.assertFalse(result)
+        self.assertEqual(result.status, 'bad passphrase')
+
+    def test_decrypt_files_unlocks_recipients_once(self):
+        encrypted = f"{self.filenames[0]}.gpg"
+        with open(encrypted, 'wb') as encrypted_file:
+            encrypted_file.write(bytes([0xc1, 12, 3]) + bytes.fromhex('0123456789ABCDEF') +
+                                 bytes([1, 0, 0]) + bytes([0xd2, 1, 1]))
+        self.mock_gpg.decrypt_file.return_value = self._status(True, 'decryption ok')
+
+        session = MagicMock(passphrase=None)
+        with patch.object(GpgUtils, 'unlock_keys') as mock_unlock:
+            mock_unlock.return_value.__enter__.return_value = session
+            results = GpgUtils.decrypt_files([encrypted, self.filenames[1]], 'pass')
+
+        mock_unlock.assert_called_once_with(['0123456789ABCDEF'], 'pass',
+                                            [encrypted, self.filenames[1]])
+        self.assertEqual(len(results), 2)
+        for call in self.mock_gpg.decrypt_file.call_args_list:
+            self.assertIsNone(call.kwargs['passphrase'])
+
+    def test_get_encryped_file_info_reads_packets(self):
+        encrypted = f"{self.filenames[0]}.gpg"
+        with open(encrypted, 'wb') as encrypted_file:
+            # v3 public-key session key packet followed by a SEIPD packet
+            encrypted_file.write(bytes([0xc1, 12, 3]) + bytes.fromhex('0123456789ABCDEF') +
+                                 bytes([1, 0, 0]) + bytes([0xd2, 1, 1]))
+
+        info = GpgUtils.get_encryped_file_info(encrypted)
+
+        self.assertEqual(info.key_ids, ['0123456789ABCDEF'])
+        self.assertFalse(info.is_symmetric)
+
+        with self.assertRaises(ValueError):
+            GpgUtils.get_encryped_file_info(self.filenames[0])
+
+    def test_check_key_password_caches_valid_passphrases(self):
+        self.mock_gpg.list_keys.return_value = []
+        self.mock_gpg.sign.side_effect = lambda data, keyid, passphrase: \
+            'signature' if passphrase == 'secret' else ''
+
+        self.assertFalse(GpgUtils.check_key_password('KEYID', 'wrong'))
+        self.assertFalse(GpgUtils.check_key_password('KEYID', 'wrong'))
+        self.assertTrue(GpgUtils.check_key_password('KEYID', 'secret'))
+        self.assertTrue(GpgUtils.is_key_password_cached('KEYID', 'secret'))
+        self.assertTrue(GpgUtils.check_key_password('KEYID', 'secret'))
+
+        self.assertEqual(self.mock_gpg.sign.call_count, 3)
+
+        GpgUtils.invalidate_keyring()
+        self.assertFalse(GpgUtils.is_key_password_cached('KEYID', 'secret'))
+
+    @patch('ez_gpg.gpg_utils.clear_passphrases', return_value=True)
+    def test_cached_passphrase_lookup_needs_no_key_listing(self, mock_clear):
+        key = Key('KEYID', 'F' * 40, keygrip='GRIP')
+        self.mock_gpg.sign.return_value = 'signature'
+
+        with patch.object(GpgUtils, 'get_key_by_id', return_value=key):
+            self.assertTrue(GpgUtils.check_key_password('KEYID', 'secret'))
+
+        with patch.object(GpgUtils, 'get_key_by_id') as mock_get_key:
+            self.assertTrue(GpgUtils.is_key_password_cached('KEYID', 'secret'))
+            self.assertTrue(GpgUtils.is_key_password_cached('F' * 40, 'secret'))
+            self.assertFalse(GpgUtils.is_key_password_cached('KEYID', 'wrong'))
+
+        mock_get_key.assert_not_called()
+
+    @patch('ez_gpg.gpg_utils.clear_passphrases', return_value=False)
+    def test_check_key_password_keeps_untrusted_results_out_of_cache(self, mock_clear):
+        key = Key('KEYID', 'F' * 40, keygrip='GRIP')
+        self.mock_gpg.sign.return_value = 'signature'
+
+        with patch.object(GpgUtils, 'get_key_by_id', return_value=key):
+            self.assertTrue(GpgUtils.check_key_password('KEYID', 'anything'))
+            self.assertFalse(GpgUtils.is_key_password_cached('KEYID', 'anything'))
+
+        self.assertEqual(mock_clear.call_args[0][0], ['GRIP'])
+
+    def test_verify_file_returns_structured_result(self):
+        verification = MagicMock(valid=True,
+                                 status='signature valid',
+                                 fingerprint='FPR',
+                                 key_id='KEYID',
+                                 username='Test User',
+                                 trust_level=4,
+                                 trust_text='TRUST_FULLY',
+                                 sig_timestamp='1500000000',
+                                 expire_timestamp=None)
+        self.mock_gpg.verify_file.return_value = verification
+        signature = f"{self.filenames[0]}.sig"
+        open(signature, 'w').close()
+
+        result = GpgUtils.verify_file(self.filenames[0], signature)
+
+        self.assertTrue(result.valid)
+        self.assertTrue(result.is_trusted())
+        self.assertEqual(result.signature_filename, signature)
+        self.assertEqual(result.to_dict()['username'], 'Test User')
+        self.assertEqual(result.timestamp, '1500000000')
+
+
+class TestStreams(unittest.TestCase):
+    def setUp(self):
+        GpgUtils.invalidate_keyring()
+
+    def tearDown(self):
+        GpgUtils.invalidate_keyring()
+
+    @patch('ez_gpg.gpg_utils.GpgStream')
+    @patch.object(GpgUtils, '_find_gpg_binary', return_value='/usr/bin/gpg')
+    def test_encrypt_stream_pki(self, mock_find, mock_stream_class):
+        src, dst = MagicMock(), MagicMock()
+
+        GpgUtils.encrypt_stream(src, dst, key_ids=['AAAA', 'BBBB'], password='ignored',
+                                use_armor=True)
+
+        args, kwargs = mock_stream_class.call_args
+        self.assertEqual(args, ('/usr/bin/gpg', ['--armor', '--always-trust', '--encrypt',
+                                                 '--recipient', 'AAAA',
+                                                 '--recipient', 'BBBB']))
+        self.assertIsNone(kwargs['passphrase'])
+        mock_stream_class.return_value.run.assert_called_once_with(src, dst)
+
+    @patch('ez_gpg.gpg_utils.GpgStream')
+    @patch.object(GpgUtils, '_find_gpg_binary', return_value='/usr/bin/gpg')
+    def test_encrypt_stream_symmetric(self, mock_find, mock_stream_class):
+        on_progress = MagicMock()
+
+        GpgUtils.encrypt_stream(MagicMock(), MagicMock(), password='pass',
+                                on_progress=on_progress, total_size=42)
+
+        args, kwargs = mock_stream_class.call_args
+        self.assertEqual(args[1], ['--symmetric'])
+        self.assertEqual(kwargs['passphrase'], 'pass')
+        self.assertIs(kwargs['on_progress'], on_progress)
+        self.assertEqual(kwargs['total_size'], 42)
+
+    @patch('ez_gpg.gpg_utils.GpgStream')
+    @patch.object(GpgUtils, '_find_gpg_binary', return_value='/usr/bin/gpg')
+    def test_decrypt_stream(self, mock_find, mock_stream_class):
+        GpgUtils.decrypt_stream(MagicMock(), MagicMock(), password='pass')
+
+        args, kwargs = mock_stream_class.call_args
+        self.assertEqual(args[1], ['--decrypt'])
+        self.assertEqual(kwargs['passphrase'], 'pass')
+
+
+
+@unittest.skipUnless(shutil.which('gpg') and shutil.which('gpgconf'), "gpg not installed")
+class TestFolderArchives(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.home = os.path.join(self._tmp_dir.name, 'home')
+        os.mkdir(self.home, 0o700)
+
+        self.folder = os.path.join(self._tmp_dir.name, 'docs')
+        os.mkdir(self.folder)
+        for index in range(50):
+            with open(os.path.join(self.folder, f"{index}.txt"), 'w') as data_file:
+                data_file.write(f"document {index}")
+
+        self.dest_dir = os.path.join(self._tmp_dir.name, 'out')
+        os.mkdir(self.dest_dir)
+
+        self._environ = patch.dict(os.environ, {'GNUPGHOME': self.home})
+        self._environ.start()
+        GpgUtils.invalidate_keyring()
+
+    def tearDown(self):
+        self._environ.stop()
+        GpgUtils.invalidate_keyring()
+        subprocess.run(['gpgconf', '--homedir', self.home, '--kill', 'gpg-agent'], check=False)
+        self._tmp_dir.cleanup()
+
+    def test_symmetric_roundtrip(self):
+        result = GpgUtils.encrypt_folder(self.folder, password='pw')
+
+        self.assertTrue(result)
+        self.assertEqual(result.output, f"{self.folder}.tar.gz.gpg")
+        info = GpgUtils.get_encryped_file_info(result.output)
+        self.assertTrue(info.is_symmetric)
+
+        result = GpgUtils.decrypt_archive(result.output, 'pw', self.dest_dir)
+
+        self.assertTrue(result)
+        with open(os.path.join(self.dest_dir, 'docs', '42.txt')) as data_file:
+            self.assertEqual(data_file.read(), 'document 42')
+
+    def test_wrong_passphrase(self):
+        output = GpgUtils.encrypt_folder(self.folder, password='pw').output
+
+        result = GpgUtils.decrypt_archive(output, 'wrong', self.dest_dir)
+
+        self.assertFalse(result)
+        self.assertIn('decryption failed', result.error)
+        self.assertEqual(os.listdir(self.dest_dir), [])
+
+    def test_tampered_archive_leaves_nothing_behind(self):
+        output = GpgUtils.encrypt_folder(self.folder, password='pw',
+                                         compression=COMPRESSION_NONE).output
+        with open(output, 'r+b') as archive_file:
+            archive_file.seek(-10, os.SEEK_END)
+            data = archive_file.read(1)
+            archive_file.seek(-10, os.SEEK_END)
+            archive_file.write(bytes([data[0] ^ 0xff]))
+
+        result = GpgUtils.decrypt_archive(output, 'pw', self.dest_dir)
+
+        self.assertFalse(result)
+        self.assertEqual(os.listdir(self.dest_dir), [])
+
+    def test_existing_files_are_not_replaced(self):
+        output = GpgUtils.encrypt_folder(self.folder, password='pw').output
+        os.mkdir(os.path.join(self.dest_dir, 'docs'))
+
+        result = GpgUtils.decrypt_archive(output, 'pw', self.dest_dir)
+
+        self.assertFalse(result)
+        self.assertIn('Already exists', result.error)
+        self.assertEqual(os.listdir(self.dest_dir), ['docs'])
+        self.assertEqual(os.listdir(os.path.join(self.dest_dir, 'docs')), [])
+
+    def test_missing_folder(self):
+        result = GpgUtils.encrypt_folder(os.path.join(self._tmp_dir.name, 'missing'),
+                                         password='pw')
+
+        self.assertFalse(result)
+        self.assertFalse(os.path.exists(result.output))
+
+
+@unittest.skipUnless(shutil.which('gpg') and shutil.which('gpgconf'), "gpg not installed")
+class TestKeyImportExport(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.source_home = os.path.join(self._tmp_dir.name, 'source')
+        self.home = os.path.join(self._tmp_dir.name, 'home')
+        os.mkdir(self.source_home, 0o700)
+        os.mkdir(self.home, 0o700)
+
+        self.fingerprints = []
+        for name in ('alice', 'bob', 'carol'):
+            self._gpg(self.source_home, '--passphrase', '', '--quick-gen-key',
+                      f"{name} <{name}@example.com>", 'ed25519', 'sign', 'never')
+            listing = self._gpg(self.source_home, '--with-colons', '--list-keys',
+                                f"{name}@example.com")
+            self.fingerprints.append([line.split(':')[9] for line in listing.splitlines()
+                                      if line.startswith('fpr:')][0])
+
+        self._environ = patch.dict(os.environ, {'GNUPGHOME': self.home,
+                                                'XDG_CACHE_HOME': self._tmp_dir.name})
+        self._environ.start()
+        self._keyserver_cache = patch('ez_gpg.gpg_utils._KEYSERVER_CACHE', None)
+        self._keyserver_cache.start()
+        GpgUtils.invalidate_keyring()
+
+    def tearDown(self):
+        GpgUtils.get_keyserver_cache().close()
+        self._keyserver_cache.stop()
+        self._environ.stop()
+        GpgUtils.invalidate_keyring()
+        for home in (self.source_home, self.home):
+            subprocess.run(['gpgconf', '--homedir', home, '--kill', 'gpg-agent'], check=False)
+        self._tmp_dir.cleanup()
+
+    def _gpg(self, home, *args):
+        return subprocess.run(['gpg', '--homedir', home, '--batch', '--pinentry-mode',
+                               'loopback'] + list(args),
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True, check=True).stdout
+
+    def _export(self, name, *args):
+        filename = os.path.join(self._tmp_dir.name, name)
+        self._gpg(self.source_home, '--output', filename, '--export', *args)
+        return filename
+
+    def test_mixed_files_and_dumps(self):
+        alice = self._export('alice.asc', '--armor', 'alice@example.com')
+        bob = self._export('bob.gpg', 'bob@example.com')
+        dump = self._export('all.asc', '--armor')
+        missing = os.path.join(self._tmp_dir.name, 'missing.asc')
+
+        report = GpgUtils.import_keys_bulk([alice, bob, dump, missing])
+
+        self.assertEqual(sorted(report.fingerprints), sorted(self.fingerprints))
+        self.assertEqual(len(report.new), 3)
+        self.assertEqual([result.filename for result in report.file_errors], [missing])
+        self.assertEqual(len(GpgUtils.get_gpg_keys()), 3)
+
+        report = GpgUtils.import_key(dump)
+
+        self.assertTrue(report)
+        self.assertEqual(len(report.unchanged), 3)
+
+    def test_updated_key(self):
+        old = self._export('old.asc', '--armor', 'alice@example.com')
+        self._gpg(self.source_home, '--passphrase', '', '--quick-add-uid', 'alice@example.com',
+                  'alice <alice@example.org>')
+        new = self._export('new.asc', '--armor', 'alice@example.com')
+
+        GpgUtils.import_keys_bulk([old])
+        report = GpgUtils.import_keys_bulk([new])
+
+        self.assertEqual([key.fingerprint for key in report.updated], [self.fingerprints[0]])
+        self.assertIn('uids', report.updated[0].changes)
+
+    def test_invalid_file(self):
+        garbage = os.path.join(self._tmp_dir.name, 'garbage.asc')
+        with open(garbage, 'w') as garbage_file:
+            garbage_file.write('not a key')
+
+        report = GpgUtils.import_keys_bulk([garbage])
+
+        self.assertFalse(report)
+        self.assertEqual(report.fingerprints, [])
+        self.assertTrue(report.errors)
+
+
+    def test_export_all_binary(self):
+        GpgUtils.import_keys_bulk([self._export('all.gpg')])
+        filename = os.path.join(self._tmp_dir.name, 'backup.gpg')
+
+        result = GpgUtils.export_keys([], filename)
+
+        self.assertTrue(result)
+        self.assertEqual(sorted(result.fingerprints), sorted(self.fingerprints))
+        with open(filename, 'rb') as key_file:
+            self.assertEqual(key_file.read(),
+                             subprocess.run(['gpg', '--homedir', self.home, '--export'],
+                                            stdout=subprocess.PIPE, check=True).stdout)
+
+    def test_export_to_dir(self):
+        GpgUtils.import_keys_bulk([self._export('all.gpg')])
+        directory = os.path.join(self._tmp_dir.name, 'keys')
+
+        results = GpgUtils.export_keys_to_dir([], directory, armor=True, jobs=3)
+
+        self.assertTrue(all(results))
+        self.assertEqual(sorted(os.listdir(directory)),
+                         sorted(f"{fingerprint}.asc" for fingerprint in self.fingerprints))
+        with open(results[0].output, 'rb') as key_file:
+            self.assertTrue(key_file.read().startswith(b'-----BEGIN PGP PUBLIC KEY BLOCK'))
+
+        result, = GpgUtils.export_keys_to_dir(['nobody@example.com'], directory)
+        self.assertFalse(result)
+        self.assertEqual(result.error, "Unknown key")
+
+    def test_export_nothing(self):
+        filename = os.path.join(self._tmp_dir.name, 'empty.asc')
+
+        result = GpgUtils.export_keys(['nobody@example.com'], filename, armor=True)
+
+        self.assertFalse(result)
+        self.assertFalse(os.path.exists(filename))
+
+
+    def test_fetch_key(self):
+        with open(self._export('alice.asc', '--armor', 'alice@example.com'), 'rb') as key_file:
+            server = FakeKeyserver([(200, key_file.read())])
+        self.addCleanup(server.close)
+
+        fingerprint = GpgUtils.fetch_key(server.url, self.fingerprints[0][-16:], timeout=5)
+
+        self.assertEqual(fingerprint, self.fingerprints[0])
+        self.assertEqual([key.fingerprint for key in GpgUtils.get_gpg_keys()],
+                         [self.fingerprints[0]])
+
+        # Keys that don't match the request are never imported
+        self.assertIsNone(GpgUtils.fetch_key(server.url, self.fingerprints[1], timeout=5))
+
+    def test_fetch_key_removes_rogue_certs(self):
+        with open(self._export('all.asc', '--armor'), 'rb') as key_file:
+            server = FakeKeyserver([(200, key_file.read())])
+        self.addCleanup(server.close)
+
+        with self.assertRaises(RuntimeError):
+            GpgUtils.fetch_key(server.url, self.fingerprints[0], timeout=5)
+
+        self.assertEqual(GpgUtils.get_gpg_keys(), [])
+
+
+    def test_fetch_key_searches_first(self):
+        fingerprint = self.fingerprints[0]
+        with open(self._export('all.asc', '--armor'), 'rb') as key_file:
+            all_keys = key_file.read()
+        index = (f"info:1:2\npub:{fingerprint}:22:256:1700000000::\n"
+                 f"pub:{self.fingerprints[1]}:22:256:1700000000::\n").encode()
+        server = FakeKeyserver([(200, all_keys)], index=(200, index))
+        self.addCleanup(server.close)
+
+        # Two keys claim the ID: nothing gets fetched, let alone imported
+        with self.assertRaises(RuntimeError):
+            GpgUtils.fetch_key(server.url, fingerprint[-16:], timeout=5)
+
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(GpgUtils.get_gpg_keys(), [])
+
+        with open(self._export('alice.asc', '--armor', 'alice@example.com'), 'rb') as key_file:
+            server = FakeKeyserver([(200, key_file.read())],
+                                   index=(200, index.splitlines(True)[1]))
+        self.addCleanup(server.close)
+
+        self.assertEqual(GpgUtils.fetch_key(server.url, fingerprint[-16:], timeout=5), fingerprint)
+        self.assertEqual(server.requests[-1],
+                         f"/pks/lookup?op=get&options=mr&search=0x{fingerprint}")
+
+
+    def test_refresh_keys(self):
+        alice, bob, carol = self.fingerprints
+        self._gpg(self.source_home, '--passphrase', '', '--quick-set-expire', bob, '1y')
+        GpgUtils.import_keys_bulk([self._export('old.gpg')])
+
+        self._gpg(self.source_home, '--passphrase', '', '--quick-add-key', alice, 'cv25519',
+                  'encr', '1y')
+        self._gpg(self.source_home, '--passphrase', '', '--quick-set-expire', bob, '2y')
+        with open(os.path.join(self.source_home, 'openpgp-revocs.d', f"{carol}.rev")) as rev_file:
+            # The certificate is defused with a leading ':'
+            revocation = rev_file.read().replace(':-----BEGIN', '-----BEGIN')
+        subprocess.run(['gpg', '--homedir', self.source_home, '--batch', '--import'],
+                       input=revocation, universal_newlines=True, check=True,
+                       stderr=subprocess.DEVNULL)
+        self._gpg(self.source_home, '--passphrase', '', '--quick-gen-key',
+                  'dave <dave@example.com>', 'ed25519', 'sign', 'never')
+
+        # Every answer has all the keys, including one that isn't in the keyring
+        with open(self._export('new.asc', '--armor'), 'rb') as key_file:
+            server = FakeKeyserver([(200, key_file.read())])
+        self.addCleanup(server.close)
+
+        report = GpgUtils.refresh_keys(None, server.url, jobs=2, timeout=5)
+
+        self.assertTrue(report)
+        results = {result.fingerprint: result for result in report}
+        self.assertEqual(sorted(results), sorted(self.fingerprints))
+        self.assertEqual(list(results[alice].changes), ['new_subkeys'])
+        self.assertTrue(results[bob].is_expiry_extended)
+        self.assertTrue(results[carol].is_revoked)
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(len(GpgUtils.get_gpg_keys()), 3)
+
+        report = GpgUtils.refresh_keys([alice, 'nobody@example.com'], server.url, timeout=5)
+
+        self.assertFalse(report)
+        self.assertEqual([result.status for result in report], ['failed', 'unchanged'])
+
+        missing = FakeKeyserver([(404, b'No results found')])
+        self.addCleanup(missing.close)
+        report = GpgUtils.refresh_keys(None, missing.url, timeout=5)
+
+        self.assertTrue(report)
+        self.assertEqual(len(report.not_found), 3)
+
+
 if __name__ == '__main__':
     unittest.main()
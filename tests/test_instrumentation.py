@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+import gnupg
+
+from ez_gpg.instrumentation import GpgCall, Histogram, Instrumentation, JsonLinesTrace, \
+    MetricsRegistry, get_operation, parse_status
+
+
+class TestHelpers(unittest.TestCase):
+    def test_get_operation(self):
+        self.assertEqual(get_operation(['--symmetric', '--output', 'x']), 'encrypt')
+        self.assertEqual(get_operation(['--encrypt', '--sign', '-r', 'KEY']), 'encrypt')
+        self.assertEqual(get_operation(['--list-secret-keys', '--fingerprint']), 'list_keys')
+        self.assertEqual(get_operation(['-s', '-b']), 'sign')
+        self.assertEqual(get_operation(['--frobnicate']), 'other')
+
+    def test_parse_status(self):
+        stderr = "[GNUPG:] NEWSIG\ngpg: Good signature\n[GNUPG:] GOODSIG ABCD User\n"
+
+        self.assertEqual(parse_status(stderr), [('NEWSIG', ''), ('GOODSIG', 'ABCD User')])
+        self.assertEqual(parse_status(None), [])
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram(self):
+        histogram = Histogram(buckets=(1, 2, 4))
+        for value in (0.5, 1.5, 1.5, 3, 10):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.sum, 16.5)
+        self.assertEqual((histogram.min, histogram.max), (0.5, 10))
+        self.assertEqual(histogram.get_percentile(0.5), 2)
+        self.assertEqual(histogram.get_percentile(1.0), 10)
+        self.assertEqual(histogram.to_dict()['buckets'], {'1': 1, '2': 2, '4': 1, 'inf': 1})
+        self.assertIsNone(Histogram().get_percentile(0.5))
+
+    def test_registry(self):
+        registry = MetricsRegistry()
+        registry.counter('calls').inc()
+        registry.counter('calls').inc(2)
+        registry.histogram('time').observe(0.01)
+
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['counters'], {'calls': 3})
+        self.assertEqual(snapshot['histograms']['time']['count'], 1)
+
+        registry.reset()
+        self.assertEqual(registry.snapshot(), {'counters': {}, 'histograms': {}})
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.instrumentation = Instrumentation(logger=logging.getLogger('test.instrumentation'))
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _call(self, operation='encrypt', returncode=0):
+        call = GpgCall(operation, ['--' + operation])
+        call.spawned(1234)
+        call.finish(returncode, bytes_in=10, bytes_out=20, status=[('END_ENCRYPTION', '')])
+        return call
+
+    def test_record_updates_metrics(self):
+        self.instrumentation.record(self._call())
+        self.instrumentation.record(self._call(returncode=2))
+
+        counters = self.instrumentation.metrics.snapshot()['counters']
+        self.assertEqual(counters['gpg.calls.encrypt'], 2)
+        self.assertEqual(counters['gpg.failures.encrypt'], 1)
+        self.assertEqual(counters['gpg.bytes_out'], 40)
+
+    def test_failing_sink_does_not_break_others(self):
+        broken_sink = MagicMock(side_effect=RuntimeError('disk full'))
+        sink = MagicMock()
+        self.instrumentation.add_sink(broken_sink)
+        self.instrumentation.add_sink(sink)
+
+        with self.assertLogs('test.instrumentation', logging.WARNING):
+            self.instrumentation.record(self._call())
+
+        sink.assert_called_once()
+
+    def test_json_lines_trace(self):
+        filename = os.path.join(self._tmp_dir.name, 'trace.jsonl')
+        trace = self.instrumentation.enable_trace(filename)
+
+        self.instrumentation.record(self._call('sign'))
+        self.instrumentation.record(self._call('verify'))
+        self.instrumentation.remove_sink(trace)
+        self.instrumentation.record(self._call('decrypt'))
+
+        with open(filename) as trace_file:
+            records = [json.loads(line) for line in trace_file]
+
+        self.assertEqual([record['operation'] for record in records], ['sign', 'verify'])
+        self.assertEqual(records[0]['status'], ['END_ENCRYPTION'])
+        self.assertEqual(records[0]['pid'], 1234)
+
+    def test_attach_skips_unknown_python_gnupg(self):
+        class OldGPG:
+            def _open_subprocess(self, args):
+                return 'process'
+
+        gpg = OldGPG()
+        with self.assertLogs('test.instrumentation', logging.WARNING) as logs:
+            self.assertIs(self.instrumentation.attach(gpg), gpg)
+
+        self.assertIn('_handle_io', logs.output[0])
+        self.assertEqual(gpg._open_subprocess(['--list-keys']), 'process')
+        self.assertNotIn('_open_subprocess', vars(gpg))
+
+
+@unittest.skipUnless(shutil.which('gpg'), "gpg not installed")
+class TestAttach(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        os.chmod(self._tmp_dir.name, stat.S_IRWXU)
+
+        self.instrumentation = Instrumentation()
+        self.calls = []
+        self.instrumentation.add_sink(self.calls.append)
+
+        self.gpg = self.instrumentation.attach(gnupg.GPG(gnupghome=self._tmp_dir.name))
+
+    def tearDown(self):
+        subprocess.run(['gpgconf', '--homedir', self._tmp_dir.name, '--kill', 'gpg-agent'],
+                       check=False)
+        self._tmp_dir.cleanup()
+
+    def test_records_python_gnupg_runs(self):
+        self.gpg.list_keys()
+        output = os.path.join(self._tmp_dir.name, 'data.gpg')
+        result = self.gpg.encrypt(b'x' * 5000, [], symmetric=True, passphrase='pw',
+                                  armor=False, output=output,
+                                  extra_args=['--pinentry-mode', 'loopback'])
+
+        self.assertTrue(result)
+        self.assertEqual([call.operation for call in self.calls], ['list_keys', 'encrypt'])
+
+        encrypt_call = self.calls[1]
+        self.assertEqual(encrypt_call.returncode, 0)
+        self.assertEqual(encrypt_call.bytes_in, 5000)
+        self.assertEqual(encrypt_call.bytes_out, os.path.getsize(output))
+        self.assertIn('END_ENCRYPTION', [keyword for keyword, _ in encrypt_call.status])
+        self.assertGreater(encrypt_call.wall_time, encrypt_call.spawn_time)
+
+
+if __name__ == '__main__':
+    unittest.main()
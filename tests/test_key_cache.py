@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from ez_gpg.key_cache import KeyListCache
+from ez_gpg.keys import Key
+
+
+def _make_key(key_id):
+    return Key(key_id, f'FFFFFFFFFFFFFFFFFFFFFFFF{key_id}', uids=['User'])
+
+OLD_KEY = _make_key('0000000000000001')
+NEW_KEY = _make_key('0000000000000002')
+
+
+class TestKeyListCache(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.homedir = self._tmp_dir.name
+        self.pubring = os.path.join(self.homedir, 'pubring.kbx')
+        self._write_pubring(b'one')
+
+        self.cache = KeyListCache(lambda: self.homedir)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _write_pubring(self, data, mtime_ns=1_000_000_000):
+        with open(self.pubring, 'wb') as pubring:
+            pubring.write(data)
+        os.utime(self.pubring, ns=(mtime_ns, mtime_ns))
+
+    def test_listing_is_cached(self):
+        loader = MagicMock(return_value=[OLD_KEY])
+
+        self.assertEqual(self.cache.get(False, loader), [OLD_KEY])
+        self.assertEqual(self.cache.get(False, loader), [OLD_KEY])
+        loader.assert_called_once_with()
+
+    def test_public_and_secret_listings_are_separate(self):
+        public_loader = MagicMock(return_value=[OLD_KEY])
+        secret_loader = MagicMock(return_value=[NEW_KEY])
+
+        self.assertEqual(self.cache.get(False, public_loader), [OLD_KEY])
+        self.assertEqual(self.cache.get(True, secret_loader), [NEW_KEY])
+
+    def test_keyring_modification_reloads(self):
+        loader = MagicMock(side_effect=[[OLD_KEY], [NEW_KEY]])
+
+        self.assertEqual(self.cache.get(False, loader), [OLD_KEY])
+        self._write_pubring(b'two', mtime_ns=2_000_000_000)
+        self.assertEqual(self.cache.get(False, loader), [NEW_KEY])
+
+    def test_new_keyring_file_reloads(self):
+        loader = MagicMock(side_effect=[[OLD_KEY], [NEW_KEY]])
+
+        self.cache.get(False, loader)
+        open(os.path.join(self.homedir, 'trustdb.gpg'), 'wb').close()
+        self.assertEqual(self.cache.get(False, loader), [NEW_KEY])
+
+    def test_index_is_built_once_per_listing(self):
+        loader = MagicMock(return_value=[OLD_KEY])
+
+        key_index = self.cache.get_index(False, loader)
+        self.assertIs(self.cache.get_index(False, loader), key_index)
+        self.assertIs(key_index.get('0000000000000001'), OLD_KEY)
+
+    def test_invalidate_reloads(self):
+        loader = MagicMock(side_effect=[[OLD_KEY], [NEW_KEY]])
+
+        self.cache.get(False, loader)
+        self.cache.invalidate()
+        self.assertEqual(self.cache.get(False, loader), [NEW_KEY])
+
+    def test_returned_list_is_a_copy(self):
+        self.cache.get(False, lambda: [OLD_KEY]).append(NEW_KEY)
+        self.assertEqual(self.cache.get(False, lambda: [NEW_KEY]), [OLD_KEY])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+from ez_gpg.keyring import KeyringPool
+
+
+class TestKeyringPool(unittest.TestCase):
+    def setUp(self):
+        self.resolver = MagicMock(return_value='/usr/bin/gpg')
+        self.pool = KeyringPool(self.resolver)
+
+    def test_binary_is_resolved_once(self):
+        self.assertEqual(self.pool.get_binary(), '/usr/bin/gpg')
+        self.assertEqual(self.pool.get_binary(), '/usr/bin/gpg')
+        self.resolver.assert_called_once_with()
+
+    @patch('ez_gpg.keyring.gnupg.GPG')
+    def test_instances_keyed_by_homedir_and_options(self, mock_gpg_class):
+        mock_gpg_class.side_effect = lambda **kwargs: MagicMock()
+
+        default = self.pool.get()
+        self.assertIs(self.pool.get(), default)
+        self.assertIsNot(self.pool.get(options=()), default)
+
+        other_home = self.pool.get('/tmp/other')
+
+        self.assertIsNot(other_home, default)
+        self.assertEqual(len(self.pool), 3)
+        mock_gpg_class.assert_any_call(gpgbinary='/usr/bin/gpg',
+                                       options=['--pinentry-mode', 'loopback'],
+                                       gnupghome='/tmp/other')
+
+    @patch('ez_gpg.keyring.gnupg.GPG')
+    def test_on_create_sees_new_instances_once(self, mock_gpg_class):
+        on_create = MagicMock()
+        pool = KeyringPool(self.resolver, on_create=on_create)
+
+        keyring = pool.get()
+        pool.get()
+
+        on_create.assert_called_once_with(keyring)
+
+    @patch('ez_gpg.keyring.gnupg.GPG')
+    def test_invalidate_single_homedir(self, mock_gpg_class):
+        mock_gpg_class.side_effect = lambda **kwargs: MagicMock()
+
+        default = self.pool.get()
+        self.pool.get('/tmp/other')
+
+        self.pool.invalidate('/tmp/other')
+
+        self.assertEqual(len(self.pool), 1)
+        self.assertIs(self.pool.get(), default)
+        self.resolver.assert_called_once_with()
+
+    @patch('ez_gpg.keyring.gnupg.GPG')
+    def test_invalidate_all_re_resolves_binary(self, mock_gpg_class):
+        self.pool.get()
+        self.pool.invalidate()
+
+        self.assertEqual(len(self.pool), 0)
+        self.pool.get()
+        self.assertEqual(self.resolver.call_count, 2)
+
+    @patch('ez_gpg.keyring.gnupg.GPG')
+    def test_concurrent_get_builds_one_instance(self, mock_gpg_class):
+        results = []
+
+        def worker():
+            results.append(self.pool.get())
+
+        threads = [threading.Thread(target=worker) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        mock_gpg_class.assert_called_once()
+        self.assertTrue(all(result is results[0] for result in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+import threading
+import unittest
+
+from ez_gpg.keys import Key, KeyIndex, Subkey
+
+ALICE = Key.from_listing({
+    'keyid': '1111222233334444',
+    'fingerprint': '0' * 24 + '1111222233334444',
+    'uids': ['Alice <alice@example.com>'],
+    'subkeys': [['AAAABBBBCCCCDDDD', 'e', '1' * 24 + 'AAAABBBBCCCCDDDD', None]],
+})
+BOB = Key.from_listing({
+    'keyid': '5555666677778888',
+    'fingerprint': '9' * 24 + '5555666677778888',
+    'uids': ['Bob <bob@example.com>'],
+    'subkeys': [['EEEEFFFF00001111', 'e', None, None],
+                ['2222333344445555', 's', None, None]],
+})
+
+LISTING = {
+    'keyid': '0123456789ABCDEF',
+    'fingerprint': 'F' * 24 + '0123456789ABCDEF',
+    'uids': ['A very long user name that goes well past the sixty character limit <long@example.com>',
+             'Second UID'],
+    'cap': 'scESC',
+    'algo': '1',
+    'length': '4096',
+    'date': '1500000000',
+    'expires': '',
+    'trust': 'u',
+    'keygrip': 'GRIP',
+    'subkeys': [['FEDCBA9876543210', 'e', 'E' * 24 + 'FEDCBA9876543210', 'SUBGRIP']],
+    'subkey_info': {
+        'FEDCBA9876543210': {
+            'cap': 'e',
+            'algo': '18',
+            'length': '256',
+            'date': '1500000001',
+            'expires': '1',
+            'trust': 'e',
+        },
+    },
+}
+
+
+class TestKey(unittest.TestCase):
+    def setUp(self):
+        self.key = Key.from_listing(LISTING)
+
+    def test_primary_key_fields(self):
+        self.assertEqual(self.key.key_id, '0123456789ABCDEF')
+        self.assertEqual(self.key.algorithm, 1)
+        self.assertEqual(self.key.length, 4096)
+        self.assertEqual(self.key.created, 1500000000)
+        self.assertIsNone(self.key.expires)
+        self.assertEqual(self.key.validity, 'u')
+        self.assertEqual(self.key.keygrip, 'GRIP')
+        self.assertTrue(self.key.can_encrypt)
+        self.assertTrue(self.key.can_sign)
+        self.assertFalse(self.key.is_expired)
+        self.assertFalse(self.key.is_revoked)
+
+    def test_names_are_computed_on_demand(self):
+        self.assertEqual(self.key.name, LISTING['uids'][0])
+        self.assertEqual(self.key.key_name, LISTING['uids'][0][:60] + '...')
+        self.assertEqual(self.key.friendly_name,
+                         LISTING['uids'][0][:60] + '... |0123456789ABCDEF|')
+
+    def test_subkeys_are_built_lazily(self):
+        self.assertEqual(self.key.subkey_ids, ['FEDCBA9876543210'])
+        self.assertEqual(self.key.subkey_fingerprints, ['E' * 24 + 'FEDCBA9876543210'])
+
+        subkey = self.key.subkeys[0]
+        self.assertIsInstance(subkey, Subkey)
+        self.assertIs(self.key.subkeys[0], subkey)
+        self.assertEqual(subkey.algorithm, 18)
+        self.assertEqual(subkey.length, 256)
+        self.assertTrue(subkey.can_encrypt)
+        self.assertFalse(subkey.can_sign)
+        self.assertTrue(subkey.is_expired)
+        self.assertEqual(self.key.subkey_ids, ['FEDCBA9876543210'])
+
+    def test_subkeys_are_built_once_across_threads(self):
+        barrier = threading.Barrier(8)
+        seen = []
+
+        def read():
+            barrier.wait()
+            seen.append((self.key.subkey_ids, self.key.subkeys))
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(seen), 8)
+        for subkey_ids, subkeys in seen:
+            self.assertEqual(subkey_ids, ['FEDCBA9876543210'])
+            self.assertIs(subkeys, self.key.subkeys)
+
+    def test_keygrips(self):
+        self.assertEqual(self.key.keygrips, ['GRIP', 'SUBGRIP'])
+        self.assertEqual(ALICE.keygrips, [])
+
+    def test_records_are_read_only(self):
+        with self.assertRaises(AttributeError):
+            self.key.key_id = 'DEADBEEF'
+
+        with self.assertRaises(AttributeError):
+            self.key.subkeys[0].capabilities = 's'
+
+        with self.assertRaises(AttributeError):
+            self.key.extra = True
+
+    def test_tuple_compatibility(self):
+        key_id, key_name, friendly_name, subkeys, fingerprint = self.key
+
+        self.assertEqual(key_id, self.key[0])
+        self.assertEqual(key_name, self.key[1])
+        self.assertEqual(friendly_name, self.key[2])
+        self.assertEqual(subkeys, ['FEDCBA9876543210'])
+        self.assertEqual(fingerprint, self.key[4])
+        self.assertEqual(len(self.key), 5)
+        self.assertEqual(self.key, tuple(self.key))
+
+    def test_equality_and_hashing(self):
+        self.assertEqual(Key.from_listing(LISTING), self.key)
+        self.assertEqual(len({self.key, Key.from_listing(LISTING)}), 1)
+        self.assertNotEqual(self.key, ALICE)
+
+
+    def test_changes(self):
+        self.assertEqual(self.key.get_changes(Key.from_listing(LISTING)), {})
+
+        newer = dict(LISTING, uids=LISTING['uids'] + ['Third UID'], trust='r',
+                     expires='2000000000')
+        newer['subkeys'] = LISTING['subkeys'] + [['1234123412341234', 's', None, None]]
+        newer['subkey_info'] = {'FEDCBA9876543210': dict(LISTING['subkey_info']['FEDCBA9876543210'],
+                                                         trust='r')}
+
+        self.assertEqual(self.key.get_changes(Key.from_listing(newer)), {
+            'revoked': True,
+            'expires': [None, 2000000000],
+            'new_subkeys': ['1234123412341234'],
+            'revoked_subkeys': ['FEDCBA9876543210'],
+            'new_uids': ['Third UID'],
+        })
+
+
+class TestKeyIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = KeyIndex([ALICE, BOB])
+
+    def test_lookup_by_long_id(self):
+        self.assertIs(self.index.get('1111222233334444'), ALICE)
+
+    def test_lookup_by_short_id(self):
+        self.assertIs(self.index.get('77778888'), BOB)
+
+    def test_lookup_by_fingerprint(self):
+        self.assertIs(self.index.get(ALICE[4]), ALICE)
+
+    def test_lookup_by_subkey_id(self):
+        self.assertIs(self.index.get('2222333344445555'), BOB)
+        self.assertIs(self.index.get('CCCCDDDD'), ALICE)
+
+    def test_lookup_is_case_and_prefix_insensitive(self):
+        self.assertIs(self.index.get('0xaaaabbbbccccdddd'), ALICE)
+
+    def test_lookup_by_subkey_fingerprint(self):
+        self.assertIs(self.index.get('1' * 24 + 'AAAABBBBCCCCDDDD'), ALICE)
+
+    def test_lookup_of_unknown_subkey_fingerprint_uses_long_id(self):
+        self.assertIs(self.index.get('ABCDABCDABCDABCDABCDABCDEEEEFFFF00001111'), BOB)
+
+    def test_missing_key(self):
+        self.assertIsNone(self.index.get('DEADBEEF'))
+        self.assertNotIn('DEADBEEF', self.index)
+        self.assertEqual(self.index.get_all(''), [])
+
+    def test_short_id_collisions_return_all_keys(self):
+        colliding = Key('9999999933334444', 'F' * 24 + '9999999933334444', uids=['Mallory'])
+        index = KeyIndex([ALICE, colliding])
+
+        self.assertEqual(index.get_all('33334444'), [ALICE, colliding])
+
+    def test_find_recipients(self):
+        recipients = self.index.find_recipients(['EEEEFFFF00001111',
+                                                 'DEADBEEFDEADBEEF',
+                                                 '2222333344445555',
+                                                 'AAAABBBBCCCCDDDD'])
+
+        self.assertEqual(recipients, [BOB, ALICE])
+
+    def test_iteration_preserves_listing_order(self):
+        self.assertEqual(list(self.index), [ALICE, BOB])
+        self.assertEqual(len(self.index), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
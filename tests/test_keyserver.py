@@ -0,0 +1,380 @@
+import asyncio
+import http.server
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from ez_gpg.disk_cache import DiskCache
+from ez_gpg.keyserver import HostRateLimiter, KeyFetcher, KeyNotFoundError, KeyserverError, \
+    SearchResult, get_lookup_url, get_wkd_urls, http_get, is_fingerprint, looks_like_key, \
+    merge_search_results, normalize_query, parse_index
+
+KEY_DATA = b'-----BEGIN PGP PUBLIC KEY BLOCK-----\n\nmDMEZ...\n-----END PGP PUBLIC KEY BLOCK-----\n'
+
+INDEX = (b'info:1:2\n'
+         b'pub:F41E87A974DCCE065FF8D12FE5CCDE2C950E9D5A:22:256:1700000000::\n'
+         b'uid:Alice %3Calice@example.org%3E:1700000000::\n'
+         b'pub:0123456789ABCDEF:1:2048:1100000000:1200000000:er\n'
+         b'uid:Mallory:::\n'
+         b'uid:Mallory %3Calice@example.org%3E:::\n')
+
+
+class FakeKeyserver:
+    """Local stand-in for an HKP keyserver.
+
+    `responses` are (status, body) pairs served in order, the last one
+    repeating, and `index` is what searches get; every request path ends
+    up in `requests`.
+    """
+
+    def __init__(self, responses=((200, KEY_DATA),), delay=0, chunked=False, index=None):
+        self.responses = list(responses)
+        self.requests = []
+        fake = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                fake.requests.append(self.path)
+                time.sleep(delay)
+                if index is not None and 'op=index' in self.path:
+                    status, body = index
+                else:
+                    status, body = fake.responses.pop(0) if len(fake.responses) > 1 \
+                        else fake.responses[0]
+
+                try:
+                    self.send_response(status)
+                    if chunked:
+                        self.send_header('Transfer-Encoding', 'chunked')
+                        self.end_headers()
+                        for offset in range(0, len(body), 10):
+                            chunk = body[offset:offset + 10]
+                            self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                        self.wfile.write(b'0\r\n\r\n')
+                    else:
+                        self.send_header('Content-Length', str(len(body)))
+                        self.end_headers()
+                        self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        return f"hkp://127.0.0.1:{self.server.server_address[1]}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def get_dead_keyserver():
+    with socket.socket() as unused:
+        unused.bind(('127.0.0.1', 0))
+        port = unused.getsockname()[1]
+
+    return f"hkp://127.0.0.1:{port}"
+
+
+class TestUrls(unittest.TestCase):
+    def test_lookup_urls(self):
+        self.assertEqual(get_lookup_url('keyserver.ubuntu.com', '0xdeadbeefdeadbeef'),
+                         'http://keyserver.ubuntu.com:11371/pks/lookup?op=get&options=mr'
+                         '&search=0xDEADBEEFDEADBEEF')
+        self.assertEqual(get_lookup_url('hkps://keys.openpgp.org', 'a@b.org', 'index'),
+                         'https://keys.openpgp.org:443/pks/lookup?op=index&options=mr'
+                         '&search=a%40b.org')
+
+        with self.assertRaises(KeyserverError):
+            get_lookup_url('ldap://example.com', 'ABCD')
+
+    def test_wkd_urls(self):
+        # Example from the Web Key Directory draft
+        self.assertEqual(get_wkd_urls('Joe.Doe@Example.ORG'),
+                         ['https://openpgpkey.example.org/.well-known/openpgpkey/example.org/hu/'
+                          'iy9q119eutrkn8s1mk4r39qejnbu3n5q?l=Joe.Doe',
+                          'https://example.org/.well-known/openpgpkey/hu/'
+                          'iy9q119eutrkn8s1mk4r39qejnbu3n5q?l=Joe.Doe'])
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query(' 0xdead beef '), 'DEADBEEF')
+        self.assertEqual(normalize_query('Joe@Example.org'), 'Joe@Example.org')
+        self.assertTrue(is_fingerprint('0x' + 'ab' * 20))
+        self.assertFalse(is_fingerprint('ABCD1234ABCD1234'))
+        self.assertFalse(is_fingerprint('x' * 40))
+
+    def test_looks_like_key(self):
+        self.assertTrue(looks_like_key(KEY_DATA))
+        self.assertTrue(looks_like_key(b'\x99\x01\x0d\x04'))
+        self.assertTrue(looks_like_key(b'\xc6\x33\x04'))
+        self.assertFalse(looks_like_key(b'<html>Not found</html>'))
+        self.assertFalse(looks_like_key(b'\x85\x01\x0c'))
+        self.assertFalse(looks_like_key(b''))
+
+
+class TestKeyFetcher(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.close()
+
+    def _server(self, *args, **kwargs):
+        server = FakeKeyserver(*args, **kwargs)
+        self.servers.append(server)
+        return server
+
+    def test_http_get_chunked(self):
+        server = self._server(chunked=True)
+        url = get_lookup_url(server.url, 'ABCD')
+
+        self.assertEqual(asyncio.run(http_get(url, timeout=5)), (200, KEY_DATA))
+
+    def test_fastest_live_server_wins(self):
+        slow = self._server(delay=2)
+        fast = self._server()
+        fetcher = KeyFetcher([get_dead_keyserver(), slow.url, fast.url], timeout=5,
+                             retry_delay=0)
+
+        start = time.monotonic()
+        fetched = fetcher.fetch('0xabcd1234')
+
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(fetched.data, KEY_DATA)
+        self.assertEqual(fetched.source, get_lookup_url(fast.url, 'abcd1234'))
+        self.assertEqual(fast.requests, ['/pks/lookup?op=get&options=mr&search=0xABCD1234'])
+
+    def test_timeouts_are_retried(self):
+        slow = self._server(delay=1)
+        fetcher = KeyFetcher([slow.url], timeout=0.2, retries=1, retry_delay=0)
+
+        with self.assertRaises(KeyserverError) as raised:
+            fetcher.fetch('ABCD1234')
+
+        self.assertEqual(len(slow.requests), 2)
+        self.assertTrue(str(raised.exception).endswith(': timed out'), str(raised.exception))
+
+    def test_server_errors_are_retried(self):
+        flaky = self._server([(503, b'busy'), (200, KEY_DATA)])
+        fetcher = KeyFetcher([flaky.url], timeout=5, retry_delay=0)
+
+        self.assertEqual(fetcher.fetch('ABCD1234').data, KEY_DATA)
+        self.assertEqual(len(flaky.requests), 2)
+
+    def test_not_found(self):
+        missing = self._server([(404, b'No results found')])
+        fetcher = KeyFetcher([missing.url, missing.url], timeout=5, retry_delay=0)
+
+        with self.assertRaises(KeyNotFoundError):
+            fetcher.fetch('ABCD1234')
+
+        # Not found is an answer, not something to retry
+        self.assertEqual(len(missing.requests), 2)
+
+    def test_invalid_responses_lose(self):
+        html = self._server([(200, b'<html>Oops</html>')])
+        good = self._server(delay=0.3)
+        fetcher = KeyFetcher([html.url, good.url], timeout=5, retry_delay=0)
+
+        self.assertEqual(fetcher.fetch('ABCD1234').data, KEY_DATA)
+
+        fetcher = KeyFetcher([html.url], timeout=5,
+                             validate=lambda data, query: False)
+        with self.assertRaises(KeyserverError):
+            fetcher.fetch('ABCD1234')
+
+    def test_wkd_only_for_email(self):
+        fetcher = KeyFetcher(['keyserver.ubuntu.com'])
+
+        self.assertEqual(len(fetcher.get_sources('ABCD1234')), 1)
+        self.assertEqual(len(fetcher.get_sources('joe@example.org')), 3)
+        self.assertEqual(len(KeyFetcher([], use_wkd=False).get_sources('joe@example.org')), 0)
+
+
+class TestFetchAll(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+        self.fetched = {}
+
+    def tearDown(self):
+        for server in self.servers:
+            server.close()
+
+    def _server(self, *args, **kwargs):
+        server = FakeKeyserver(*args, **kwargs)
+        self.servers.append(server)
+        return server
+
+    def _on_fetched(self, query, fetched, error):
+        self.fetched[query] = fetched or error
+
+    def test_rate_limiter_spaces_requests_per_host(self):
+        async def run():
+            limiter = HostRateLimiter(20)
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            await asyncio.gather(*[limiter.wait('http://one:11371/pks') for _ in range(5)],
+                                 limiter.wait('http://two:11371/pks'))
+            return loop.time() - start
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.19)
+        self.assertEqual(HostRateLimiter(None).interval, 0)
+
+    def test_keys_are_spread_over_servers(self):
+        first = self._server()
+        second = self._server()
+        fetcher = KeyFetcher([first.url, second.url], timeout=5, retry_delay=0)
+        queries = [f"{index:016X}" for index in range(6)]
+
+        fetcher.fetch_all(queries, self._on_fetched, jobs=2, rate=None)
+
+        self.assertEqual(sorted(self.fetched), queries)
+        self.assertTrue(all(fetched.data == KEY_DATA for fetched in self.fetched.values()))
+        self.assertEqual((len(first.requests), len(second.requests)), (3, 3))
+
+    def test_jobs_bound_concurrency(self):
+        slow = self._server(delay=0.2)
+        fetcher = KeyFetcher([slow.url], timeout=5, retry_delay=0)
+
+        start = time.monotonic()
+        fetcher.fetch_all(['AAAA', 'BBBB', 'CCCC', 'DDDD'], self._on_fetched, jobs=2, rate=None)
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.4)
+        self.assertEqual(len(self.fetched), 4)
+
+    def test_failover_and_not_found(self):
+        missing = self._server([(404, b'No results found')])
+        fetcher = KeyFetcher([get_dead_keyserver(), missing.url], timeout=5, retries=0)
+
+        fetcher.fetch_all(['AAAA', 'BBBB'], self._on_fetched)
+
+        # A dead server is not proof that the key doesn't exist
+        self.assertIsInstance(self.fetched['AAAA'], KeyserverError)
+        self.assertNotIsInstance(self.fetched['AAAA'], KeyNotFoundError)
+
+        fetcher = KeyFetcher([missing.url], timeout=5, retries=0)
+        fetcher.fetch_all(['CCCC'], self._on_fetched)
+        self.assertIsInstance(self.fetched['CCCC'], KeyNotFoundError)
+
+        good = self._server()
+        fetcher = KeyFetcher([missing.url, good.url, get_dead_keyserver()], timeout=5,
+                             retries=0)
+        fetcher.fetch_all(['DDDD', 'EEEE', 'FFFF'], self._on_fetched)
+        self.assertEqual(len(good.requests), 3)
+        self.assertTrue(all(self.fetched[query].data == KEY_DATA
+                            for query in ('DDDD', 'EEEE', 'FFFF')))
+
+    def test_on_fetched_runs_off_the_event_loop(self):
+        server = self._server()
+        fetcher = KeyFetcher([server.url], timeout=5)
+        on_loop = []
+
+        def on_fetched(query, fetched, error):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(query)
+            except RuntimeError:
+                pass
+            self._on_fetched(query, fetched, error)
+
+        fetcher.fetch_all(['AAAA', 'BBBB'], on_fetched, rate=None)
+
+        self.assertEqual(sorted(self.fetched), ['AAAA', 'BBBB'])
+        self.assertEqual(on_loop, [])
+
+    def test_cancelled_queries_are_skipped(self):
+        server = self._server()
+        fetcher = KeyFetcher([server.url], timeout=5)
+
+        fetcher.fetch_all(['AAAA', 'BBBB'], self._on_fetched, is_cancelled=lambda: True)
+
+        self.assertEqual((self.fetched, server.requests), ({}, []))
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = DiskCache(os.path.join(self._tmp_dir.name, 'keyserver.sqlite'), ttl=60)
+        self.servers = []
+
+    def tearDown(self):
+        self.cache.close()
+        for server in self.servers:
+            server.close()
+        self._tmp_dir.cleanup()
+
+    def _server(self, *args, **kwargs):
+        server = FakeKeyserver(*args, **kwargs)
+        self.servers.append(server)
+        return server
+
+    def test_parse_index(self):
+        alice, mallory = parse_index(INDEX, 'keys.example.org')
+
+        self.assertEqual(alice.fingerprint, 'F41E87A974DCCE065FF8D12FE5CCDE2C950E9D5A')
+        self.assertEqual(alice.uids, ['Alice <alice@example.org>'])
+        self.assertEqual((alice.algorithm, alice.key_length, alice.expires), (22, 256, None))
+        self.assertFalse(alice.is_revoked)
+        self.assertIsNone(mallory.fingerprint)
+        self.assertTrue(mallory.is_revoked and mallory.is_expired)
+        self.assertEqual(mallory.uids, ['Mallory', 'Mallory <alice@example.org>'])
+        self.assertEqual(mallory.keyservers, ['keys.example.org'])
+        self.assertEqual(parse_index(b'<html>nope</html>'), [])
+
+    def test_merge(self):
+        first = [SearchResult('abcd', uids=['A'], keyservers=['one'])]
+        second = [SearchResult('ABCD', flags='r', uids=['A', 'B'], keyservers=['two']),
+                  SearchResult('EF01', keyservers=['two'])]
+
+        merged = merge_search_results([first, second])
+
+        self.assertEqual([result.key_id for result in merged], ['ABCD', 'EF01'])
+        self.assertEqual(merged[0].uids, ['A', 'B'])
+        self.assertEqual(merged[0].keyservers, ['one', 'two'])
+        self.assertTrue(merged[0].is_revoked)
+
+    def test_search_all_servers_with_cache(self):
+        listing = self._server(index=(200, INDEX))
+        empty = self._server(index=(404, b'No results found'))
+        fetcher = KeyFetcher([listing.url, empty.url, get_dead_keyserver()], timeout=5,
+                             retries=0, cache=self.cache)
+
+        results = fetcher.search('alice@example.org')
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0].keyservers, [listing.url])
+        self.assertEqual(listing.requests,
+                         ['/pks/lookup?op=index&options=mr&search=alice%40example.org'])
+
+        # Answers, including "nothing found", come from the cache now
+        self.assertEqual([result.to_dict() for result in fetcher.search('alice@example.org')],
+                         [result.to_dict() for result in results])
+        self.assertEqual((len(listing.requests), len(empty.requests)), (1, 1))
+        self.assertIsNotNone(self.cache.get(KeyFetcher.get_cache_key(listing.url,
+                                                                     'alice@example.org')))
+
+        fetcher.search('bob@example.org')
+        self.assertEqual(len(listing.requests), 2)
+
+    def test_search_fails_when_no_server_answers(self):
+        fetcher = KeyFetcher([get_dead_keyserver()], timeout=1, retries=0, cache=self.cache)
+
+        with self.assertRaises(KeyserverError):
+            fetcher.search('ABCD1234')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from ez_gpg import manifest
+from ez_gpg.manifest import check_manifest, format_manifest, hash_file, hash_files, \
+    is_manifest, parse_manifest, write_manifest
+
+
+class TestManifestFormat(unittest.TestCase):
+    def test_format_matches_sha256sum(self):
+        self.assertEqual(format_manifest([('a.txt', 'ab' * 32)]), f"{'ab' * 32}  a.txt\n")
+
+    def test_format_is_canonical(self):
+        entries = [('b', 'bb' * 32), ('a/z', 'aa' * 32), ('B', 'cc' * 32)]
+
+        self.assertEqual(format_manifest(entries), format_manifest(list(reversed(entries))))
+        self.assertEqual([name for name, _ in parse_manifest(format_manifest(entries))],
+                         ['B', 'a/z', 'b'])
+
+    def test_odd_names_round_trip(self):
+        entries = [('new\nline', 'aa' * 32), ('back\\slash', 'bb' * 32)]
+
+        text = format_manifest(entries)
+
+        self.assertTrue(text.startswith('\\'))
+        self.assertEqual(sorted(parse_manifest(text)), sorted(entries))
+
+    def test_parse_binary_marker(self):
+        self.assertEqual(parse_manifest(f"{'AB' * 32} *a.bin\n\n"), [('a.bin', 'ab' * 32)])
+
+    def test_parse_rejects_garbage(self):
+        for text in ('not a manifest', f"{'zz' * 32}  a", f"{'ab' * 31}  a"):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                parse_manifest(text)
+
+    def test_is_manifest(self):
+        self.assertTrue(is_manifest('/dist/SHA256SUMS'))
+        self.assertTrue(is_manifest('release.sha256'))
+        self.assertFalse(is_manifest('release.tar.gz'))
+
+
+class TestManifestFiles(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.base_dir = self._tmp_dir.name
+        self.manifest_filename = os.path.join(self.base_dir, 'SHA256SUMS')
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _write(self, name, data):
+        filename = os.path.join(self.base_dir, name)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, 'wb') as output_file:
+            output_file.write(data)
+        return filename
+
+    def test_hash_file_uses_small_buffers(self):
+        data = os.urandom(10000)
+        filename = self._write('data.bin', data)
+
+        self.assertEqual(hash_file(filename, buffer_size=4096), hashlib.sha256(data).hexdigest())
+
+    def test_hash_files_process_pool(self):
+        filenames = [self._write(f"{index}.txt", str(index).encode()) for index in range(6)]
+
+        with patch.object(manifest, 'PROCESS_POOL_THRESHOLD', 2):
+            results = hash_files(filenames + [os.path.join(self.base_dir, 'missing')], 2)
+
+        self.assertEqual([digest for digest, _ in results[:-1]],
+                         [hashlib.sha256(str(index).encode()).hexdigest() for index in range(6)])
+        self.assertIsNone(results[-1][0])
+        self.assertIsInstance(results[-1][1], FileNotFoundError)
+
+    def test_write_manifest_uses_relative_names(self):
+        filenames = [self._write(os.path.join('sub', 'b.txt'), b'b'), self._write('a.txt', b'a')]
+        missing = os.path.join(self.base_dir, 'missing')
+
+        entries, failures = write_manifest(filenames + [missing], self.manifest_filename,
+                                           max_workers=2)
+
+        self.assertEqual(entries, [('a.txt', hashlib.sha256(b'a').hexdigest()),
+                                   ('sub/b.txt', hashlib.sha256(b'b').hexdigest())])
+        self.assertEqual([filename for filename, _ in failures], [missing])
+        with open(self.manifest_filename) as manifest_file:
+            self.assertEqual(manifest_file.read(), format_manifest(entries))
+
+    def test_check_manifest(self):
+        filenames = [self._write('a.txt', b'a'), self._write('b.txt', b'b'),
+                     self._write(os.path.join('sub', 'c.txt'), b'c')]
+        write_manifest(filenames, self.manifest_filename)
+
+        self._write('b.txt', b'changed')
+        os.remove(filenames[2])
+
+        self.assertEqual(check_manifest(self.manifest_filename, max_workers=2),
+                         [('a.txt', filenames[0], manifest.STATUS_OK),
+                          ('b.txt', filenames[1], manifest.STATUS_MISMATCH),
+                          ('sub/c.txt', filenames[2], manifest.STATUS_MISSING)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import base64
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from ez_gpg.packets import PacketError, PrefixedReader, read_packet_header, \
+    read_session_key_info
+
+KEY_ID = bytes.fromhex('0123456789ABCDEF')
+
+
+def new_packet(tag, body):
+    return bytes([0xc0 | tag, len(body)]) + body
+
+
+def old_packet(tag, body, length_type=0):
+    if length_type == 3:
+        return bytes([0x80 | (tag << 2) | 3]) + body
+
+    return bytes([0x80 | (tag << 2) | length_type]) + len(body).to_bytes(1 << length_type, 'big') + body
+
+
+def pkesk(key_id=KEY_ID):
+    return bytes([3]) + key_id + bytes([1]) + b'\x00' * 10
+
+
+def armor(data):
+    encoded = base64.b64encode(data)
+    lines = [encoded[i:i + 64] for i in range(0, len(encoded), 64)]
+    return (b'-----BEGIN PGP MESSAGE-----\nVersion: test\n\n' + b'\n'.join(lines) +
+            b'\n=abcd\n-----END PGP MESSAGE-----\n')
+
+
+class Unreadable(io.BytesIO):
+    """Fails the test if the encrypted payload gets read."""
+
+    def __init__(self, data, limit):
+        super().__init__(data)
+        self._limit = limit
+
+    def read(self, size=-1):
+        if size < 0 or self.tell() + size > self._limit:
+            raise AssertionError("Read past the session key packets")
+
+        return super().read(size)
+
+
+class TestPacketHeaders(unittest.TestCase):
+    def test_new_format_lengths(self):
+        self.assertEqual(read_packet_header(io.BytesIO(b'\xd2\x05')), (18, 5, False))
+        self.assertEqual(read_packet_header(io.BytesIO(b'\xd2\xc5\x10')), (18, 1488, False))
+        self.assertEqual(read_packet_header(io.BytesIO(b'\xd2\xff\x00\x01\x00\x00')),
+                         (18, 65536, False))
+        self.assertEqual(read_packet_header(io.BytesIO(b'\xd2\xed')), (18, 8192, True))
+
+    def test_old_format_lengths(self):
+        self.assertEqual(read_packet_header(io.BytesIO(b'\x84\x0c')), (1, 12, False))
+        self.assertEqual(read_packet_header(io.BytesIO(b'\x85\x01\x0c')), (1, 268, False))
+        self.assertEqual(read_packet_header(io.BytesIO(b'\xa7')), (9, None, False))
+
+    def test_invalid_header(self):
+        with self.assertRaises(PacketError):
+            read_packet_header(io.BytesIO(b'\x01'))
+
+
+class TestPrefixedReader(unittest.TestCase):
+    def test_prefix_comes_first(self):
+        reader = PrefixedReader(b'abc', io.BytesIO(b'defgh'))
+
+        self.assertEqual(reader.read(2), b'ab')
+        self.assertEqual(reader.read(3), b'cde')
+        self.assertEqual(reader.read(), b'fgh')
+        self.assertEqual(reader.read(), b'')
+
+
+class TestSessionKeyInfo(unittest.TestCase):
+    def test_public_key_recipients(self):
+        other_id = bytes.fromhex('FEDCBA9876543210')
+        data = (old_packet(1, pkesk()) + new_packet(1, pkesk(other_id)) +
+                new_packet(1, pkesk()) + new_packet(18, b'\x01payload'))
+
+        key_ids, is_symmetric = read_session_key_info(io.BytesIO(data))
+
+        self.assertEqual(key_ids, ['0123456789ABCDEF', 'FEDCBA9876543210'])
+        self.assertFalse(is_symmetric)
+
+    def test_symmetric(self):
+        data = new_packet(3, b'\x04\x09\x03\x08' + b'\x00' * 9) + new_packet(18, b'\x01')
+
+        self.assertEqual(read_session_key_info(io.BytesIO(data)), ([], True))
+
+    def test_v6_fingerprint_recipient(self):
+        fingerprint = bytes(range(32))
+        body = bytes([6, 33, 6]) + fingerprint + bytes([25]) + b'\x00' * 10
+
+        key_ids, _ = read_session_key_info(io.BytesIO(new_packet(1, body) + new_packet(18, b'')))
+
+        self.assertEqual(key_ids, [fingerprint.hex().upper()])
+
+    def test_stops_before_payload(self):
+        header = new_packet(1, pkesk())
+        payload = b'\xd2\xff\x7f\xff\xff\xff' + b'\x00' * 1024
+
+        stream = Unreadable(header + payload, len(header) + 6)
+
+        self.assertEqual(read_session_key_info(stream), (['0123456789ABCDEF'], False))
+
+    def test_indeterminate_length_payload(self):
+        data = old_packet(1, pkesk()) + old_packet(9, b'\x00' * 32, length_type=3)
+
+        self.assertEqual(read_session_key_info(io.BytesIO(data)), (['0123456789ABCDEF'], False))
+
+    def test_partial_length_session_key_packet(self):
+        body = pkesk()
+        # 16-byte partial chunk followed by the remaining 3 bytes
+        data = bytes([0xc1, 0xe4]) + body[:16] + bytes([len(body) - 16]) + body[16:]
+
+        key_ids, _ = read_session_key_info(io.BytesIO(data + new_packet(18, b'')))
+
+        self.assertEqual(key_ids, ['0123456789ABCDEF'])
+
+    def test_armored(self):
+        data = new_packet(1, pkesk()) + new_packet(3, b'\x04\x09\x03\x08') + new_packet(18, b'\x01' * 200)
+
+        key_ids, is_symmetric = read_session_key_info(io.BytesIO(b'\n' + armor(data)))
+
+        self.assertEqual(key_ids, ['0123456789ABCDEF'])
+        self.assertTrue(is_symmetric)
+
+    def test_not_encrypted(self):
+        for data in (b'', b'plain text\n', new_packet(2, b'\x04signature'),
+                     new_packet(1, pkesk()), b'-----BEGIN PGP SIGNATURE-----\n\nabcd\n'):
+            with self.subTest(data=data), self.assertRaises(PacketError):
+                read_session_key_info(io.BytesIO(data))
+
+    def test_truncated(self):
+        with self.assertRaises(PacketError):
+            read_session_key_info(io.BytesIO(new_packet(1, pkesk())[:6]))
+
+
+@unittest.skipUnless(shutil.which('gpg'), "gpg not installed")
+class TestGpgOutput(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self._home = os.path.join(self._tmp_dir.name, 'home')
+        os.mkdir(self._home, 0o700)
+
+    def tearDown(self):
+        subprocess.run(['gpgconf', '--homedir', self._home, '--kill', 'gpg-agent'], check=False)
+        self._tmp_dir.cleanup()
+
+    def _encrypt(self, *args):
+        return subprocess.run(['gpg', '--homedir', self._home, '--batch', '--pinentry-mode',
+                               'loopback', '--passphrase', 'secret', '--symmetric'] + list(args),
+                              input=os.urandom(4096), stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout
+
+    def test_symmetric_binary_and_armored(self):
+        for args in ([], ['--armor']):
+            with self.subTest(args=args):
+                data = self._encrypt(*args)
+
+                self.assertEqual(read_session_key_info(io.BytesIO(data)), ([], True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from ez_gpg.executor import JobExecutor
+from ez_gpg.passphrase import PassphraseCache, PassphraseValidator
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestPassphraseCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = PassphraseCache(ttl=60, clock=self.clock)
+
+    def test_add_and_contains(self):
+        self.cache.add('FPR1', 'secret')
+
+        self.assertTrue(self.cache.contains('FPR1', 'secret'))
+        self.assertFalse(self.cache.contains('FPR1', 'other'))
+        self.assertFalse(self.cache.contains('FPR2', 'secret'))
+
+    def test_entries_expire(self):
+        self.cache.add('FPR1', 'secret')
+        self.clock.now += 61
+
+        self.assertFalse(self.cache.contains('FPR1', 'secret'))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_passphrase_is_not_stored(self):
+        self.cache.add('FPR1', 'secret')
+
+        self.assertNotIn('secret', repr(self.cache._entries))
+
+    def test_salt_differs_per_cache(self):
+        other = PassphraseCache()
+
+        self.assertNotEqual(self.cache._get_digest('FPR1', 'secret'),
+                            other._get_digest('FPR1', 'secret'))
+
+    def test_invalidate(self):
+        self.cache.add('FPR1', 'secret')
+        self.cache.add('FPR2', 'secret')
+
+        self.cache.invalidate('FPR1')
+        self.assertFalse(self.cache.contains('FPR1', 'secret'))
+        self.assertTrue(self.cache.contains('FPR2', 'secret'))
+
+        self.cache.invalidate()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_aliases(self):
+        self.cache.add('FPR1', 'secret', aliases=['KEYID1', 'FPR1'])
+
+        self.assertTrue(self.cache.contains('KEYID1', 'secret'))
+        self.assertFalse(self.cache.contains('KEYID1', 'other'))
+        self.assertEqual(len(self.cache), 2)
+
+        self.cache.invalidate('FPR1')
+        self.assertFalse(self.cache.contains('KEYID1', 'secret'))
+
+
+class TestPassphraseValidator(unittest.TestCase):
+    def setUp(self):
+        self.executor = JobExecutor(max_workers=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def _wait_for(self, event):
+        self.assertTrue(event.wait(2))
+
+    def test_debounces_to_latest_request(self):
+        check = MagicMock(side_effect=lambda key_id, passphrase: passphrase == 'secret')
+        validator = PassphraseValidator(self.executor, check, delay=0.05)
+        results = []
+        done = threading.Event()
+
+        def on_result(valid):
+            results.append(valid)
+            done.set()
+
+        for length in range(1, len('secret') + 1):
+            validator.request('KEY', 'secret'[:length], on_result)
+
+        self._wait_for(done)
+
+        check.assert_called_once_with('KEY', 'secret')
+        self.assertEqual(results, [True])
+
+    def test_stale_result_is_dropped(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def check(key_id, passphrase):
+            if passphrase == 'slow':
+                started.set()
+                release.wait(2)
+            return passphrase == 'fast'
+
+        validator = PassphraseValidator(self.executor, check, delay=0)
+        results = []
+        done = threading.Event()
+
+        def on_result(valid):
+            results.append(valid)
+            done.set()
+
+        validator.request('KEY', 'slow', on_result)
+        self._wait_for(started)
+        validator.request('KEY', 'fast', on_result)
+        self._wait_for(done)
+        release.set()
+        time.sleep(0.05)
+
+        self.assertEqual(results, [True])
+
+    def test_cached_result_is_immediate(self):
+        check = MagicMock()
+        validator = PassphraseValidator(self.executor, check, is_cached=lambda *args: True)
+        on_result = MagicMock()
+
+        validator.request('KEY', 'secret', on_result)
+
+        on_result.assert_called_once_with(True)
+        check.assert_not_called()
+
+    def test_errors_report_invalid(self):
+        validator = PassphraseValidator(self.executor, MagicMock(side_effect=RuntimeError("boom")),
+                                        delay=0)
+        results = []
+        done = threading.Event()
+
+        validator.request('KEY', 'secret', lambda valid: (results.append(valid), done.set()))
+        self._wait_for(done)
+
+        self.assertEqual(results, [False])
+
+    def test_cancel(self):
+        check = MagicMock(return_value=True)
+        validator = PassphraseValidator(self.executor, check, delay=0.05)
+        on_result = MagicMock()
+
+        validator.request('KEY', 'secret', on_result)
+        validator.cancel()
+        time.sleep(0.1)
+
+        check.assert_not_called()
+        on_result.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
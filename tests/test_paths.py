@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+
+from ez_gpg.paths import expand_paths
+
+
+class TestExpandPaths(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self._tmp_dir.name
+
+        self.files = [os.path.join(self.root, 'a.txt'),
+                      os.path.join(self.root, 'b.log'),
+                      os.path.join(self.root, 'sub', 'c.txt')]
+        os.makedirs(os.path.join(self.root, 'sub'))
+        for filename in self.files:
+            open(filename, 'w').close()
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_globbing(self):
+        self.assertEqual(expand_paths([os.path.join(self.root, '*.txt')]),
+                         [self.files[0]])
+        self.assertEqual(expand_paths([os.path.join(self.root, '**', '*.txt')]),
+                         [self.files[0], self.files[2]])
+
+    def test_directories_need_recursive(self):
+        self.assertEqual(expand_paths([self.root]), [self.root])
+        self.assertEqual(expand_paths([self.root], recursive=True), self.files)
+
+    def test_duplicates_and_missing_files(self):
+        missing = os.path.join(self.root, 'missing')
+
+        self.assertEqual(expand_paths([self.files[0], self.files[0], missing]),
+                         [self.files[0], missing])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import json
+import os
+import tempfile
+import unittest
+
+from ez_gpg.results import EncryptedFileInfo, FileResult, ImportReport, KeyImportResult, \
+    KeyRefreshResult, RefreshReport, VerifyReport, VerifyResult
+
+
+class TestFileResult(unittest.TestCase):
+    def test_truthiness_follows_success(self):
+        self.assertTrue(FileResult('a', 'a.gpg', True))
+        self.assertFalse(FileResult('a', error='boom'))
+
+    def test_to_dict(self):
+        self.assertEqual(FileResult('a', 'a.gpg', True, 'ok').to_dict(),
+                         {'file': 'a', 'output': 'a.gpg', 'success': True,
+                          'status': 'ok', 'error': None})
+
+
+class TestVerifyResult(unittest.TestCase):
+    def test_trust(self):
+        self.assertTrue(VerifyResult('a', valid=True, trust_level=3).is_trusted())
+        self.assertFalse(VerifyResult('a', valid=True, trust_level=2).is_trusted())
+        self.assertFalse(VerifyResult('a', valid=True).is_trusted())
+        self.assertFalse(VerifyResult('a', valid=False, trust_level=5).is_trusted())
+
+    def test_to_dict_includes_signature_details(self):
+        record = VerifyResult('a', 'a.sig', True, fingerprint='FPR').to_dict()
+
+        self.assertEqual(record['signature'], 'a.sig')
+        self.assertEqual(record['fingerprint'], 'FPR')
+        self.assertTrue(record['valid'])
+
+
+class TestVerifyReport(unittest.TestCase):
+    def setUp(self):
+        self.report = VerifyReport([VerifyResult('a', 'a.sig', True, fingerprint='FPR'),
+                                    VerifyResult('b', 'b.asc', error='boom')])
+
+    def test_counts(self):
+        self.assertFalse(self.report)
+        self.assertEqual(len(self.report), 2)
+        self.assertEqual([result.filename for result in self.report.invalid], ['b'])
+        self.assertTrue(VerifyReport(self.report.valid))
+        self.assertFalse(VerifyReport([]))
+
+    def test_json_export(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'report.json')
+            self.report.save(filename)
+
+            with open(filename) as report_file:
+                exported = json.load(report_file)
+
+        self.assertEqual(exported['total'], 2)
+        self.assertEqual(exported['valid'], 1)
+        self.assertEqual(exported['results'][0]['fingerprint'], 'FPR')
+        self.assertEqual(exported['results'][1]['error'], 'boom')
+
+
+class TestEncryptedFileInfo(unittest.TestCase):
+    def test_defaults(self):
+        info = EncryptedFileInfo('a.gpg')
+
+        self.assertFalse(info.is_symmetric)
+        self.assertEqual(info.key_ids, [])
+        self.assertIsNone(info.matching_key)
+        self.assertEqual(info.to_dict()['file'], 'a.gpg')
+
+
+class TestImportReport(unittest.TestCase):
+    STATUS = [('IMPORT_OK', '1 AAAA'),
+              ('IMPORT_OK', '0 BBBB'),
+              ('IMPORT_OK', '12 CCCC'),
+              ('IMPORT_OK', '17 AAAA'),
+              ('IMPORT_PROBLEM', '1 DDDD'),
+              ('IMPORT_PROBLEM', '0'),
+              ('IMPORT_RES', '5 0 1 0 1 0 1 2 0 1 1 0 0 2 0')]
+
+    def test_from_status(self):
+        report = ImportReport()
+        report.add_status(self.STATUS)
+
+        self.assertFalse(report)
+        self.assertEqual(len(report), 5)
+        self.assertEqual([key.fingerprint for key in report.new], ['AAAA'])
+        self.assertTrue(report.new[0].is_secret)
+        self.assertEqual([key.fingerprint for key in report.unchanged], ['BBBB'])
+        self.assertEqual(report.updated[0].changes, ['signatures', 'subkeys'])
+        self.assertEqual([key.reason for key in report.rejected],
+                         ['invalid certificate', 'no specific reason'])
+        self.assertEqual(report.fingerprints, ['AAAA', 'BBBB', 'CCCC'])
+        self.assertEqual(report.counts['not_imported'], 2)
+
+    def test_to_dict(self):
+        report = ImportReport([KeyImportResult('AAAA', KeyImportResult.FLAG_UIDS)],
+                              file_errors=[FileResult('missing.asc', error='boom')])
+        record = report.to_dict()
+
+        self.assertFalse(report)
+        self.assertEqual(record['updated'], 1)
+        self.assertEqual(record['keys'][0], {'fingerprint': 'AAAA', 'status': 'updated',
+                                             'changes': ['uids'], 'secret': False,
+                                             'reason': None})
+        self.assertEqual(record['file_errors'][0]['file'], 'missing.asc')
+        self.assertTrue(ImportReport([KeyImportResult('AAAA')]))
+        self.assertFalse(ImportReport())
+
+
+
+class TestRefreshReport(unittest.TestCase):
+    def test_statuses(self):
+        extended = KeyRefreshResult('AAAA', 'Alice', {'expires': [1000, 2000]})
+        revoked = KeyRefreshResult('BBBB', changes={'revoked': True, 'expires': [1000, 500]})
+        report = RefreshReport([extended, revoked,
+                                KeyRefreshResult('CCCC'),
+                                KeyRefreshResult('DDDD', found=False),
+                                KeyRefreshResult('EEEE', error='timed out')])
+
+        self.assertFalse(report)
+        self.assertEqual([result.fingerprint for result in report.changed], ['AAAA', 'BBBB'])
+        self.assertEqual([result.status for result in report][2:],
+                         ['unchanged', 'not found', 'failed'])
+        self.assertTrue(extended.is_expiry_extended and not extended.is_revoked)
+        self.assertTrue(revoked.is_revoked and not revoked.is_expiry_extended)
+        self.assertTrue(KeyRefreshResult('FFFF', changes={'expires': [1000, None]})
+                        .is_expiry_extended)
+
+        record = json.loads(report.to_json())
+        self.assertEqual((record['total'], record['changed'], record['not_found'],
+                          record['failed']), (5, 2, 1, 1))
+        self.assertEqual(record['results'][0], {'fingerprint': 'AAAA', 'name': 'Alice',
+                                                'status': 'changed',
+                                                'changes': {'expires': [1000, 2000]},
+                                                'error': None})
+        self.assertTrue(RefreshReport([KeyRefreshResult('DDDD', found=False)]))
+
+if __name__ == '__main__':
+    unittest.main()
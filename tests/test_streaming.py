@@ -0,0 +1,201 @@
+import io
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from unittest.mock import MagicMock
+
+from ez_gpg.instrumentation import Instrumentation
+from ez_gpg.streaming import BatchProgress, ConcatReader, GpgStream, Progress, format_duration, \
+    format_size
+
+# Stand-in for gpg: echoes the passphrase as a status line and upper-cases stdin
+FAKE_GPG = textwrap.dedent(f"""\
+    #!{sys.executable}
+    import os, sys
+    args = sys.argv[1:]
+    if '--passphrase-fd' in args:
+        fd = int(args[args.index('--passphrase-fd') + 1])
+        passphrase = os.read(fd, 1024).decode().strip()
+        sys.stderr.write(f"[GNUPG:] PASSPHRASE {{passphrase}}\\n")
+    sys.stderr.write("gpg: some message\\n")
+    if '--fail' in args:
+        sys.exit(2)
+    while True:
+        chunk = sys.stdin.buffer.read(4096)
+        if not chunk:
+            break
+        sys.stdout.buffer.write(chunk.upper())
+    sys.stderr.write("[GNUPG:] END_ENCRYPTION\\n")
+""")
+
+
+class TestProgress(unittest.TestCase):
+    def test_throughput_and_eta(self):
+        progress = Progress(50, 60, 2.0, total_size=150)
+
+        self.assertEqual(progress.throughput, 25.0)
+        self.assertAlmostEqual(progress.fraction, 1 / 3)
+        self.assertEqual(progress.eta, 4.0)
+        self.assertEqual(str(progress), "50.0 B / 150.0 B (33%) at 25.0 B/s, ETA 4s")
+
+    def test_unknown_total(self):
+        progress = Progress(1024, 0, 0.0)
+
+        self.assertEqual(progress.throughput, 0.0)
+        self.assertIsNone(progress.fraction)
+        self.assertIsNone(progress.eta)
+        self.assertEqual(progress.to_dict()['bytes_in'], 1024)
+
+    def test_formatting(self):
+        self.assertEqual(format_size(3 * 1024 * 1024), "3.0 MiB")
+        self.assertEqual(format_duration(59), "59s")
+        self.assertEqual(format_duration(125), "2m05s")
+        self.assertEqual(format_duration(7260), "2h01m")
+
+
+class TestBatchProgress(unittest.TestCase):
+    def test_items_are_summed(self):
+        snapshots = []
+        batch = BatchProgress(snapshots.append, total_size=300)
+
+        batch.item('a')(Progress(50, 70, 1.0))
+        batch.item_done('b', 100)
+        batch.item('a')(Progress(100, 120, 2.0))
+        batch.done()
+
+        # Updates within PROGRESS_INTERVAL of the first one are coalesced
+        self.assertEqual(len(snapshots), 2)
+        self.assertEqual((snapshots[0].bytes_in, snapshots[0].total_size), (50, 300))
+        self.assertEqual((snapshots[-1].bytes_in, snapshots[-1].bytes_out), (200, 120))
+        self.assertTrue(snapshots[-1].done)
+
+
+class TestConcatReader(unittest.TestCase):
+    def test_reads_files_in_order(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filenames = []
+            for name, data in (('a', b'first'), ('b', b''), ('c', b'third' * 1000)):
+                filenames.append(os.path.join(tmp_dir, name))
+                with open(filenames[-1], 'wb') as data_file:
+                    data_file.write(data)
+            missing = os.path.join(tmp_dir, 'missing')
+
+            with ConcatReader(filenames[:2] + [missing, filenames[2]], b'\n') as reader:
+                data = b''
+                while True:
+                    chunk = reader.read(1024)
+                    if not chunk:
+                        break
+                    self.assertLessEqual(len(chunk), 1024)
+                    data += chunk
+
+        self.assertEqual(data, b'first\n\n' + b'third' * 1000 + b'\n')
+        self.assertEqual([filename for filename, _ in reader.errors], [missing])
+
+
+class TestGpgStream(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.fake_gpg = os.path.join(self._tmp_dir.name, 'gpg')
+        with open(self.fake_gpg, 'w') as script:
+            script.write(FAKE_GPG)
+        os.chmod(self.fake_gpg, stat.S_IRWXU)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_pumps_data_in_chunks(self):
+        data = b'abc' * 100000
+        dst = io.BytesIO()
+        progress = []
+
+        stream = GpgStream(self.fake_gpg, ['--encrypt'], chunk_size=1024,
+                           on_progress=progress.append, total_size=len(data))
+        result = stream.run(io.BytesIO(data), dst)
+
+        self.assertTrue(result)
+        self.assertEqual(dst.getvalue(), data.upper())
+        self.assertEqual(result.bytes_in, len(data))
+        self.assertEqual(result.bytes_out, len(data))
+        self.assertTrue(result.has_status('END_ENCRYPTION'))
+        self.assertEqual(result.stderr, ['gpg: some message'])
+        self.assertTrue(progress[-1].done)
+        self.assertEqual(progress[-1].bytes_in, len(data))
+
+    def test_runs_are_recorded(self):
+        instrumentation = Instrumentation()
+        calls = instrumentation.add_sink(MagicMock())
+
+        GpgStream(self.fake_gpg, ['--encrypt'], instrumentation=instrumentation).run(
+            io.BytesIO(b'abc' * 1000), io.BytesIO())
+
+        call = calls.call_args[0][0]
+        self.assertEqual(call.operation, 'encrypt')
+        self.assertEqual((call.bytes_in, call.bytes_out, call.returncode), (3000, 3000, 0))
+        self.assertEqual(call.status, [('END_ENCRYPTION', '')])
+        self.assertIsNotNone(call.pid)
+        self.assertEqual(instrumentation.metrics.snapshot()['counters']['gpg.calls.encrypt'], 1)
+
+    def test_passphrase_is_sent_on_separate_fd(self):
+        result = GpgStream(self.fake_gpg, [], passphrase='s3cret').run(io.BytesIO(b'x'),
+                                                                       io.BytesIO())
+
+        self.assertEqual(result.get_status('PASSPHRASE'), ['s3cret'])
+
+    def test_failure_exit_code(self):
+        result = GpgStream(self.fake_gpg, ['--fail']).run(io.BytesIO(b'x' * 1000000),
+                                                          io.BytesIO())
+
+        self.assertFalse(result)
+        self.assertEqual(result.returncode, 2)
+
+    def test_cancellation(self):
+        result = GpgStream(self.fake_gpg, [], is_cancelled=lambda: True).run(io.BytesIO(b'x'),
+                                                                             io.BytesIO())
+
+        self.assertFalse(result)
+        self.assertTrue(result.cancelled)
+
+
+@unittest.skipUnless(shutil.which('gpg'), "gpg not installed")
+class TestGpgStreamRoundTrip(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        os.chmod(self._tmp_dir.name, stat.S_IRWXU)
+
+        self._old_home = os.environ.get('GNUPGHOME')
+        os.environ['GNUPGHOME'] = self._tmp_dir.name
+
+    def tearDown(self):
+        subprocess.run(['gpgconf', '--kill', 'gpg-agent'], check=False)
+
+        if self._old_home is None:
+            del os.environ['GNUPGHOME']
+        else:
+            os.environ['GNUPGHOME'] = self._old_home
+
+        self._tmp_dir.cleanup()
+
+    def test_symmetric_round_trip(self):
+        data = os.urandom(256 * 1024)
+        encrypted = io.BytesIO()
+        decrypted = io.BytesIO()
+
+        gpg = shutil.which('gpg')
+        result = GpgStream(gpg, ['--symmetric'], passphrase='pass').run(io.BytesIO(data),
+                                                                        encrypted)
+        self.assertTrue(result, result.stderr)
+
+        result = GpgStream(gpg, ['--decrypt'], passphrase='pass').run(
+            io.BytesIO(encrypted.getvalue()), decrypted)
+        self.assertTrue(result, result.stderr)
+        self.assertEqual(decrypted.getvalue(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()